@@ -0,0 +1,55 @@
+from numpy import ndarray
+import numpy as np
+import os.path
+
+
+"""
+Shared helpers for the benchmarks. The data is the
+same as used by the tests, with the option to make
+synthetic larger versions of it (more x values).
+"""
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'test', 'data')
+SCALES = [1, 4]
+
+
+def load_qens(name: str = 'sample_data_red.npy') -> tuple:
+    """
+    Loads the bundled quasielastic data
+    :param name: the name of the file in test/data
+    :return the x, y, e data
+    """
+    x, y, e = np.load(os.path.join(DATA_DIR, name), allow_pickle=True)
+    return (np.asarray(x, dtype=float), np.asarray(y, dtype=float),
+            np.asarray(e, dtype=float))
+
+
+def load_muon(name: str = 'muon_expdecay_2.npy') -> tuple:
+    """
+    Loads the bundled muon data
+    :param name: the name of the file in test/data/muon
+    :return the x, y, e data
+    """
+    x, y, e = np.loadtxt(os.path.join(DATA_DIR, 'muon', name))
+    return x, y, e
+
+
+def scale_data(x: ndarray, y: ndarray, e: ndarray = None,
+               scale: int = 1) -> tuple:
+    """
+    Makes a synthetic version of the data with scale times
+    as many points over the same x range, by interpolation.
+    :param x: the x data
+    :param y: the y data
+    :param e: the e data (optional)
+    :param scale: the factor to increase the number of points by
+    :return the new x, y (and e) data
+    """
+    if scale == 1:
+        return (x, y) if e is None else (x, y, e)
+    new_x = np.linspace(x[0], x[-1], scale*len(x))
+    new_y = np.interp(new_x, x, y)
+    if e is None:
+        return new_x, new_y
+    return new_x, new_y, np.interp(new_x, x, e)
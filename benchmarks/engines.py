@@ -0,0 +1,37 @@
+from benchmarks.common import load_muon, scale_data, SCALES
+from quickBayes.functions.BG import FlatBG
+from quickBayes.functions.composite import CompositeFunction
+from quickBayes.functions.exp_decay import ExpDecay
+from quickBayes.fitting.scipy_engine import ScipyFitEngine
+from quickBayes.fitting.gofit_engine import GoFitEngine
+
+
+"""
+Timings of a single fit (do_fit) for the fit engines
+"""
+
+
+class TimeDoFit(object):
+    """
+    The time to fit two exponential decays to the muon data
+    """
+    params = (['curve_fit', 'least_squares', 'gofit'], SCALES)
+    param_names = ['engine', 'scale']
+
+    def setup(self, engine, scale):
+        x, y, e = load_muon()
+        self.x, self.y, self.e = scale_data(x, y, e, scale)
+        self.func = CompositeFunction()
+        self.func.add_function(FlatBG())
+        self.func.add_function(ExpDecay())
+        self.func.add_function(ExpDecay())
+        lower, upper = self.func.get_bounds()
+        if engine == 'gofit':
+            self.engine = GoFitEngine(self.x, self.y, self.e, lower, upper)
+        else:
+            self.engine = ScipyFitEngine(self.x, self.y, self.e, lower,
+                                         upper, self.func.get_guess(),
+                                         method=engine)
+
+    def time_do_fit(self, engine, scale):
+        self.engine.do_fit(self.x, self.y, self.e, self.func)
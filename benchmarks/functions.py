@@ -0,0 +1,102 @@
+from benchmarks.common import load_qens
+from quickBayes.functions.BG import NoBG, FlatBG, LinearBG
+from quickBayes.functions.delta import Delta
+from quickBayes.functions.exp_decay import ExpDecay
+from quickBayes.functions.gaussian import Gaussian
+from quickBayes.functions.lorentz import Lorentzian
+from quickBayes.functions.SE import StretchExp, StretchExpTable, SE_CACHE
+from quickBayes.functions.SE_fix import StretchExpWithFixes
+from quickBayes.functions.composite import CompositeFunction
+from quickBayes.functions.convolution import ConvolutionWithResolution
+from quickBayes.functions.qldata_function import QlDataFunction
+from quickBayes.functions.qse_function import QSEFunction
+from quickBayes.functions.qse_fixed import QSEFixFunction
+import numpy as np
+
+
+"""
+Per call timings of the fitting functions
+"""
+
+
+def make_function(name: str, x: np.ndarray):
+    """
+    Creates a fitting function, for the ones that
+    need a resolution the sample data is used.
+    :param name: the name of the function
+    :param x: the x values
+    :return the function
+    """
+    if name in SIMPLE.keys():
+        return SIMPLE[name]()
+
+    rx, ry, _ = load_qens('resolution_data_red.npy')
+    ry = np.interp(x, rx, ry)
+    start, end = x[0], x[-1]
+    if name == 'Composite':
+        func = CompositeFunction()
+        func.add_function(LinearBG())
+        func.add_function(Lorentzian())
+        func.add_function(Gaussian())
+    elif name == 'Convolution':
+        func = ConvolutionWithResolution(x, ry, start, end)
+        func.add_function(Lorentzian())
+        func.add_function(Lorentzian())
+    elif name == 'QlData':
+        func = QlDataFunction(LinearBG(), True, x, ry, start, end)
+        func.add_single_lorentzian()
+        func.add_single_lorentzian()
+    elif name == 'QSE':
+        func = QSEFunction(LinearBG(), True, x, ry, start, end)
+        func.add_single_SE()
+    elif name == 'QSEFix':
+        func = QSEFixFunction(LinearBG(), True, x, ry, start, end)
+        func.add_single_SE()
+    return func
+
+
+SIMPLE = {'NoBG': NoBG, 'FlatBG': FlatBG, 'LinearBG': LinearBG,
+          'Delta': Delta, 'ExpDecay': ExpDecay, 'Gaussian': Gaussian,
+          'Lorentzian': Lorentzian, 'StretchExp': StretchExp,
+          'StretchExpWithFixes': StretchExpWithFixes}
+NAMES = list(SIMPLE.keys()) + ['Composite', 'Convolution', 'QlData',
+                               'QSE', 'QSEFix']
+
+
+class TimeFunctions(object):
+    """
+    The time to evaluate each function at its guess
+    """
+    params = (NAMES, [100, 1000, 10000])
+    param_names = ['function', 'N']
+
+    def setup(self, name, N):
+        self.x = np.linspace(-0.4, 0.4, N)
+        self.func = make_function(name, self.x)
+        self.guess = self.func.get_guess()
+
+    def time_call(self, name, N):
+        self.func(self.x, *self.guess)
+
+
+class TimeStretchExp(object):
+    """
+    The time to evaluate the stretched exponential, using the
+    FFT (with and without the cache) or the precomputed table
+    """
+    params = (['fft', 'cached', 'table'], [100, 1000, 10000])
+    param_names = ['method', 'N']
+
+    def setup(self, method, N):
+        self.x = np.linspace(-0.4, 0.4, N)
+        table = StretchExpTable() if method == 'table' else None
+        self.func = StretchExp(table=table)
+        self.guess = self.func.get_guess()
+        self.method = method
+        SE_CACHE.clear()
+        self.func(self.x, *self.guess)
+
+    def time_call(self, method, N):
+        if self.method == 'fft':
+            SE_CACHE.clear()
+        self.func(self.x, *self.guess)
@@ -0,0 +1,199 @@
+from argparse import ArgumentParser
+from typing import Dict, List
+import importlib
+import inspect
+import itertools
+import json
+import platform
+import re
+import subprocess
+import sys
+import timeit
+
+import numpy as np
+import scipy
+
+
+"""
+A small runner for the benchmarks, for when asv is not available.
+The benchmarks follow the asv layout (classes with params,
+setup and time_ methods), so asv can also be used.
+
+To run the benchmarks and save the results:
+    python -m benchmarks.run --output results.json
+
+To compare two sets of results (e.g. from two commits):
+    python -m benchmarks.run --compare old.json new.json
+"""
+
+
+MODULES = ['benchmarks.functions', 'benchmarks.engines',
+           'benchmarks.workflows']
+
+
+def _param_sets(cls: type) -> List[tuple]:
+    """
+    Gets all of the combinations of the parameters for a benchmark
+    :param cls: the benchmark class
+    :return a list of the parameter tuples
+    """
+    params = getattr(cls, 'params', [])
+    if len(params) == 0:
+        return [()]
+    if not isinstance(params, tuple):
+        params = (params,)
+    return list(itertools.product(*params))
+
+
+def _label(name: str, cls: type, values: tuple) -> str:
+    """
+    Creates the label for a benchmark
+    :param name: the name of the benchmark method
+    :param cls: the benchmark class
+    :param values: the parameter values
+    :return the label
+    """
+    names = getattr(cls, 'param_names', [])
+    args = ', '.join(f'{key}={value}' for key, value in zip(names, values))
+    return f'{cls.__module__}.{cls.__name__}.{name}({args})'
+
+
+def _time(method, values: tuple, repeat: int,
+          quick: bool) -> Dict[str, float]:
+    """
+    Times a benchmark method
+    :param method: the bound benchmark method
+    :param values: the parameter values
+    :param repeat: the number of repeats
+    :param quick: if to call the method once per repeat, otherwise
+    the number of calls is chosen to take at least 0.2 seconds
+    :return dict of the timings (seconds per call)
+    """
+    timer = timeit.Timer(lambda: method(*values))
+    number = 1
+    if not quick:
+        number, _ = timer.autorange()
+    times = np.array(timer.repeat(repeat=repeat, number=number))/number
+    return {'min': float(np.min(times)), 'median': float(np.median(times)),
+            'number': number, 'repeat': repeat}
+
+
+def run(pattern: str = '.*', repeat: int = 5,
+        quick: bool = False) -> Dict[str, Dict[str, float]]:
+    """
+    Runs the benchmarks
+    :param pattern: a regex, only the benchmarks with a matching
+    label are run
+    :param repeat: the number of repeats for each benchmark
+    :param quick: if to run each benchmark once per repeat
+    :return dict of the timings (keys = labels)
+    """
+    results = {}
+    for name in MODULES:
+        module = importlib.import_module(name)
+        for _, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != name:
+                continue
+            methods = [key for key in dir(cls) if key.startswith('time_')]
+            for values in _param_sets(cls):
+                labels = [_label(key, cls, values) for key in methods]
+                if not any(re.search(pattern, label) for label in labels):
+                    continue
+                bench = cls()
+                try:
+                    if hasattr(bench, 'setup'):
+                        bench.setup(*values)
+                except NotImplementedError:
+                    continue
+                for key, label in zip(methods, labels):
+                    if re.search(pattern, label):
+                        results[label] = _time(getattr(bench, key), values,
+                                               repeat, quick)
+                        print(f"{label}: {results[label]['median']:.3e} s",
+                              flush=True)
+    return results
+
+
+def _commit() -> str:
+    """
+    :return the current git commit (None if not known)
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(results: Dict[str, Dict[str, float]], file_name: str) -> None:
+    """
+    Saves the results, with information about the machine, as json
+    :param results: the benchmark results
+    :param file_name: the file to save to
+    """
+    output = {'commit': _commit(),
+              'machine': platform.platform(),
+              'processor': platform.processor(),
+              'python': platform.python_version(),
+              'numpy': np.__version__,
+              'scipy': scipy.__version__,
+              'results': results}
+    with open(file_name, 'w') as file:
+        json.dump(output, file, indent=2)
+
+
+def compare(old_file: str, new_file: str, threshold: float = 1.1) -> bool:
+    """
+    Compares two sets of results and prints the ratio (new/old)
+    of the median times.
+    :param old_file: the json file of the old results
+    :param new_file: the json file of the new results
+    :param threshold: the ratio above which a benchmark is slower
+    :return if any benchmark is slower
+    """
+    with open(old_file) as file:
+        old = json.load(file)['results']
+    with open(new_file) as file:
+        new = json.load(file)['results']
+
+    slower = False
+    for label in [key for key in new.keys() if key in old.keys()]:
+        ratio = new[label]['median']/old[label]['median']
+        flag = ''
+        if ratio > threshold:
+            flag = ' slower'
+            slower = True
+        elif ratio < 1./threshold:
+            flag = ' faster'
+        print(f'{ratio:6.2f} {label}{flag}')
+    return slower
+
+
+def main(args: List[str] = None) -> int:
+    parser = ArgumentParser(description='Runs the quickBayes benchmarks')
+    parser.add_argument('--bench', default='.*',
+                        help='regex for the benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--quick', action='store_true',
+                        help='run each benchmark once')
+    parser.add_argument('--output', default=None,
+                        help='json file for the results')
+    parser.add_argument('--compare', nargs=2, default=None,
+                        metavar=('OLD', 'NEW'),
+                        help='compare two json result files')
+    parser.add_argument('--threshold', type=float, default=1.1)
+    options = parser.parse_args(args)
+
+    if options.compare is not None:
+        return int(compare(*options.compare, options.threshold))
+
+    repeat = 1 if options.quick else options.repeat
+    results = run(options.bench, repeat, options.quick)
+    if options.output is not None:
+        save(results, options.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
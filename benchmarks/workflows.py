@@ -0,0 +1,83 @@
+from benchmarks.common import load_qens, load_muon, scale_data, SCALES
+from quickBayes.functions.BG import LinearBG
+from quickBayes.functions.qse_fixed import QSEFixFunction
+from quickBayes.workflow.model_selection.QlData import ql_data_main
+from quickBayes.workflow.model_selection.QSE import qse_data_main
+from quickBayes.workflow.model_selection.muon_decay import muon_expdecay_main
+from quickBayes.workflow.grid_search.qse_grid_search import QSEGridSearch
+
+
+"""
+End to end timings of the workflows, using the data from the
+tests and synthetic versions with more points (scale)
+"""
+
+
+class TimeQlData(object):
+    params = SCALES
+    param_names = ['scale']
+    timeout = 300
+
+    def setup(self, scale):
+        x, y, e = scale_data(*load_qens(), scale=scale)
+        rx, ry = scale_data(*load_qens('resolution_data_red.npy')[:2],
+                            scale=scale)
+        self.sample = {'x': x, 'y': y, 'e': e}
+        self.res = {'x': rx, 'y': ry}
+
+    def time_ql_data_main(self, scale):
+        ql_data_main(self.sample, self.res, "linear", -0.4, 0.4, True,
+                     {}, {})
+
+
+class TimeQSE(object):
+    params = SCALES
+    param_names = ['scale']
+    timeout = 300
+
+    def setup(self, scale):
+        x, y, e = scale_data(*load_qens(), scale=scale)
+        rx, ry = scale_data(*load_qens('qse_res.npy')[:2], scale=scale)
+        self.sample = {'x': x, 'y': y, 'e': e}
+        self.res = {'x': rx, 'y': ry}
+
+    def time_qse_data_main(self, scale):
+        qse_data_main(self.sample, self.res, "linear", -0.4, 0.4, True,
+                      {}, {})
+
+
+class TimeMuon(object):
+    params = SCALES
+    param_names = ['scale']
+    timeout = 300
+
+    def setup(self, scale):
+        x, y, e = scale_data(*load_muon(), scale=scale)
+        self.sample = {'x': x, 'y': y, 'e': e}
+
+    def time_muon_expdecay_main(self, scale):
+        muon_expdecay_main(self.sample, "flat", 0.16, 15., {}, {})
+
+
+class TimeQSEGridSearch(object):
+    params = SCALES
+    param_names = ['scale']
+    timeout = 300
+
+    def setup(self, scale):
+        x, y, e = scale_data(*load_qens(), scale=scale)
+        rx, ry = scale_data(*load_qens('qse_res.npy')[:2], scale=scale)
+        self.search = QSEGridSearch()
+        new_x, ry = self.search.preprocess_data(x, y, e, -0.5, 0.5,
+                                                {'x': rx, 'y': ry})
+        self.search.set_x_axis(0.75, 0.78, 5, 'beta')
+        self.search.set_y_axis(0.055, 0.056, 5, 'FWHM')
+        self.func = QSEFixFunction(LinearBG(), True, new_x, ry, -0.5, 0.5)
+        self.func.add_single_SE()
+        self.func.set_delta_bounds([0, -.5], [20, .5])
+
+    def time_execute(self, scale):
+        # a new engine, so every search starts from the same guess
+        self.search.set_scipy_engine(self.func.get_guess(),
+                                     *self.func.get_bounds())
+        self.search.execute(self.func)
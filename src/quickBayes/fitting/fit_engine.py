@@ -2,11 +2,14 @@ from numpy import ndarray
 from typing import Callable
 from abc import abstractmethod
 import numpy as np
+import copy
 from quickBayes.fitting.fit_utils import (chi_squared,
                                           param_errors,
-                                          derivative,
+                                          jacobian,
                                           fit_errors,
                                           var, res)
+from quickBayes.fitting.fit_history import FitHistory
+from quickBayes.utils.profiling import Profiler, stage
 from quickBayes.utils.spline import spline
 
 
@@ -25,15 +28,14 @@ class FitEngine(object):
         :param e_data: original e data (can fit to an interpolation)
         """
         self._name = name
-        self._fits = []
-        self._fit_errors = []
-        self._params = []
-        self._param_errors = []
-        self._msgs = []
-        self._chi2 = []
-        self._covars = []
-        self._diffs = []
+        self._history = FitHistory(len(x_data))
+        # the values for the current fit, before it is added to the history
+        self._covar = None
+        self._params = None
+        self._param_errors = None
+        self._fits = None
         self._fit = None
+        self._profiler = None
 
         self._x_data = x_data
         self._y_data = y_data
@@ -46,7 +48,7 @@ class FitEngine(object):
         count from 0
         :return chi squared value
         """
-        return self._chi2[index]
+        return self._history.get_chi_squared(index)
 
     def get_covariance_matrix(self, index: int = -1) -> ndarray:
         """
@@ -54,7 +56,7 @@ class FitEngine(object):
         count from 0
         :return covariance matrix
         """
-        return self._covars[index]
+        return self._history.get_covariance_matrix(index)
 
     def get_fit_values(self, index: int = -1) -> (ndarray, ndarray,
                                                   ndarray, ndarray, ndarray):
@@ -67,9 +69,9 @@ class FitEngine(object):
         counts from 0
         :return fit values (x data, y values, y errors, diffs, diff errors)
         """
-        return (self._x_data, self._fits[index], self._fit_errors[index],
-                self._diffs[index], np.sqrt(self._fit_errors[index]**2 +
-                                            self._e_data**2))
+        fit, errors, diff = self._history.get_fit_values(index)
+        return (self._x_data, fit, errors, diff,
+                np.sqrt(errors**2 + self._e_data**2))
 
     def get_fit_parameters(self, index: int = -1) -> (ndarray, ndarray):
         """
@@ -78,7 +80,7 @@ class FitEngine(object):
         you want, counts from 0
         :return list of fit parameters and their errors
         """
-        return self._params[index], self._param_errors[index]
+        return self._history.get_fit_parameters(index)
 
     @property
     def name(self) -> str:
@@ -87,6 +89,64 @@ class FitEngine(object):
         """
         return self._name
 
+    @property
+    def retention(self) -> str:
+        """
+        :return the retention policy for the fit history
+        """
+        return self._history.retention
+
+    @property
+    def N_keep(self) -> int:
+        """
+        :return the number of fits kept for the last retention
+        """
+        return self._history.N_keep
+
+    @property
+    def N_fits(self) -> int:
+        """
+        :return the number of fits in the history
+        """
+        return len(self._history)
+
+    def set_retention(self, retention: str, N_keep: int = 1) -> None:
+        """
+        Sets how much of the fit history to keep.
+        The chi^2 values, parameters and errors are kept for every fit.
+        The fits and covariance matrices are kept for:
+        - all: every fit (default)
+        - last: the last N_keep fits
+        - scalars: the latest fit only
+        Fits that have already been removed cannot be recovered.
+        :param retention: the retention policy
+        :param N_keep: the number of fits to keep for the last retention
+        """
+        self._history = self._history.with_retention(retention, N_keep)
+
+    @property
+    def profiler(self) -> Profiler:
+        """
+        :return the profiler (None if profiling is not enabled)
+        """
+        return self._profiler
+
+    def set_profiler(self, profiler: Profiler) -> None:
+        """
+        Sets the profiler, to record the time spent in each
+        stage of a fit and the number of function evaluations.
+        :param profiler: the profiler (None to disable profiling)
+        """
+        self._profiler = profiler
+
+    def _add_iterations(self, N_iterations: int) -> None:
+        """
+        Records the number of optimiser iterations, if profiling
+        :param N_iterations: the number of iterations
+        """
+        if self._profiler is not None:
+            self._profiler.add_iterations(N_iterations)
+
     @abstractmethod
     def _do_fit(self, x_data: ndarray, y_data: ndarray, e_data: ndarray,
                 func: Callable) -> ndarray:
@@ -108,43 +168,141 @@ class FitEngine(object):
         :param df_by_dp: the derivatives wrt the parameters
         :param params: the parameters from the fit
         """
-        fit_y = func(x_data, *params)
-        errors = fit_errors(x_data, params, fit_y, self._covars[-1], df_by_dp)
+        fit_y = self._fit
+        if fit_y is None:
+            fit_y = func(x_data, *params)
+        errors = fit_errors(x_data, params, fit_y, self._covar, df_by_dp)
         self._fit = fit_y
         # record fit on same x axis as the FitHistory was create with
         if not np.array_equal(x_data, self._x_data):
             fit_y = spline(x_data, fit_y, self._x_data)
             errors = spline(x_data, errors, self._x_data)
-        self._fits.append(fit_y)
-        self._fit_errors.append(errors)
-        self._diffs.append(fit_y - self._y_data)
+        self._fits = (fit_y, errors, fit_y - self._y_data)
 
     def add_params(self, params) -> None:
         """
         Add the parameters and errors to the history
         :param params: the fit parameters
         """
-        self._params.append(params)
-        self._param_errors.append(param_errors(self._covars[-1]))
+        self._params = params
+        self._param_errors = param_errors(self._covar)
+
+    def _set_covariance(self, covar: ndarray) -> None:
+        """
+        Sets the covariance matrix for the current fit
+        :param covar: the covariance matrix
+        """
+        self._covar = covar
 
     def do_fit(self, x_data: ndarray, y_data: ndarray, e_data: ndarray,
                func: Callable) -> None:
         """
-        Call for doing a fit and updating the history
+        Call for doing a fit and updating the history.
+        The function is only evaluated once at the fit parameters,
+        the result is used for the derivatives, covariance matrix,
+        fit errors and chi^2.
+        If there is a profiler, each stage is timed and the
+        function evaluations are counted.
         :param x_data: the x data to fit against
         :param y_data: the y data to fit against
         :param e_data: the error data to fit against
         :param func: the fitting function
         """
-        params = self._do_fit(x_data, y_data, e_data, func)
+        profiler = self._profiler
+        if profiler is not None:
+            func = profiler.count_evaluations(func)
 
-        df_by_dp = derivative(x_data, params, func)
-        self.calculate_covar(x_data, y_data, e_data, func, df_by_dp, params)
-        self.add_params(params)
-        self.add_fit(x_data, func, df_by_dp, params)
-        self._chi2.append(chi_squared(x_data, y_data, e_data,
-                                      self._fit, params))
+        with stage(profiler, 'optimiser'):
+            params = self._do_fit(x_data, y_data, e_data, func)
+        with stage(profiler, 'evaluate'):
+            self._fit = func(x_data, *params)
+        with stage(profiler, 'derivatives'):
+            df_by_dp = self._get_derivatives(x_data, params, func)
+        with stage(profiler, 'covariance'):
+            self.calculate_covar(x_data, y_data, e_data, func, df_by_dp,
+                                 params)
+        with stage(profiler, 'fit_errors'):
+            self.add_params(params)
+            self.add_fit(x_data, func, df_by_dp, params)
+        with stage(profiler, 'history'):
+            chi2 = chi_squared(x_data, y_data, e_data, self._fit, params)
+            self._history.add(self._params, self._param_errors, self._covar,
+                              *self._fits, chi2)
         self._fit = None
+        self._fits = None
+
+    def add_fit_from(self, engine: 'FitEngine', index: int = -1) -> None:
+        """
+        Adds a fit from another fit engine to the history, e.g.
+        from a copy of this engine that did the fit in parallel.
+        A fit engine with extra values for each fit should
+        extend this to copy them.
+        :param engine: the fit engine that did the fit
+        :param index: the index (number) of the fit in the other
+        engine, counts from 0
+        """
+        params, errors = engine.get_fit_parameters(index)
+        fit, fit_errors, diff = engine._history.get_fit_values(index)
+        self._history.add(params, errors,
+                          engine.get_covariance_matrix(index),
+                          fit, fit_errors, diff,
+                          engine.get_chi_squared(index))
+
+    def _reset(self) -> None:
+        """
+        Removes the history and the values for the current fit.
+        A fit engine with extra values for each fit, or that
+        keeps values for the data (e.g. the weights), should
+        extend this to remove them.
+        """
+        self._history = FitHistory(len(self._x_data), self.retention,
+                                   self.N_keep)
+        self._covar = None
+        self._params = None
+        self._param_errors = None
+        self._fits = None
+        self._fit = None
+
+    def empty_copy(self, x_data: ndarray = None, y_data: ndarray = None,
+                   e_data: ndarray = None) -> 'FitEngine':
+        """
+        Creates a copy of the fit engine with the same settings,
+        but without the history or the values kept for the data.
+        So it is small enough to send to other processes (e.g. for
+        a tile of a grid search). The data is not copied and can
+        be replaced (e.g. by arrays in shared memory).
+        :param x_data: the new original x data, None (default) for
+        no change
+        :param y_data: the new original y data, None (default) for
+        no change
+        :param e_data: the new original e data, None (default) for
+        no change
+        :return the copy of the fit engine
+        """
+        engine = copy.copy(self)
+        if x_data is not None:
+            engine._x_data = x_data
+        if y_data is not None:
+            engine._y_data = y_data
+        if e_data is not None:
+            engine._e_data = e_data
+        engine._reset()
+        # the data is shared with the copy
+        memo = {id(values): values for values in
+                (engine._x_data, engine._y_data, engine._e_data)}
+        return copy.deepcopy(engine, memo)
+
+    def _get_derivatives(self, x_data: ndarray, params: ndarray,
+                         func: Callable) -> ndarray:
+        """
+        Gets the derivatives of the function at the fit parameters.
+        A fit engine can override this if it already has them.
+        :param x_data: the x data
+        :param params: the fit parameters
+        :param func: the fitting function
+        :return the derivatives (N_params by len(x_data))
+        """
+        return jacobian(x_data, params, func, self._fit)
 
     def calculate_covar(self, x_data: ndarray, y_data: ndarray,
                         e_data: ndarray,
@@ -170,7 +328,7 @@ class FitEngine(object):
         JTJ_inv = np.matmul(inverse, inverse.transpose())
 
         # weight: sum( y - f)^2/sum( (y-f)^2/e^2) -> cannot cancel due to sum
-        weight = var(func, x_data, y_data, params)/res(func, x_data, y_data,
-                                                       e_data, params)
+        weight = (var(func, x_data, y_data, params, self._fit) /
+                  res(func, x_data, y_data, e_data, params, self._fit))
         CovMatrix = JTJ_inv * weight
-        self._covars.append(CovMatrix)
+        self._set_covariance(CovMatrix)
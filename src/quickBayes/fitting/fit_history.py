@@ -0,0 +1,263 @@
+from numpy import ndarray
+import numpy as np
+
+
+RETENTION = ['all', 'last', 'scalars']
+
+
+class FitHistory(object):
+    """
+    Stores the history of fits for a fit engine in
+    preallocated numpy arrays (blocks), which grow as needed.
+
+    The scalar values (chi^2, the parameters and their errors)
+    are kept for every fit. The large values (the fit, fit errors,
+    differences and covariance matrix) depend on the retention:
+    - all: keep the values for every fit
+    - last: keep the values for the last N_keep fits
+    - scalars: keep the values for the latest fit only
+    """
+    def __init__(self, N_x: int, retention: str = 'all', N_keep: int = 1,
+                 block_size: int = 16):
+        """
+        Creates an empty history
+        :param N_x: the length of the (original) x data
+        :param retention: the retention policy (all, last or scalars)
+        :param N_keep: the number of fits to keep for the last retention
+        :param block_size: the initial number of fits to allocate for
+        """
+        if retention not in RETENTION:
+            raise ValueError(f"The retention {retention} is not valid, "
+                             f"please use one of {RETENTION}")
+        if N_keep < 1:
+            raise ValueError("Must keep at least one fit")
+        self._retention = retention
+        self._N_keep = N_keep if retention == 'last' else 1
+        self._N_x = N_x
+        self._N = 0
+
+        # scalars, one row per fit
+        self._chi2 = np.zeros(block_size)
+        self._params = np.full((block_size, 0), np.nan)
+        self._errors = np.full((block_size, 0), np.nan)
+        self._N_params = np.zeros(block_size, dtype=int)
+        self._stored = np.zeros(block_size, dtype=bool)
+        # the slot for each fit (all retention), only the fits
+        # with stored values have a slot
+        self._slots = np.full(block_size, -1, dtype=int)
+        self._N_slots = 0
+
+        # the large values, one row per slot. These are allocated
+        # when a fit is first stored, so an empty history is small
+        self._block_size = block_size
+        self._curves = np.zeros((0, 3, N_x))
+        self._covars = np.zeros((0, 0, 0))
+        self._covar_size = np.zeros(0, dtype=int)
+
+    @property
+    def retention(self) -> str:
+        """
+        :return the retention policy
+        """
+        return self._retention
+
+    @property
+    def N_keep(self) -> int:
+        """
+        :return the number of fits with the large values kept
+        (if not keeping all of them)
+        """
+        return self._N_keep
+
+    def __len__(self) -> int:
+        """
+        :return the number of fits in the history
+        """
+        return self._N
+
+    @staticmethod
+    def _grow(block: ndarray, rows: int, columns: int = None,
+              fill: float = 0.) -> ndarray:
+        """
+        Creates a bigger block and copies the values across
+        :param block: the current block
+        :param rows: the new number of rows
+        :param columns: the new size of the other dimensions
+        (None for no change)
+        :param fill: the value for the new entries
+        :return the new block
+        """
+        shape = list(block.shape)
+        shape[0] = rows
+        if columns is not None:
+            shape[1:] = [columns]*(len(shape) - 1)
+        new = np.full(shape, fill, dtype=block.dtype)
+        new[tuple(slice(0, n) for n in block.shape)] = block
+        return new
+
+    def _reserve(self, N_params: int, N_covar: int, store: bool) -> None:
+        """
+        Makes sure that the blocks are big enough for the next fit
+        :param N_params: the number of parameters for the next fit
+        :param N_covar: the size of the covariance matrix for the next fit
+        :param store: if the large values of the next fit are stored
+        """
+        rows = len(self._chi2)
+        if self._N == rows:
+            rows *= 2
+            self._chi2 = self._grow(self._chi2, rows)
+            self._N_params = self._grow(self._N_params, rows)
+            self._stored = self._grow(self._stored, rows)
+            self._slots = self._grow(self._slots, rows, fill=-1)
+        columns = max(self._params.shape[1], N_params)
+        if rows != len(self._params) or columns != self._params.shape[1]:
+            self._params = self._grow(self._params, rows, columns, np.nan)
+            self._errors = self._grow(self._errors, rows, columns, np.nan)
+
+        slots = len(self._curves)
+        if store and self._retention == 'all' and self._N_slots == slots:
+            slots = max(2*slots, self._block_size)
+        elif store and slots == 0:
+            slots = self._N_keep
+        if slots != len(self._curves):
+            self._curves = self._grow(self._curves, slots)
+            self._covar_size = self._grow(self._covar_size, slots)
+        size = max(self._covars.shape[1], N_covar)
+        if slots != len(self._covars) or size != self._covars.shape[1]:
+            self._covars = self._grow(self._covars, slots, size)
+
+    def _slot(self, index: int) -> int:
+        """
+        :param index: the index of the fit (from 0)
+        :return the slot for the large values of the fit
+        """
+        if self._retention == 'all':
+            return self._slots[index]
+        return index % self._N_keep
+
+    def _index(self, index: int) -> int:
+        """
+        Converts the index to a positive value and checks it
+        :param index: the index of the fit (negative counts from the end)
+        :return the positive index
+        """
+        if index < 0:
+            index += self._N
+        if index < 0 or index >= self._N:
+            raise IndexError(f"The fit index {index} is not in the "
+                             f"history (of {self._N} fits)")
+        return index
+
+    def _stored_slot(self, index: int) -> int:
+        """
+        Gets the slot for the large values and checks they are stored
+        :param index: the index of the fit (negative counts from the end)
+        :return the slot
+        """
+        index = self._index(index)
+        if not self._stored[index]:
+            raise IndexError(f"The fit {index} is no longer stored, "
+                             f"the history is keeping "
+                             f"{self._retention} fits")
+        return self._slot(index)
+
+    def add(self, params: ndarray, errors: ndarray, covar: ndarray,
+            fit: ndarray, fit_errors: ndarray, diff: ndarray,
+            chi2: float, store: bool = True) -> None:
+        """
+        Adds a fit to the history
+        :param params: the fit parameters
+        :param errors: the errors for the fit parameters
+        :param covar: the covariance matrix
+        :param fit: the fit values (on the original x data)
+        :param fit_errors: the errors on the fit values
+        :param diff: the difference between the fit and the data
+        :param chi2: the chi^2 value
+        :param store: if to store the large values (fit, fit errors,
+        differences and covariance matrix)
+        """
+        params = np.atleast_1d(np.asarray(params, dtype=float))
+        covar = np.atleast_2d(np.asarray(covar, dtype=float))
+        self._reserve(len(params), len(covar) if store else 0, store)
+
+        index = self._N
+        self._chi2[index] = chi2
+        self._N_params[index] = len(params)
+        self._params[index] = np.nan
+        self._params[index, :len(params)] = params
+        self._errors[index] = np.nan
+        self._errors[index, :len(params)] = errors
+        self._N += 1
+        if not store:
+            return
+
+        if self._retention == 'all':
+            self._slots[index] = self._N_slots
+            self._N_slots += 1
+        slot = self._slot(index)
+        if self._retention != 'all' and index >= self._N_keep:
+            # the fit in this slot is no longer stored
+            self._stored[index - self._N_keep] = False
+        self._curves[slot, 0] = fit
+        self._curves[slot, 1] = fit_errors
+        self._curves[slot, 2] = diff
+        self._covar_size[slot] = len(covar)
+        self._covars[slot, :len(covar), :len(covar)] = covar
+        self._stored[index] = True
+
+    def get_chi_squared(self, index: int = -1) -> float:
+        """
+        :param index: the index of the fit (counts from 0)
+        :return the chi^2 value
+        """
+        return self._chi2[self._index(index)]
+
+    def get_fit_parameters(self, index: int = -1) -> (ndarray, ndarray):
+        """
+        :param index: the index of the fit (counts from 0)
+        :return the fit parameters and their errors
+        """
+        index = self._index(index)
+        N = self._N_params[index]
+        return self._params[index, :N].copy(), self._errors[index, :N].copy()
+
+    def get_covariance_matrix(self, index: int = -1) -> ndarray:
+        """
+        :param index: the index of the fit (counts from 0)
+        :return the covariance matrix
+        """
+        slot = self._stored_slot(index)
+        N = self._covar_size[slot]
+        return self._covars[slot, :N, :N].copy()
+
+    def get_fit_values(self, index: int = -1) -> (ndarray, ndarray, ndarray):
+        """
+        :param index: the index of the fit (counts from 0)
+        :return the fit values, their errors and the differences
+        """
+        slot = self._stored_slot(index)
+        curves = self._curves[slot].copy()
+        return curves[0], curves[1], curves[2]
+
+    def with_retention(self, retention: str,
+                       N_keep: int = 1) -> 'FitHistory':
+        """
+        Creates a copy of the history with a different retention.
+        The large values can only be kept if they are already stored.
+        :param retention: the retention policy (all, last or scalars)
+        :param N_keep: the number of fits to keep for the last retention
+        :return the new history
+        """
+        history = FitHistory(self._N_x, retention, N_keep)
+        for index in range(self._N):
+            params, errors = self.get_fit_parameters(index)
+            if self._stored[index]:
+                fit, fit_errors, diff = self.get_fit_values(index)
+                covar = self.get_covariance_matrix(index)
+                history.add(params, errors, covar, fit, fit_errors, diff,
+                            self._chi2[index])
+            else:
+                # no space is used for the missing values
+                history.add(params, errors, np.zeros((0, 0)), None, None,
+                            None, self._chi2[index], store=False)
+        return history
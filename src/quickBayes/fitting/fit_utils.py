@@ -2,25 +2,34 @@ from numpy import ndarray
 import numpy as np
 from typing import Callable
 from scipy.stats import t as student_t_dist
+from quickBayes.utils.cache import LRUCache
 
 
 TWO_SIGMA = 0.6826
+ZERO_PARAM_STEP = 1.e-6
+# the value used for log_10(det(H)) if the covariance is not positive definite
+BAD_LOG10_DET = -9.
+# cache for the student t values, the key is the degrees of freedom
+T_CACHE = LRUCache(maxsize=64)
 
 
 def var(func: Callable, x_data: ndarray, y_data: ndarray,
-        params: ndarray) -> float:
+        params: ndarray, fit: ndarray = None) -> float:
     """
     Calculate the variance of the data: sum_i (f(x_i) - y_i)^2
     :param func: the fitting function
     :param x_data: the x data
     :param y_data: the y data
     :param params: the fitting parameters
+    :param fit: the function evaluated at the parameters (optional)
     :return the variance
     """
-    return np.sum(pow(func(x_data, *params) - y_data, 2))
+    if fit is None:
+        fit = func(x_data, *params)
+    return np.sum(pow(fit - y_data, 2))
 
 
-def res(func, x_data, y_data, e_data, param):
+def res(func, x_data, y_data, e_data, param, fit=None):
     """
     Calculate the residuals of the data: sum_i ((f(x_i) - y_i)/e_i)^2
     :param func: the fitting function
@@ -28,26 +37,65 @@ def res(func, x_data, y_data, e_data, param):
     :param y_data: the y data
     :param e_data: the e data
     :param params: the fitting parameters
+    :param fit: the function evaluated at the parameters (optional)
     :return the residuals
     """
-    tmp = (func(x_data, *param) - y_data)/e_data
+    if fit is None:
+        fit = func(x_data, *param)
+    tmp = (fit - y_data)/e_data
     return np.sum(tmp*tmp)
 
 
-def log10_hessian_det(covar: ndarray) -> float:
+def batch_log10_hessian_det(covars: ndarray) -> (ndarray, ndarray):
+    """
+    Calculate the log base 10 of the determinant of the
+    Hessian matrix for a stack of covariance matrices.
+    Since H = C^{-1}, log(det(H)) = -log(det(C)) and
+    the log determinant is calculated directly, so no
+    inverse is needed and it does not overflow.
+    A covariance matrix is symmetric, so a Cholesky
+    factorisation is used (log(det(C)) is twice the sum of
+    the logs of its diagonal). If that fails, the eigenvalues
+    (eigvalsh) give the log determinant and which matrices
+    are positive definite. A matrix that is not symmetric
+    uses slogdet and the real parts of its eigenvalues.
+    If the covariance matrix is not positive definite the
+    value is BAD_LOG10_DET. A positive determinant is not
+    enough, e.g. -I (2 by 2) has a determinant of 1.
+    :param covars: the covariance matrices (N by N_params by N_params)
+    :return the log of the determinant of the Hessian matrices and
+    if each covariance matrix is valid (positive definite)
+    """
+    covars = np.asarray(covars, dtype=float)
+    if not np.allclose(covars, np.swapaxes(covars, -1, -2)):
+        sign, log_det = np.linalg.slogdet(covars)
+        eigenvalues = np.linalg.eigvals(covars)
+        valid = (sign > 0) & np.all(eigenvalues.real > 0, axis=-1)
+    else:
+        try:
+            L = np.linalg.cholesky(covars)
+            diag = np.diagonal(L, axis1=-2, axis2=-1)
+            log_det = 2.*np.sum(np.log(diag), axis=-1)
+            valid = np.ones(log_det.shape, dtype=bool)
+        except np.linalg.LinAlgError:
+            eigenvalues = np.linalg.eigvalsh(covars)
+            valid = np.all(eigenvalues > 0, axis=-1)
+            log_det = np.sum(np.log(np.abs(eigenvalues)), axis=-1)
+    log10_det = np.where(valid, -log_det/np.log(10.), BAD_LOG10_DET)
+    return log10_det, valid
+
+
+def log10_hessian_det(covar: ndarray) -> (float, bool):
     """
     Calculate the log base 10 of the determinant
-    of the Hessian matrix
+    of the Hessian matrix (see batch_log10_hessian_det).
     :param covar: the covarience matrix
     :return the log of the determinant of the
-    Hessian matrix
+    Hessian matrix and if the covariance matrix is
+    valid (positive definite)
     """
-    hessian = np.linalg.inv(covar)
-    det = np.linalg.det(hessian)
-    # cannot have a negative value in log
-    if det <= 0:
-        det = 1.e-9
-    return np.log10(det)
+    log10_det, valid = batch_log10_hessian_det(covar)
+    return float(log10_det), bool(valid)
 
 
 def chi_squared(x_data: ndarray, y_data: ndarray, e_data: ndarray,
@@ -75,14 +123,18 @@ def param_errors(covar: ndarray) -> ndarray:
     return np.sqrt(np.diag(covar))
 
 
-def derivative(x_data: ndarray, params: ndarray, func: Callable) -> ndarray:
+def derivative(x_data: ndarray, params: ndarray, func: Callable,
+               fit: ndarray = None) -> ndarray:
     """
     Get numerical derivative for a function
     :param x_data: the x data
     :param params: the paramaters
     :param func: the function
+    :param fit: the function evaluated at the parameters (optional)
     :return numerical derivatives (with respect to fitting parameter)
     """
+    if fit is None:
+        fit = func(x_data, *params)
     df_by_dp = []
     N = len(params)
     for j in range(N):
@@ -90,16 +142,71 @@ def derivative(x_data: ndarray, params: ndarray, func: Callable) -> ndarray:
         dparams = np.zeros(N)
         # small (0.1%) change in parameter value
         dparams[j] = params[j]*0.001
+        if dparams[j] == 0:
+            # cannot use a relative step for a zero parameter
+            dparams[j] = ZERO_PARAM_STEP
         # forward difference
         df_by_dp.append((func(x_data, *(params + dparams)) -
-                         func(x_data, *(params)))/np.sum(dparams))
+                         fit)/np.sum(dparams))
     return df_by_dp
 
 
+def jacobian(x_data: ndarray, params: ndarray, func: Callable,
+             fit: ndarray = None) -> ndarray:
+    """
+    Get the derivatives of a function with respect to the parameters.
+    If the function has analytic derivatives they are used,
+    otherwise numerical derivatives are calculated.
+    :param x_data: the x data
+    :param params: the paramaters
+    :param func: the function
+    :param fit: the function evaluated at the parameters (optional,
+    only used for numerical derivatives)
+    :return derivatives (with respect to fitting parameter)
+    """
+    if getattr(func, 'has_jacobian', False):
+        return func.jacobian(x_data, *params)
+    return derivative(x_data, params, func, fit)
+
+
+def t_value(dof: int, confidence: float = TWO_SIGMA) -> float:
+    """
+    Get the student t value for the confidence interval.
+    The values are cached (T_CACHE) by the degrees of freedom.
+    :param dof: the degrees of freedom
+    :param confidence: the confidence interval
+    :return the t value
+    """
+    key = (dof, confidence)
+    tval = T_CACHE.get(key)
+    if tval is None:
+        # even distribution above and below data point
+        prob = 0.5 + confidence/2.
+        tval = student_t_dist.ppf(prob, dof)
+        T_CACHE.set(key, tval)
+    return tval
+
+
+def stack_derivatives(df_by_dp: ndarray, M: int) -> ndarray:
+    """
+    Makes the derivatives into a 2D array (N_params by M).
+    A derivative can be a single value if it is constant.
+    :param df_by_dp: the derivatives
+    :param M: the number of x values
+    :return the derivatives as a 2D array
+    """
+    if isinstance(df_by_dp, ndarray) and df_by_dp.ndim == 2:
+        return df_by_dp
+    return np.array([np.broadcast_to(np.asarray(row, dtype=float), (M,))
+                     for row in df_by_dp])
+
+
 def fit_errors(x_data: ndarray, params: ndarray, fit: ndarray,
                covar: ndarray, df_by_dp: ndarray) -> ndarray:
     """
-    Generate the errors for the fit line
+    Generate the errors for the fit line.
+    The variance at each x value is J^T C J, for the
+    derivatives J and covariance matrix C.
     :param x_data: the x data
     :param params: the parameters for the function
     :param fit: the y data values from the fit
@@ -107,18 +214,34 @@ def fit_errors(x_data: ndarray, params: ndarray, fit: ndarray,
     :param df_by_dp: the derivatives
     :return the error values
     """
-    confidence = TWO_SIGMA
-
-    prob = 0.5 + confidence/2.  # even distribution above and below data point
     N = len(params)
     M = len(x_data)
-    dof = M - N
-    tval = student_t_dist.ppf(prob, dof)
+    tval = t_value(M - N)
 
-    df_sq = np.zeros(M)
-    for j in range(N):
-        for k in range(N):
-            df_sq += df_by_dp[j]*df_by_dp[k]*covar[j, k]
+    jac = stack_derivatives(df_by_dp, M)
+    df_sq = np.einsum('jm,jk,km->m', jac, covar, jac)
     df = np.sqrt(df_sq)
 
     return tval*df
+
+
+def batch_fit_errors(x_data: ndarray, params: ndarray, covars: ndarray,
+                     df_by_dp: ndarray) -> ndarray:
+    """
+    Generate the errors for the fit lines of many fits at once
+    (e.g. every spectrum in a batch). All of the fits must have
+    the same number of parameters and x values.
+    :param x_data: the x data
+    :param params: the parameters for the fits (N_fits by N_params)
+    :param covars: the covariance matrices (N_fits by N_params by N_params)
+    :param df_by_dp: the derivatives (N_fits by N_params by len(x_data))
+    :return the error values (N_fits by len(x_data))
+    """
+    N = np.shape(params)[-1]
+    M = len(x_data)
+    tval = t_value(M - N)
+
+    df_sq = np.einsum('fjm,fjk,fkm->fm', np.asarray(df_by_dp, dtype=float),
+                      np.asarray(covars, dtype=float),
+                      np.asarray(df_by_dp, dtype=float))
+    return tval*np.sqrt(df_sq)
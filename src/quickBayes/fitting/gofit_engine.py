@@ -1,7 +1,10 @@
-from gofit import multistart
+from gofit import multistart, regularisation
 from numpy import ndarray
-from typing import Callable
+import numpy as np
+from typing import Callable, Dict, List
 from quickBayes.fitting.fit_engine import FitEngine
+from quickBayes.fitting.fit_utils import stack_derivatives
+from quickBayes.fitting.scipy_engine import WeightedResiduals
 
 
 """
@@ -14,7 +17,16 @@ the data as a member variable.
 """
 
 
-class ChiSquared(object):
+class ChiSquared(WeightedResiduals):
+    """
+    A chi^2 cost function class for use with gofit.
+    The residuals are the squared weighted residuals,
+    ((f(x) - y)/e)^2. The weights are calculated once
+    and the function is evaluated into a work array that
+    is reused for every call, as gofit calls it many times.
+    The returned arrays are always new, as gofit keeps
+    references to them.
+    """
     def __init__(self, x_data: ndarray, y_data: ndarray,
                  e_data: ndarray, func: Callable):
         """
@@ -24,19 +36,110 @@ class ChiSquared(object):
         :param e_data: e data that fitted against
         :param func: the fitting function used
         """
-        self._x_data = x_data
-        self._y_data = y_data
-        self._e_data = e_data
+        super().__init__(x_data, y_data, e_data)
+        self._weighted = np.empty(len(self._x))
+        self._params = None
+        self.set_function(func)
+
+    def set_function(self, func: Callable) -> None:
+        """
+        Sets the fitting function (e.g. for the next fit)
+        :param func: the fitting function
+        """
         self._func = func
+        self._params = None
+
+    @property
+    def has_jacobian(self) -> bool:
+        """
+        :return if the fitting function has analytic derivatives
+        """
+        return getattr(self._func, 'has_jacobian', False)
+
+    def _weighted_residuals(self, params: ndarray) -> ndarray:
+        """
+        Calculates the weighted residuals, (f(x) - y)/e.
+        The result for the last parameters is kept, as gofit
+        calls the Jacobian with the same parameters.
+        :param params: the fit parameters
+        :return the weighted residuals
+        """
+        if self._params is None or not np.array_equal(params, self._params):
+            weighted = self._weighted
+            weighted.fill(0.)
+            if hasattr(self._func, 'evaluate_into'):
+                self._func.evaluate_into(self._x, weighted, *params)
+            else:
+                weighted += self._func(self._x, *params)
+            weighted *= self._w
+            weighted -= self._yw
+            self._params = np.array(params, dtype=float)
+        return self._weighted
 
-    def __call__(self, params: ndarray) -> float:
+    def __call__(self, params: ndarray) -> ndarray:
         """
         Calls the evaluation of the cost function
         :param params: the fit parameters
         :return the cost function evaluation
         """
-        fit = self._func(self._x_data, *params)
-        return (fit - self._y_data)**2 / self._e_data**2
+        return np.square(self._weighted_residuals(params))
+
+    def jacobian(self, params: ndarray) -> ndarray:
+        """
+        The derivatives of the residuals, from the analytic
+        derivatives of the fitting function.
+        :param params: the fit parameters
+        :return the derivatives, shape len(x_data) by N_params
+        """
+        scale = 2.*self._weighted_residuals(params)*self._w
+        df_by_dp = stack_derivatives(self._func.jacobian(self._x, *params),
+                                     len(self._x))
+        return df_by_dp.T*scale[:, np.newaxis]
+
+    def batch_call(self, P: ndarray) -> ndarray:
+        """
+        Evaluates the residuals for a batch of parameter sets
+        :param P: the parameter sets (n_sets, N_params)
+        :return the residuals for each parameter set (n_sets, len(x_data))
+        """
+        P = np.asarray(P, dtype=float)
+        if hasattr(self._func, 'batch_call'):
+            fits = self._func.batch_call(self._x, P)
+        else:
+            fits = np.array([self._func(self._x, *params)
+                             for params in P])
+        return (fits*self._w - self._yw)**2
+
+    def batch_cost(self, P: ndarray) -> ndarray:
+        """
+        Evaluates the cost (sum of the squared residuals)
+        for a batch of parameter sets (e.g. start points)
+        :param P: the parameter sets (n_sets, N_params)
+        :return the cost for each parameter set
+        """
+        return np.sum(self.batch_call(P)**2, axis=1)
+
+
+def _distinct_minima(minima: List[ndarray], lower: ndarray, upper: ndarray,
+                     tolerance: float) -> int:
+    """
+    Counts the number of distinct minima. Two minima are the
+    same if all of their parameters agree to within the tolerance
+    (relative to the width of the bounds).
+    :param minima: the list of parameters at each minimum
+    :param lower: the lower bounds
+    :param upper: the upper bounds
+    :param tolerance: the relative tolerance for the parameters
+    :return the number of distinct minima
+    """
+    width = np.maximum(np.asarray(upper, dtype=float) -
+                       np.asarray(lower, dtype=float), np.finfo(float).tiny)
+    distinct = []
+    for params in minima:
+        if not any(np.all(np.abs(params - other) <= tolerance*width)
+                   for other in distinct):
+            distinct.append(params)
+    return len(distinct)
 
 
 class GoFitEngine(FitEngine):
@@ -44,11 +147,17 @@ class GoFitEngine(FitEngine):
     A gofit multistart fit engine.
     This will use gofit's multistart to
     fit data.
+    The adaptive option runs multistart in rounds of a few
+    samples, it stops once the best few minima agree (or the
+    samples have all been used). Seeds (e.g. the optimum from
+    a previous fit) are also refined and used as minima.
     """
 
     def __init__(self, x_data: ndarray, y_data: ndarray, e_data: ndarray,
                  lower: ndarray, upper: ndarray, samples: int = 10,
-                 max_iterations: int = 220000):
+                 max_iterations: int = 220000, adaptive: bool = False,
+                 round_samples: int = 4, N_agree: int = 2,
+                 tolerance: float = 1.e-4):
         """
         Creates the scipy curve fit engine class
         Stores useful information about each fit
@@ -59,13 +168,84 @@ class GoFitEngine(FitEngine):
         :param lower: the lower bounds for the fit parameters
         :param upper: the upper bounds for the fit parameters
         :param samples: the number of samples to use in multistart
+        (the maximum number if adaptive)
         :param max_iterations: the maximum number of iterations for the fit
+        :param adaptive: if to use the adaptive number of samples
+        (default False)
+        :param round_samples: the number of samples in each round of
+        the adaptive multistart
+        :param N_agree: the number of best minima that must agree
+        to stop the adaptive multistart
+        :param tolerance: the relative tolerance for the cost of the
+        minima to agree (also used for the parameters when counting
+        the distinct minima)
         """
         super().__init__("gofit", x_data, y_data, e_data)
+        if round_samples < 1 or N_agree < 1:
+            raise ValueError("The round samples and N_agree must "
+                             "be at least 1")
         # extra parameters
         self.set_bounds_and_N_params(lower, upper)
         self._max_iterations = max_iterations
         self._samples = samples
+        self._cost = None
+        self._adaptive = adaptive
+        self._round_samples = round_samples
+        self._N_agree = N_agree
+        self._tolerance = tolerance
+        self._seeds = []
+        self._multistart_stats = []
+
+    @property
+    def adaptive(self) -> bool:
+        """
+        :return if the adaptive multistart is used
+        """
+        return self._adaptive
+
+    def set_seeds(self, seeds: List[ndarray]) -> None:
+        """
+        Sets the seeds (starting parameters) for the next
+        adaptive fit, e.g. the optimum from a previous fit.
+        Seeds with the wrong number of parameters are ignored.
+        They are only used once.
+        :param seeds: the list of seeds
+        """
+        self._seeds = [np.asarray(seed, dtype=float) for seed in seeds]
+
+    def get_multistart_stats(self, index: int = -1) -> Dict[str, int]:
+        """
+        Gets the statistics of the multistart for a fit:
+        - starts: the number of start points (samples and seeds)
+        - rounds: the number of calls to multistart
+        - minima: the number of distinct minima found
+        - stopped_early: if the adaptive multistart stopped before
+        using all of the samples
+        :param index: the index (number) of fit that you want,
+        count from 0
+        :return a dict of the statistics
+        """
+        return self._multistart_stats[index]
+
+    def add_fit_from(self, engine: 'GoFitEngine', index: int = -1) -> None:
+        """
+        Adds a fit (and its multistart statistics) from another
+        gofit engine
+        :param engine: the gofit engine that did the fit
+        :param index: the index (number) of the fit in the other
+        engine, counts from 0
+        """
+        super().add_fit_from(engine, index)
+        self._multistart_stats.append(engine.get_multistart_stats(index))
+
+    def _reset(self) -> None:
+        """
+        Removes the history (including the multistart statistics),
+        the values for the current fit and the cost function
+        """
+        super()._reset()
+        self._cost = None
+        self._multistart_stats = []
 
     def set_bounds_and_N_params(self, lower: ndarray, upper: ndarray) -> None:
         """
@@ -84,23 +264,129 @@ class GoFitEngine(FitEngine):
         self._upper = upper
         self._N_params = len(upper)
 
+    def get_cost_function(self, x_data: ndarray, y_data: ndarray,
+                          e_data: ndarray, func: Callable) -> ChiSquared:
+        """
+        Gets the cost function for the data. It is only
+        recreated (i.e. the weights calculated) if the
+        data changes.
+        :param x_data: the x data to fit
+        :param y_data: the y data to fit
+        :param e_data: the error data to fit
+        :param func: the fitting function
+        :return the cost function
+        """
+        if (self._cost is None or
+                not self._cost.matches(x_data, y_data, e_data)):
+            self._cost = ChiSquared(x_data, y_data, e_data, func)
+        else:
+            self._cost.set_function(func)
+        return self._cost
+
     def _do_fit(self, x_data: ndarray, y_data: ndarray, e_data: ndarray,
                 func: Callable) -> ndarray:
         """
-        Calls gofit multistart
+        Calls gofit multistart.
+        If the function has analytic derivatives they are used.
         :param x_data: the x data to fit
         :param y_data: the y data to fit
         :param e_data: the error data to fit
         :param func: the fitting function
         :return the fit parameters
         """
-        cost_function = ChiSquared(x_data, y_data, e_data, func)
+        cost_function = self.get_cost_function(x_data, y_data, e_data, func)
+        jac = cost_function.jacobian if cost_function.has_jacobian else None
 
         data_length = len(x_data)
 
+        seeds, self._seeds = self._seeds, []
+        if self._adaptive:
+            return self._adaptive_fit(data_length, cost_function, jac, seeds)
+
         params, _ = multistart(data_length, self._N_params,
                                self._lower, self._upper,
-                               cost_function, samples=self._samples,
+                               cost_function, jac, samples=self._samples,
                                maxit=self._max_iterations)
-
+        self._multistart_stats.append({'starts': self._samples,
+                                       'rounds': 1, 'minima': 1,
+                                       'stopped_early': False})
         return params
+
+    def _refine_seed(self, data_length: int, cost_function: ChiSquared,
+                     jac: Callable, seed: ndarray) -> ndarray:
+        """
+        Does a local fit (gofit regularisation) from a seed.
+        The seed is moved inside of the bounds, but (like the local
+        fits in multistart) the fit itself does not use them.
+        :param data_length: the length of the data
+        :param cost_function: the cost function
+        :param jac: the Jacobian of the cost function (None if not known)
+        :param seed: the starting parameters
+        :return the parameters at the minimum (None if the fit failed)
+        """
+        seed = np.clip(seed, self._lower, self._upper)
+        params, _ = regularisation(data_length, self._N_params,
+                                   seed, cost_function, jac,
+                                   maxit=self._max_iterations)
+        return params if np.all(np.isfinite(params)) else None
+
+    def _minima_agree(self, costs: List[float]) -> bool:
+        """
+        Checks if the best N_agree minima have the same cost
+        :param costs: the costs of the minima
+        :return if the best minima agree
+        """
+        if len(costs) < self._N_agree:
+            return False
+        best = np.sort(costs)[:self._N_agree]
+        return best[-1] - best[0] <= self._tolerance*max(abs(best[0]),
+                                                         1.e-12)
+
+    def _adaptive_fit(self, data_length: int, cost_function: ChiSquared,
+                      jac: Callable, seeds: List[ndarray]) -> ndarray:
+        """
+        Refines the seeds and then calls multistart with a few samples
+        at a time, until the best N_agree minima agree or all of the
+        samples have been used.
+        :param data_length: the length of the data
+        :param cost_function: the cost function
+        :param jac: the Jacobian of the cost function (None if not known)
+        :param seeds: the list of seeds
+        :return the parameters for the best minimum
+        """
+        minima = []
+        starts = 0
+        for seed in seeds:
+            if len(seed) != self._N_params:
+                continue
+            starts += 1
+            params = self._refine_seed(data_length, cost_function, jac,
+                                       seed)
+            if params is not None:
+                minima.append(params)
+
+        rounds = 0
+        costs = [np.sum(cost_function(params)**2) for params in minima]
+        stopped_early = False
+        # always do at least one round, if the seeds are not valid
+        while starts < self._samples or len(minima) == 0:
+            N_samples = max(1, min(self._round_samples,
+                                   self._samples - starts))
+            params, _ = multistart(data_length, self._N_params,
+                                   self._lower, self._upper,
+                                   cost_function, jac, samples=N_samples,
+                                   maxit=self._max_iterations)
+            starts += N_samples
+            rounds += 1
+            minima.append(params)
+            costs.append(np.sum(cost_function(params)**2))
+            if self._minima_agree(costs):
+                stopped_early = starts < self._samples
+                break
+
+        self._multistart_stats.append(
+            {'starts': starts, 'rounds': rounds,
+             'minima': _distinct_minima(minima, self._lower, self._upper,
+                                        self._tolerance),
+             'stopped_early': stopped_early})
+        return minima[int(np.argmin(costs))]
@@ -0,0 +1,430 @@
+from numpy import ndarray
+import numpy as np
+from typing import Callable, List
+from functools import partial
+from quickBayes.fitting.fit_engine import FitEngine
+from quickBayes.utils.parallel import parallel
+
+
+"""
+This file contains the code for a Markov chain Monte Carlo
+(MCMC) fit engine. It uses an ensemble of walkers with the
+affine invariant stretch move of Goodman and Weare
+(Comm. App. Math. Comp. Sci. 5, 65 (2010)).
+The bounds of the parameters are used as uniform priors.
+Like the gofit engine, the cost function is a class that
+holds the data, so that it can be sent to other processes.
+"""
+
+
+class LogPosterior(object):
+    def __init__(self, x_data: ndarray, y_data: ndarray,
+                 e_data: ndarray, func: Callable,
+                 lower: ndarray, upper: ndarray):
+        """
+        The (unnormalised) log posterior, with uniform priors.
+        :param x_data: x data that fitted against
+        :param y_data: y data that fitted against
+        :param e_data: e data that fitted against
+        :param func: the fitting function used
+        :param lower: the lower bounds for the parameters
+        :param upper: the upper bounds for the parameters
+        """
+        self._x_data = x_data
+        self._y_data = y_data
+        self._weights = 1./np.asarray(e_data)**2
+        self._func = func
+        self._lower = np.asarray(lower, dtype=float)
+        self._upper = np.asarray(upper, dtype=float)
+        self._log_prior = -np.sum(np.log(self._upper - self._lower))
+
+    @property
+    def log_prior(self) -> float:
+        """
+        :return the log of the (uniform) prior inside of the bounds
+        """
+        return self._log_prior
+
+    def _evaluate(self, P: ndarray) -> ndarray:
+        """
+        Evaluate the function for a set of parameters
+        :param P: the parameter sets (n_sets, N_params)
+        :return the function values (n_sets, len(x))
+        """
+        if hasattr(self._func, 'batch_call'):
+            return self._func.batch_call(self._x_data, P)
+        return np.array([self._func(self._x_data, *p) for p in P])
+
+    def __call__(self, P: ndarray) -> ndarray:
+        """
+        Calculate the log posterior for a set of parameters.
+        Outside of the bounds the value is -inf.
+        :param P: the parameter sets (n_sets, N_params)
+        :return the log posterior for each set
+        """
+        log_prob = np.full(len(P), -np.inf)
+        inside = np.all((P >= self._lower) & (P <= self._upper), axis=1)
+        if np.any(inside):
+            fit = self._evaluate(P[inside])
+            chi2 = np.sum((fit - self._y_data)**2*self._weights, axis=1)
+            log_prob[inside] = np.where(np.isfinite(chi2),
+                                        -0.5*chi2 + self._log_prior,
+                                        -np.inf)
+        return log_prob
+
+
+def stretch_move(walkers: ndarray, log_prob: ndarray,
+                 log_posterior: Callable, rng: np.random.Generator,
+                 stretch: float = 2.) -> (ndarray, ndarray, int):
+    """
+    A single step of the affine invariant stretch move.
+    The ensemble is split into two halves, each half is updated
+    (vectorised) using the walkers in the other half.
+    :param walkers: the positions of the walkers (N_walkers, N_params)
+    :param log_prob: the log posterior of the walkers
+    :param log_posterior: the log posterior function
+    :param rng: the random number generator
+    :param stretch: the stretch scale (a)
+    :return the new walkers, their log posterior and the number accepted
+    """
+    N_walkers, N_params = walkers.shape
+    half = N_walkers//2
+    accepted = 0
+    for active, other in [(slice(0, half), slice(half, N_walkers)),
+                          (slice(half, N_walkers), slice(0, half))]:
+        current = walkers[active]
+        partners = walkers[other]
+        N = len(current)
+        # z is sampled from g(z) prop 1/sqrt(z) on [1/a, a]
+        z = ((stretch - 1.)*rng.random(N) + 1.)**2/stretch
+        chosen = partners[rng.integers(len(partners), size=N)]
+        proposal = chosen + z[:, np.newaxis]*(current - chosen)
+
+        new_log_prob = log_posterior(proposal)
+        log_ratio = (N_params - 1.)*np.log(z) + new_log_prob
+        log_ratio -= log_prob[active]
+        accept = np.log(rng.random(N)) < log_ratio
+
+        walkers[active][accept] = proposal[accept]
+        log_prob[active][accept] = new_log_prob[accept]
+        accepted += np.count_nonzero(accept)
+    return walkers, log_prob, accepted
+
+
+def run_chain(seed: np.random.SeedSequence, log_posterior: Callable,
+              start: ndarray, N_steps: int, burn_in: int,
+              thin: int, stretch: float = 2.
+              ) -> (ndarray, ndarray, float, ndarray, float):
+    """
+    Runs a single ensemble (chain) of walkers.
+    The samples are stored in preallocated arrays,
+    keeping every thin steps after the burn in.
+    :param seed: the seed for the random number generator
+    :param log_posterior: the log posterior function
+    :param start: the starting positions (N_walkers, N_params)
+    :param N_steps: the number of steps to keep (before thinning)
+    :param burn_in: the number of steps to discard at the start
+    :param thin: the number of steps between stored samples
+    :param stretch: the stretch scale (a)
+    :return the samples (N_kept, N_walkers, N_params), the log posterior
+    for the samples (N_kept, N_walkers), the acceptance fraction, the best
+    parameters found and the best log posterior
+    """
+    rng = np.random.default_rng(seed)
+    walkers = np.array(start, dtype=float)
+    log_prob = log_posterior(walkers)
+    N_walkers, N_params = walkers.shape
+
+    N_kept = N_steps//thin
+    samples = np.empty((N_kept, N_walkers, N_params))
+    sample_log_prob = np.empty((N_kept, N_walkers))
+
+    best = np.argmax(log_prob)
+    best_params = walkers[best].copy()
+    best_log_prob = log_prob[best]
+    accepted = 0
+
+    for step in range(burn_in + N_kept*thin):
+        walkers, log_prob, N_accept = stretch_move(walkers, log_prob,
+                                                   log_posterior, rng,
+                                                   stretch)
+        accepted += N_accept
+        best = np.argmax(log_prob)
+        if log_prob[best] > best_log_prob:
+            best_log_prob = log_prob[best]
+            best_params = walkers[best].copy()
+
+        kept = step - burn_in
+        if kept >= 0 and (kept + 1) % thin == 0:
+            samples[kept//thin] = walkers
+            sample_log_prob[kept//thin] = log_prob
+
+    acceptance = accepted/float(N_walkers*(burn_in + N_kept*thin))
+    return samples, sample_log_prob, acceptance, best_params, best_log_prob
+
+
+class MCMCFitEngine(FitEngine):
+    """
+    An ensemble MCMC fit engine.
+    The fit parameters are the maximum a posteriori (MAP)
+    values and the covariance matrix is calculated from the samples.
+    """
+
+    def __init__(self, x_data: ndarray, y_data: ndarray, e_data: ndarray,
+                 lower: ndarray, upper: ndarray, guess: ndarray = None,
+                 N_walkers: int = 32, N_steps: int = 2000,
+                 burn_in: int = 1000, thin: int = 10,
+                 N_chains: int = 1, N_jobs: int = 1,
+                 backend: str = 'loky', seed: int = None):
+        """
+        Creates the MCMC fit engine class
+        Stores useful information about each fit
+        :param x_data: original x data (can fit to an interpolation)
+        :param y_data: original y data (can fit to an interpolation)
+        :param e_data: original e data (can fit to an interpolation)
+        :param lower: the lower bounds for the fit parameters (prior)
+        :param upper: the upper bounds for the fit parameters (prior)
+        :param guess: the starting guess for the walkers, if None (default)
+        the walkers start uniformly within the bounds
+        :param N_walkers: the number of walkers in each chain (at least
+        twice the number of parameters will be used)
+        :param N_steps: the number of steps to record (before thinning)
+        :param burn_in: the number of steps to discard at the start
+        :param thin: the number of steps between recorded samples
+        :param N_chains: the number of independent chains
+        :param N_jobs: the number of chains to run in parallel
+        :param backend: the parallel backend (threads, loky or
+        multiprocessing)
+        :param seed: the seed for the random numbers
+        """
+        super().__init__("mcmc", x_data, y_data, e_data)
+        self.set_guess_and_bounds(guess, lower, upper)
+        if thin < 1 or N_steps < thin:
+            raise ValueError("The number of steps must be at least "
+                             "the thinning value (>0)")
+        self._N_walkers = N_walkers
+        self._N_steps = N_steps
+        self._burn_in = burn_in
+        self._thin = thin
+        self._N_chains = N_chains
+        self._N_jobs = N_jobs
+        self._backend = backend
+        self._seed = np.random.SeedSequence(seed)
+
+        self._samples = []
+        self._sample_log_prob = []
+        self._acceptance = []
+        self._log10_evidence = []
+
+    def set_guess_and_bounds(self, guess: ndarray,
+                             lower: ndarray, upper: ndarray) -> None:
+        """
+        Sets the current guess and bounds for the fit function.
+        If the functional form changes this method will need to be called
+        with updated values.
+        :param guess: the starting guess for the walkers (can be None)
+        :param lower: the lower bound for the function parameters
+        :param upper: the upper bound for the function parameters
+        """
+        # validate
+        if len(upper) != len(lower) or (guess is not None and
+                                        len(guess) != len(upper)):
+            raise ValueError(f"The guess {guess}, lower {lower} and "
+                             f"upper {upper} bounds must "
+                             "be the same length")
+        if not (np.all(np.isfinite(lower)) and np.all(np.isfinite(upper))):
+            raise ValueError("The bounds must be finite, "
+                             "as they are used for the prior")
+        self._guess = guess
+        self._lower = np.asarray(lower, dtype=float)
+        self._upper = np.asarray(upper, dtype=float)
+
+    def get_samples(self, index: int = -1, flat: bool = True) -> ndarray:
+        """
+        Get the (thinned) samples from a fit
+        :param index: the index (number) of fit that you want,
+        counts from 0
+        :param flat: if to combine the walkers and chains
+        :return the samples, if flat then (N_samples, N_params)
+        otherwise (N_chains, N_kept, N_walkers, N_params)
+        """
+        samples = self._samples[index]
+        if flat:
+            return samples.reshape(-1, samples.shape[-1])
+        return samples
+
+    def get_sample_log_posterior(self, index: int = -1) -> ndarray:
+        """
+        Get the log posterior of the (thinned) samples
+        :param index: the index (number) of fit that you want,
+        counts from 0
+        :return the log posterior (N_chains, N_kept, N_walkers)
+        """
+        return self._sample_log_prob[index]
+
+    def get_acceptance_fraction(self, index: int = -1) -> ndarray:
+        """
+        :param index: the index (number) of fit that you want,
+        counts from 0
+        :return the fraction of moves accepted for each chain
+        """
+        return self._acceptance[index]
+
+    def get_log10_evidence(self, index: int = -1) -> float:
+        """
+        The Laplace-Metropolis estimate of the log10 evidence.
+        This uses the covariance of the samples, instead of the
+        Hessian, so can be used as an alternative to the loglikelihood.
+        :param index: the index (number) of fit that you want,
+        counts from 0
+        :return the log10 of the evidence
+        """
+        return self._log10_evidence[index]
+
+    def add_fit_from(self, engine: 'MCMCFitEngine', index: int = -1) -> None:
+        """
+        Adds a fit (and its samples) from another MCMC engine
+        :param engine: the MCMC engine that did the fit
+        :param index: the index (number) of the fit in the other
+        engine, counts from 0
+        """
+        super().add_fit_from(engine, index)
+        self._samples.append(engine._samples[index])
+        self._sample_log_prob.append(engine._sample_log_prob[index])
+        self._acceptance.append(engine._acceptance[index])
+        self._log10_evidence.append(engine._log10_evidence[index])
+
+    def _reset(self) -> None:
+        """
+        Removes the history (including the samples) and the
+        values for the current fit
+        """
+        super()._reset()
+        self._samples = []
+        self._sample_log_prob = []
+        self._acceptance = []
+        self._log10_evidence = []
+
+    def _start_positions(self, N_walkers: int,
+                         rng: np.random.Generator) -> ndarray:
+        """
+        Gets the starting positions of the walkers.
+        These are a small ball around the guess (if available),
+        otherwise uniform within the bounds.
+        :param N_walkers: the number of walkers
+        :param rng: the random number generator
+        :return the start positions (N_walkers, N_params)
+        """
+        width = self._upper - self._lower
+        N_params = len(width)
+        if self._guess is None:
+            return self._lower + width*rng.random((N_walkers, N_params))
+        start = (np.asarray(self._guess, dtype=float) +
+                 1.e-3*width*rng.standard_normal((N_walkers, N_params)))
+        return np.clip(start, self._lower, self._upper)
+
+    @staticmethod
+    def _log10_laplace_metropolis(best_log_prob: float, covar: ndarray,
+                                  N_params: int) -> float:
+        """
+        The Laplace-Metropolis estimator of the evidence
+        ln(Z) = N/2 ln(2 pi) + 1/2 ln(det(covar)) + ln(L(p)) + ln(prior(p))
+        where p are the MAP parameters.
+        :param best_log_prob: the log posterior (ln(L) + ln(prior)) at p
+        :param covar: the covariance matrix of the samples
+        :param N_params: the number of parameters
+        :return the log10 of the evidence
+        """
+        sign, log_det = np.linalg.slogdet(np.atleast_2d(covar))
+        if sign <= 0:
+            return -np.inf
+        log_evidence = (0.5*N_params*np.log(2.*np.pi) + 0.5*log_det +
+                        best_log_prob)
+        return log_evidence/np.log(10.)
+
+    def _do_fit(self, x_data: ndarray, y_data: ndarray, e_data: ndarray,
+                func: Callable) -> ndarray:
+        """
+        Runs the MCMC chains.
+        :param x_data: the x data to fit
+        :param y_data: the y data to fit
+        :param e_data: the error data to fit
+        :param func: the fitting function
+        :return the fit parameters (MAP)
+        """
+        log_posterior = LogPosterior(x_data, y_data, e_data, func,
+                                     self._lower, self._upper)
+        N_params = len(self._lower)
+        # need at least 2 walkers per parameter, and an even number
+        N_walkers = max(self._N_walkers, 2*N_params)
+        N_walkers += N_walkers % 2
+
+        items = []
+        for start_seed, chain_seed in self._chain_seeds():
+            start = self._start_positions(N_walkers,
+                                          np.random.default_rng(start_seed))
+            items.append((chain_seed, start))
+        run = partial(self._run_chain, log_posterior=log_posterior,
+                      N_steps=self._N_steps, burn_in=self._burn_in,
+                      thin=self._thin)
+        if self._N_chains > 1 and self._N_jobs > 1:
+            output = parallel(items, run, self._N_jobs, self._backend)
+        else:
+            output = [run(item) for item in items]
+        self._add_iterations(self._N_chains*self._N_steps)
+
+        samples = np.array([out[0] for out in output])
+        best = np.argmax([out[4] for out in output])
+        params = output[best][3]
+
+        flat = samples.reshape(-1, N_params)
+        covar = np.atleast_2d(np.cov(flat, rowvar=False))
+
+        self._samples.append(samples)
+        self._sample_log_prob.append(np.array([out[1] for out in output]))
+        self._acceptance.append(np.array([out[2] for out in output]))
+        self._set_covariance(covar)
+        self._log10_evidence.append(
+            self._log10_laplace_metropolis(output[best][4], covar, N_params))
+        return params
+
+    def _chain_seeds(self) -> List[List[np.random.SeedSequence]]:
+        """
+        Creates independent seeds for each chain. Each chain has
+        one seed for the start positions and one for the chain, so
+        the random numbers for the start are not reused by the chain.
+        :return a list of the start and chain seeds for each chain
+        """
+        return [seed.spawn(2) for seed in self._seed.spawn(self._N_chains)]
+
+    @staticmethod
+    def _run_chain(item: tuple, log_posterior: Callable, N_steps: int,
+                   burn_in: int, thin: int) -> List:
+        """
+        Runs a single chain, the input is a tuple so
+        it can be used with the parallel function.
+        :param item: the seed and start positions for the chain
+        :param log_posterior: the log posterior function
+        :param N_steps: the number of steps to record (before thinning)
+        :param burn_in: the number of steps to discard at the start
+        :param thin: the number of steps between recorded samples
+        :return the output of run_chain
+        """
+        seed, start = item
+        return run_chain(seed, log_posterior, start, N_steps, burn_in, thin)
+
+    def calculate_covar(self, x_data: ndarray, y_data: ndarray,
+                        e_data: ndarray,
+                        func: Callable, df_by_dp: ndarray,
+                        params: ndarray) -> None:
+        """
+        The covariance matrix is calculated from the samples
+        So do nothing here as we already have the value
+        :param x_data: the x data to fitted against
+        :param y_data: the y data to fitted against
+        :param e_data: the error data to fitted against
+        :param func: the fitting function
+        :param df_by_dp: the derivatives wrt the parameters
+        :param params: the fit parameters
+        """
+        return
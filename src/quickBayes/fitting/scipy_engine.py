@@ -1,19 +1,103 @@
-from scipy.optimize import curve_fit
+from scipy.optimize import curve_fit, least_squares
 from numpy import ndarray
 from typing import Callable
+from functools import partial
+import numpy as np
 from quickBayes.fitting.fit_engine import FitEngine
 
 
+METHODS = ['curve_fit', 'least_squares']
+
+
+class WeightedResiduals(object):
+    """
+    The weighted residuals, (f(x) - y)/e, for a data set.
+    The weights (1/e) and the weighted y values are
+    calculated once, so they can be reused for every
+    fit to the same data.
+    """
+    def __init__(self, x_data: ndarray, y_data: ndarray, e_data: ndarray):
+        """
+        Stores the data and calculates the weights
+        :param x_data: the x data to fit
+        :param y_data: the y data to fit
+        :param e_data: the error data to fit
+        """
+        self._x = np.asarray(x_data, dtype=float)
+        self._y = np.asarray(y_data, dtype=float)
+        self._e = np.asarray(e_data, dtype=float)
+        self._w = 1./self._e
+        self._yw = self._y*self._w
+
+    def matches(self, x_data: ndarray, y_data: ndarray,
+                e_data: ndarray) -> bool:
+        """
+        Checks if the data is the same as the stored data
+        :param x_data: the x data to fit
+        :param y_data: the y data to fit
+        :param e_data: the error data to fit
+        :return if the data is the same
+        """
+        return all(new is old or np.array_equal(new, old)
+                   for new, old in zip((x_data, y_data, e_data),
+                                       (self._x, self._y, self._e)))
+
+    def residuals(self, params: ndarray, func: Callable) -> ndarray:
+        """
+        :param params: the fit parameters
+        :param func: the fitting function
+        :return the weighted residuals
+        """
+        return func(self._x, *params)*self._w - self._yw
+
+    def jacobian(self, params: ndarray, func: Callable) -> ndarray:
+        """
+        The weighted analytic derivatives of the residuals
+        :param params: the fit parameters
+        :param func: the fitting function
+        :return the derivatives, shape len(x_data) by N_params
+        """
+        return (func.jacobian(self._x, *params)*self._w).T
+
+    def unweighted(self, jac: ndarray) -> ndarray:
+        """
+        Removes the weights from the derivatives of the residuals
+        :param jac: the weighted derivatives (len(x_data) by N_params)
+        :return the derivatives of the function (N_params by len(x_data))
+        """
+        return jac.T*self._e
+
+
+def covariance_from_jacobian(jac: ndarray) -> ndarray:
+    """
+    Calculates the covariance matrix, (J^T J)^{-1}, from the
+    derivatives of the weighted residuals. This matches
+    curve fit with absolute sigma.
+    :param jac: the weighted derivatives (len(x_data) by N_params)
+    :return the covariance matrix
+    """
+    # use the pseudo inverse, in case the matrix is singular
+    _, s, VT = np.linalg.svd(jac, full_matrices=False)
+    threshold = np.finfo(float).eps*max(jac.shape)*s[0]
+    s = s[s > threshold]
+    VT = VT[:s.size]
+    return np.dot(VT.T/s**2, VT)
+
+
 class ScipyFitEngine(FitEngine):
     """
     A scipy curve fit fit engine.
     This will use scipy's curve fit to
     fit data.
+    The least_squares method calls scipy's least squares
+    directly. It keeps the weighted data between fits
+    (if the data does not change) and reuses the derivatives
+    from the fit for the covariance matrix and fit errors.
     """
 
     def __init__(self, x_data: ndarray, y_data: ndarray, e_data: ndarray,
                  lower: ndarray, upper: ndarray, guess: ndarray,
-                 max_iterations: int = 220000):
+                 max_iterations: int = 220000, method: str = 'curve_fit'):
         """
         Creates the scipy curve fit engine class
         Stores useful information about each fit
@@ -25,11 +109,34 @@ class ScipyFitEngine(FitEngine):
         :param upper: the upper bounds for the fit parameters
         :param guess: the initial guess for the fit parameters
         :param max_iterations: the maximum number of iterations for the fit
+        :param method: the fitting method (curve_fit or least_squares)
         """
         super().__init__("scipy", x_data, y_data, e_data)
+        if method not in METHODS:
+            raise ValueError(f"The method {method} is not valid, "
+                             f"please use one of {METHODS}")
         # extra parameters
         self.set_guess_and_bounds(guess, lower, upper)
         self._max_iterations = max_iterations
+        self._method = method
+        self._residuals = None
+        self._df_by_dp = None
+
+    @property
+    def method(self) -> str:
+        """
+        :return the fitting method
+        """
+        return self._method
+
+    def _reset(self) -> None:
+        """
+        Removes the history, the values for the current
+        fit and the weighted data
+        """
+        super()._reset()
+        self._residuals = None
+        self._df_by_dp = None
 
     def set_guess_and_bounds(self, guess: ndarray,
                              lower: ndarray, upper: ndarray) -> None:
@@ -53,19 +160,86 @@ class ScipyFitEngine(FitEngine):
     def _do_fit(self, x_data: ndarray, y_data: ndarray, e_data: ndarray,
                 func: Callable) -> ndarray:
         """
-        Calls scipy curve fit
+        Calls scipy curve fit.
+        If the function has analytic derivatives they are used.
         :param x_data: the x data to fit
         :param y_data: the y data to fit
         :param e_data: the error data to fit
         :return the fit parameters
         """
+        if self._method == 'least_squares':
+            return self._do_least_squares(x_data, y_data, e_data, func)
+
+        jac = None
+        if getattr(func, 'has_jacobian', False):
+            jac = partial(self._jacobian, func)
+
         params, covar = curve_fit(func, x_data, y_data, self._guess,
                                   sigma=e_data, absolute_sigma=True,
                                   maxfev=self._max_iterations,
-                                  bounds=(self._lower, self._upper))
-        self._covars.append(covar)
+                                  bounds=(self._lower, self._upper),
+                                  jac=jac)
+        self._set_covariance(covar)
         return params
 
+    def _do_least_squares(self, x_data: ndarray, y_data: ndarray,
+                          e_data: ndarray, func: Callable) -> ndarray:
+        """
+        Calls scipy least squares with the weighted residuals.
+        The weighted data is only recalculated if the data changes.
+        :param x_data: the x data to fit
+        :param y_data: the y data to fit
+        :param e_data: the error data to fit
+        :param func: the fitting function
+        :return the fit parameters
+        """
+        if (self._residuals is None or
+                not self._residuals.matches(x_data, y_data, e_data)):
+            self._residuals = WeightedResiduals(x_data, y_data, e_data)
+
+        jac = '2-point'
+        if getattr(func, 'has_jacobian', False):
+            jac = self._residuals.jacobian
+
+        result = least_squares(self._residuals.residuals, self._guess,
+                               jac=jac, bounds=(self._lower, self._upper),
+                               method='trf', max_nfev=self._max_iterations,
+                               args=(func,))
+        if not result.success:
+            raise RuntimeError("Optimal parameters not found: " +
+                               result.message)
+        # trf evaluates the Jacobian once per iteration
+        self._add_iterations(result.njev)
+        self._set_covariance(covariance_from_jacobian(result.jac))
+        self._df_by_dp = self._residuals.unweighted(result.jac)
+        return result.x
+
+    def _get_derivatives(self, x_data: ndarray, params: ndarray,
+                         func: Callable) -> ndarray:
+        """
+        Gets the derivatives of the function at the fit parameters.
+        For least squares these are from the fit.
+        :param x_data: the x data
+        :param params: the fit parameters
+        :param func: the fitting function
+        :return the derivatives (N_params by len(x_data))
+        """
+        df_by_dp, self._df_by_dp = self._df_by_dp, None
+        if df_by_dp is not None:
+            return df_by_dp
+        return super()._get_derivatives(x_data, params, func)
+
+    @staticmethod
+    def _jacobian(func: Callable, x_data: ndarray, *params) -> ndarray:
+        """
+        The analytic derivatives in the form expected by curve fit
+        :param func: the fitting function
+        :param x_data: the x data
+        :param params: the fit parameters
+        :return the derivatives, shape len(x_data) by N_params
+        """
+        return func.jacobian(x_data, *params).T
+
     def calculate_covar(self, x_data: ndarray, y_data: ndarray,
                         e_data: ndarray,
                         func: Callable, df_by_dp: ndarray,
@@ -1,4 +1,4 @@
-from quickBayes.functions.base import BaseFitFunction
+from quickBayes.functions.base import BaseFitFunction, work_array
 from numpy import ndarray
 import numpy as np
 from typing import Dict, List
@@ -21,6 +21,33 @@ class NoBG(BaseFitFunction):
         """
         return np.zeros(len(x))
 
+    def evaluate_into(self, x: ndarray, out: ndarray) -> ndarray:
+        """
+        There is no background, so nothing is added
+        :param x: x values
+        :param out: the array to add the values to
+        :return the out array
+        """
+        return out
+
+    def batch_call(self, x: ndarray, P: ndarray) -> ndarray:
+        """
+        Evaluate the function for a batch of parameter sets
+        :param x: x values
+        :param P: the parameter sets (n_sets, N_params)
+        :return y values for each parameter set (n_sets, len(x))
+        """
+        P = self._batch_params(P)
+        return np.zeros((len(P), len(x)))
+
+    def jacobian(self, x: ndarray) -> ndarray:
+        """
+        There are no parameters, so no derivatives
+        :param x: x values
+        :return an empty array of derivatives
+        """
+        return np.zeros((0, len(x)))
+
     def read_from_report(self, report_dict: Dict[str, List[float]],
                          index: int = 0) -> List[float]:
         """
@@ -63,6 +90,36 @@ class FlatBG(BaseFitFunction):
         """
         return c*np.ones(len(x))
 
+    def evaluate_into(self, x: ndarray, out: ndarray, c: float) -> ndarray:
+        """
+        Adds the flat BG to an existing array (in place)
+        :param x: x values
+        :param out: the array to add the values to
+        :param c: constant
+        :return the out array
+        """
+        out += c
+        return out
+
+    def batch_call(self, x: ndarray, P: ndarray) -> ndarray:
+        """
+        Evaluate the function for a batch of parameter sets
+        :param x: x values
+        :param P: the parameter sets (n_sets, N_params)
+        :return y values for each parameter set (n_sets, len(x))
+        """
+        c = self._batch_columns(P)[0]
+        return self(x, c)
+
+    def jacobian(self, x: ndarray, c: float) -> ndarray:
+        """
+        The analytic derivatives of the flat BG
+        :param x: x values
+        :param c: constant
+        :return derivative wrt the constant
+        """
+        return np.ones((1, len(x)))
+
     def read_from_report(self, report_dict: Dict[str, List[float]],
                          index: int = 0) -> List[float]:
         """
@@ -113,6 +170,42 @@ class LinearBG(BaseFitFunction):
         """
         return m*x + c
 
+    def evaluate_into(self, x: ndarray, out: ndarray,
+                      m: float, c: float) -> ndarray:
+        """
+        Adds the linear BG to an existing array (in place)
+        :param x: x values
+        :param out: the array to add the values to
+        :param m: gradient
+        :param c: constant
+        :return the out array
+        """
+        with work_array(len(x)) as work:
+            np.multiply(x, m, out=work)
+            work += c
+            out += work
+        return out
+
+    def batch_call(self, x: ndarray, P: ndarray) -> ndarray:
+        """
+        Evaluate the function for a batch of parameter sets
+        :param x: x values
+        :param P: the parameter sets (n_sets, N_params)
+        :return y values for each parameter set (n_sets, len(x))
+        """
+        m, c = self._batch_columns(P)
+        return self(x, m, c)
+
+    def jacobian(self, x: ndarray, m: float, c: float) -> ndarray:
+        """
+        The analytic derivatives of the linear BG
+        :param x: x values
+        :param m: gradient
+        :param c: constant
+        :return derivatives wrt the gradient and constant
+        """
+        return np.array([np.asarray(x, dtype=float), np.ones(len(x))])
+
     def read_from_report(self, report_dict: Dict[str, List[float]],
                          index: int = 0) -> List[float]:
         """
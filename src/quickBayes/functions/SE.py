@@ -1,8 +1,10 @@
 from quickBayes.functions.base import BaseFitFunction
+from quickBayes.utils.cache import LRUCache
 from numpy import ndarray
 import numpy as np
 from typing import Dict, List
 from scipy.fftpack import fft, fftfreq
+from scipy.integrate import quad
 from scipy.special import gamma
 from scipy import constants
 
@@ -15,6 +17,8 @@ https://github.com/mantidproject/mantid/blob/main/Framework/PythonInterface/plug
 
 
 PLANCK_CONSTANT = constants.Planck / constants.e * 1.e15  # meV*psec
+# cache for the FFT of the stretched exponential
+SE_CACHE = LRUCache(maxsize=8)
 
 
 def function1Dcommon(xvals: ndarray, tau: float, beta: float,
@@ -65,15 +69,370 @@ def function1Dcommon(xvals: ndarray, tau: float, beta: float,
     return energies, fourier
 
 
+def fft_period(xvals: ndarray) -> float:
+    """
+    The FFT in function1Dcommon is periodic in energy, the
+    period is twice the energy range of the FFT
+    :param xvals: energy domain
+    :return the period of the FFT
+    """
+    return 4.*np.max(np.abs(xvals))
+
+
+def cached_function1Dcommon(xvals: ndarray, tau: float, beta: float,
+                            refine_factor=16) -> (ndarray, ndarray):
+    """
+    The same as function1Dcommon, but the results are stored
+    in a least recently used cache (SE_CACHE). The results only
+    depend on the x grid via its length, first, last and largest
+    absolute values. The returned arrays are read only.
+    :param xvals: energy domain
+    :param tau: relaxation time
+    :param beta: stretching exponenet
+    :param refine_factor: divide the natural energy width by this value
+    :return: energies, and function values
+    """
+    key = (len(xvals), float(xvals[0]), float(xvals[-1]),
+           float(max(abs(xvals))), float(tau), float(beta), refine_factor)
+    result = SE_CACHE.get(key)
+    if result is None:
+        energies, fourier = function1Dcommon(xvals, tau, beta, refine_factor)
+        energies.setflags(write=False)
+        fourier.setflags(write=False)
+        result = (energies, fourier)
+        SE_CACHE.set(key, result)
+    return result
+
+
+class StretchExpTable(object):
+    """
+    A precomputed table of the stretched exponential.
+    The Fourier transform of exp(-(|t|/tau)^beta) can be written as
+    S(E) = tau/h phi(|E|tau/h; beta), so a single 2D table of phi in
+    the reduced variable w = |E|tau/h against beta is needed.
+    The table is interpolated, instead of doing an FFT for every
+    evaluation. Above the maximum w the power law tail,
+    w^-(1+beta), is used.
+    The FFT (function1Dcommon) is periodic in energy, so broad
+    peaks overlap with their periodic images. This can be
+    included by giving the period, which is how StretchExp uses
+    the table, so that it is the same function as the FFT.
+    """
+    def __init__(self, beta_min: float = 0.25, N_beta: int = 76,
+                 w_max: float = 500., N_w: int = 1200,
+                 tolerance: float = 1.e-3, check_x: ndarray = None,
+                 check_taus: List[float] = (1., 6.582),
+                 refine_factor: int = 256):
+        """
+        Create the table. The accuracy is checked, against a
+        direct numerical integration, between each of the beta
+        and w values. It is also checked against the FFT
+        (function1Dcommon) for the check_x and check_taus values.
+        :param beta_min: the smallest beta value in the table
+        :param N_beta: the number of beta values (from beta_min to 1),
+        these are evenly spaced in 1/beta as the function changes
+        fastest for small beta
+        :param w_max: the largest value of the reduced energy in the table
+        :param N_w: the number of reduced energy values
+        :param tolerance: the largest error allowed (relative to the peak)
+        :param check_x: the energies to compare to the FFT at,
+        if None (default) 400 values from -0.4 to 0.4 are used
+        :param check_taus: the tau values to compare to the FFT at
+        :param refine_factor: the refine factor for the FFT in the check.
+        The FFT is truncated for small beta and large tau, so the
+        default value is larger than the one used by StretchExp
+        """
+        self._betas = 1./np.linspace(1./beta_min, 1., N_beta)
+        self._w_max = w_max
+        # linear near zero (the cusp for small beta)
+        # and logarithmic for large w
+        self._w_scale = 1.e-4
+        self._s = np.linspace(0., np.arcsinh(w_max/self._w_scale), N_w)
+        self._w = self._w_scale*np.sinh(self._s)
+
+        self._table = np.array([self._row(beta) for beta in self._betas])
+        self._integrals = np.array([self._integrate(row)
+                                    for row in self._table])
+        self.error = self._check_accuracy()
+        if check_x is None:
+            check_x = np.linspace(-0.4, 0.4, 400)
+        self.fft_error = self._check_fft(check_x, check_taus,
+                                         refine_factor)
+        for name, error in [('quadrature', self.error),
+                            ('FFT', self.fft_error)]:
+            if error > tolerance:
+                raise ValueError(f"The stretched exponential table has an "
+                                 f"error of {error} (compared to the "
+                                 f"{name}), which is larger than the "
+                                 f"tolerance {tolerance}. Please use more "
+                                 "beta or w values.")
+
+    def __deepcopy__(self, memo: dict):
+        """
+        The table does not change, so can be shared
+        :param memo: the memo dict for deepcopy
+        :return the table
+        """
+        return self
+
+    @property
+    def beta_min(self) -> float:
+        """
+        :return the smallest beta value in the table
+        """
+        return self._betas[0]
+
+    @staticmethod
+    def _peak(beta: ndarray) -> ndarray:
+        """
+        The peak value of the reduced function
+        :param beta: the stretching exponent
+        :return phi(0; beta)
+        """
+        return 2.*gamma(1./beta)/beta
+
+    @staticmethod
+    def _transform(w: ndarray, beta: float, step: float = 0.1,
+                   angle: float = np.pi/4.) -> ndarray:
+        """
+        Calculate the reduced function
+        phi(w) = 2 int_0^inf exp(-u^beta) cos(2 pi w u) du.
+        The integral is oscillatory and decays slowly for small
+        beta, which makes an FFT inaccurate (it is truncated).
+        So the path of the integral is rotated, u = s exp(i angle),
+        into the complex plane where the integrand decays
+        exponentially. The integral is then done with the
+        trapezium rule in log(s), which converges quickly.
+        :param w: the reduced energies
+        :param beta: the stretching exponent
+        :param step: the step size in log(s)
+        :param angle: the angle to rotate the path by
+        :return the reduced function values for the w values
+        """
+        decay = np.cos(beta*angle)
+        # the integrand is less than exp(-40) at the end
+        t = np.arange(np.log(1.e-12),
+                      np.log(40./decay)/beta + step, step)
+        rotation = np.exp(1j*angle)
+        path = np.exp(t)*rotation
+        x = 2.*np.pi*np.asarray(w, dtype=float)[:, np.newaxis]
+        integrand = np.exp(-np.exp(beta*t + 1j*beta*angle) +
+                           1j*x*path)*path
+        return 2.*step*np.sum(integrand, axis=1).real
+
+    @staticmethod
+    def _quadrature(w: float, beta: float) -> float:
+        """
+        Calculate the reduced function, phi(w), with scipy's
+        quad (for Fourier integrals). This is slow, but is
+        independent of the method used for the table.
+        :param w: the reduced energy
+        :param beta: the stretching exponent
+        :return the reduced function value
+        """
+        if w == 0.:
+            return StretchExpTable._peak(beta)
+
+        def decay(u):
+            return np.exp(-u**beta)
+
+        # the integrand is less than exp(-40) after the end
+        end = 40.**(1./beta)
+        if w*end < 100.:
+            # there are too few oscillations for the infinite range
+            return 2.*quad(decay, 0., end, weight='cos',
+                           wvar=2.*np.pi*w, limit=200)[0]
+        return 2.*quad(decay, 0., np.inf, weight='cos', wvar=2.*np.pi*w)[0]
+
+    def _row(self, beta: float) -> ndarray:
+        """
+        Calculate the reduced function, normalised so
+        that the peak is one.
+        :param beta: the stretching exponent
+        :return the reduced function values for the w grid
+        """
+        return self._transform(self._w, beta)/self._peak(beta)
+
+    def _integrate(self, row: ndarray) -> ndarray:
+        """
+        The integral of a row from each w value to the maximum w
+        (trapezium rule). This is used for the periodic images
+        that are far from the peak.
+        :param row: the normalised reduced function for the w grid
+        :return the integrals for the w grid
+        """
+        segments = 0.5*(row[1:] + row[:-1])*np.diff(self._w)
+        return np.append(np.cumsum(segments[::-1])[::-1], 0.)
+
+    def _check_accuracy(self, N_check: int = 24) -> float:
+        """
+        Compares the interpolated table to a direct numerical
+        integration (quad). This is at the midpoints of the
+        beta values and at N_check midpoints between the w
+        values (and in the tail above the maximum w).
+        :param N_check: the number of w values to check
+        :return the largest error, relative to the peak value
+        """
+        step = max(1, (len(self._s) - 1)//N_check)
+        s = 0.5*(self._s[:-1:step] + self._s[1::step])
+        w = np.append(self._w_scale*np.sinh(s),
+                      [1.5*self._w_max, 4.*self._w_max])
+        tau = PLANCK_CONSTANT
+        error = 0.
+        for j in range(len(self._betas) - 1):
+            beta = 0.5*(self._betas[j] + self._betas[j + 1])
+            expect = np.array([self._quadrature(value, beta)
+                               for value in w])
+            diff = np.abs(self(w, tau, beta) - expect)/self._peak(beta)
+            error = max(error, np.max(diff))
+        return error
+
+    def _check_fft(self, x: ndarray, taus: List[float],
+                   refine_factor: int, N_check: int = 8) -> float:
+        """
+        Compares the interpolated table, with the periodic images,
+        to the FFT (function1Dcommon). This is at N_check midpoints
+        of the beta values (including the smallest).
+        :param x: the energies
+        :param taus: the relaxation times
+        :param refine_factor: the refine factor for the FFT
+        :param N_check: the number of beta values to check
+        :return the largest error, relative to the peak value
+        """
+        period = fft_period(x)
+        step = max(1, (len(self._betas) - 1)//N_check)
+        error = 0.
+        for j in range(0, len(self._betas) - 1, step):
+            beta = 0.5*(self._betas[j] + self._betas[j + 1])
+            for tau in taus:
+                energies, fourier = function1Dcommon(x, tau, beta,
+                                                     refine_factor)
+                expect = np.interp(x, energies, fourier)
+                diff = np.abs(self(x, tau, beta, period) - expect)
+                error = max(error, np.max(diff)/np.max(expect))
+        return error
+
+    def in_range(self, beta: float) -> bool:
+        """
+        :param beta: the stretching exponent
+        :return if the beta value is covered by the table
+        """
+        return self._betas[0] <= beta <= self._betas[-1]
+
+    def _interp_beta(self, table: ndarray, beta: float) -> ndarray:
+        """
+        Linear interpolation between the rows of a table
+        :param table: the table (either the values or the integrals)
+        :param beta: the stretching exponent
+        :return the interpolated row for the w grid
+        """
+        index = np.searchsorted(self._betas, beta, side='right') - 1
+        index = min(max(index, 0), len(self._betas) - 2)
+        frac = ((beta - self._betas[index]) /
+                (self._betas[index + 1] - self._betas[index]))
+        return (1. - frac)*table[index] + frac*table[index + 1]
+
+    def _lookup(self, w: ndarray, row: ndarray, beta: float) -> ndarray:
+        """
+        :param w: the reduced energies (not negative)
+        :param row: the normalised reduced function for the w grid
+        :param beta: the stretching exponent
+        :return the normalised reduced function for the w values
+        """
+        phi = np.interp(np.arcsinh(w/self._w_scale), self._s, row)
+        tail = w > self._w_max
+        phi[tail] = row[-1]*np.power(w[tail]/self._w_max, -(1. + beta))
+        return phi
+
+    def _lookup_integral(self, w: ndarray, row: ndarray,
+                         integral: ndarray, beta: float) -> ndarray:
+        """
+        :param w: the reduced energies (not negative)
+        :param row: the normalised reduced function for the w grid
+        :param integral: the integrals of the row for the w grid
+        :param beta: the stretching exponent
+        :return the integral of the normalised reduced function
+        from the w values to infinity
+        """
+        tail_integral = row[-1]*self._w_max/beta
+        value = np.interp(np.arcsinh(w/self._w_scale), self._s,
+                          integral) + tail_integral
+        tail = w > self._w_max
+        value[tail] = tail_integral*np.power(w[tail]/self._w_max, -beta)
+        return value
+
+    def _periodic(self, u: ndarray, w_period: float, row: ndarray,
+                  integral: ndarray, beta: float,
+                  N_images: int = 8) -> ndarray:
+        """
+        The sum of the periodic images of the normalised reduced
+        function. The nearest N_images on each side are added up
+        and the rest are approximated by an integral (midpoint rule),
+        as they are many and change slowly.
+        :param u: the reduced energies (with a sign)
+        :param w_period: the period in reduced energy
+        :param row: the normalised reduced function for the w grid
+        :param integral: the integrals of the row for the w grid
+        :param beta: the stretching exponent
+        :param N_images: the number of images to add up on each side
+        :return the sum of the images for the u values
+        """
+        k = np.arange(-N_images, N_images + 1)[:, np.newaxis]
+        images = self._lookup(np.abs(u + k*w_period).ravel(), row, beta)
+        total = np.sum(images.reshape(len(k), len(u)), axis=0)
+        edge = (N_images + 0.5)*w_period
+        total += (self._lookup_integral(edge + u, row, integral, beta) +
+                  self._lookup_integral(edge - u, row, integral, beta)
+                  )/w_period
+        return total
+
+    def __call__(self, energies: ndarray, tau: float,
+                 beta: float, period: float = None) -> ndarray:
+        """
+        Evaluate the Fourier transform of the stretched exponential
+        :param energies: the energy values
+        :param tau: relaxation time
+        :param beta: stretching exponent (must be in range)
+        :param period: if None (default) the exact function is used.
+        Otherwise, the periodic images are added and the peak value
+        is kept (the same as the FFT, see fft_period)
+        :return the function values
+        """
+        if not self.in_range(beta):
+            raise ValueError(f"beta = {beta} is outside of the table")
+        row = self._interp_beta(self._table, beta)
+        w = np.asarray(energies, dtype=float)*tau/PLANCK_CONSTANT
+        if period is None:
+            phi = self._lookup(np.abs(w), row, beta)
+        else:
+            integral = self._interp_beta(self._integrals, beta)
+            w_period = period*tau/PLANCK_CONSTANT
+            # the FFT is only for one period, the values are
+            # constant outside of it
+            u = np.clip(w, -0.5*w_period, 0.5*w_period)
+            phi = (self._periodic(u, w_period, row, integral, beta) /
+                   self._periodic(np.zeros(1), w_period, row,
+                                  integral, beta))
+        return phi*self._peak(beta)*tau/PLANCK_CONSTANT
+
+
 class StretchExp(BaseFitFunction):
-    def __init__(self, prefix: str = ''):
+    def __init__(self, prefix: str = '', table: StretchExpTable = None):
         """
         Create a stretched exponenetial function
         :param prefix: the prefix for the parameters
+        :param table: the precomputed table to use for the evaluation.
+        If None (default) or beta is not in the table, the FFT is used.
+        The lower bound for beta is the smallest beta in the table.
         """
+        self._table = table
+        lower = [0., -1., 0, 0]
+        if table is not None:
+            # keep the fits in the table
+            lower[3] = table.beta_min
         super().__init__(4, prefix,
                          [.1, 0.0, 6.582, 0.7],  # 6.582 -> FWHM = 0.2
-                         [0., -1., 0, 0], [1., 1., 100., 1.])
+                         lower, [1., 1., 100., 1.])
 
     @property
     def amplitude(self) -> str:
@@ -117,8 +476,11 @@ class StretchExp(BaseFitFunction):
         :param beta: stretching exponent
         :return y values for function evaluation
         """
+        if self._table is not None and self._table.in_range(beta):
+            return amplitude*self._table(x - x0, tau, beta,
+                                         fft_period(x))
 
-        energies, fourier = function1Dcommon(x, tau, beta)
+        energies, fourier = cached_function1Dcommon(x, tau, beta)
         return amplitude*np.interp(x - x0,
                                    energies, fourier)
 
@@ -1,20 +1,22 @@
-from quickBayes.functions.SE import StretchExp
+from quickBayes.functions.SE import StretchExp, StretchExpTable
 from numpy import ndarray
 from typing import Dict, List
 
 
 class StretchExpWithFixes(StretchExp):
-    def __init__(self, FWHM: float = 0.2, beta: float = 0.8, prefix: str = ''):
+    def __init__(self, FWHM: float = 0.2, beta: float = 0.8, prefix: str = '',
+                 table: StretchExpTable = None):
         """
         Create a stretched exponential function with 2 fixed parameters.
         :param FWHM: full width half max value for the fix
         :param beta: the beta value for the fix
         :param prefix: the prefix for the parameters
+        :param table: the precomputed table to use (None for the FFT)
         """
         self._func = StretchExp()
         self.set_beta(beta)
         self.set_FWHM(FWHM)
-        super().__init__(prefix)
+        super().__init__(prefix, table)
         # change stuff for 2 free parameters
         self._N_params = 2
         self._guess = self._guess[0:2]
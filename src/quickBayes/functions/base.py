@@ -1,6 +1,9 @@
-from typing import Dict, List
+from typing import Dict, Iterator, List
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from numpy import ndarray
+import numpy as np
+import threading
 
 
 """
@@ -11,6 +14,37 @@ from it
 """
 
 
+# the work arrays for evaluate_into, one pool per thread
+_scratch = threading.local()
+# the number of different lengths of work array to keep
+MAX_WORK_LENGTHS = 8
+
+
+@contextmanager
+def work_array(N: int) -> Iterator[ndarray]:
+    """
+    Gets a work array for evaluate_into. The arrays are
+    kept in a pool for the current thread and reused, so
+    they are only created when a new length is needed.
+    The array is only in use inside of the with block,
+    so nested calls (e.g. a convolution of a Lorentzian)
+    and other threads get their own arrays.
+    :param N: the length of the array
+    :return the work array (the values are not set)
+    """
+    pool = getattr(_scratch, 'pool', None)
+    if pool is None:
+        pool = _scratch.pool = {}
+    free = pool.get(N)
+    work = free.pop() if free else np.empty(N)
+    try:
+        yield work
+    finally:
+        if N not in pool and len(pool) >= MAX_WORK_LENGTHS:
+            pool.clear()
+        pool.setdefault(N, []).append(work)
+
+
 class BaseFitFunction(ABC):
     """
     A basic class outline for fit functions
@@ -31,6 +65,21 @@ class BaseFitFunction(ABC):
         self.set_bounds(lower, upper)
         return
 
+    def __init_subclass__(cls, **kwargs):
+        """
+        If a class changes __call__, but not evaluate_into,
+        then the inherited evaluate_into may no longer match.
+        So the default (which uses __call__) is used instead.
+        The same is true for the analytic derivatives, so if
+        jacobian is not changed the derivatives are dropped
+        (the fit engines will use numerical derivatives).
+        """
+        super().__init_subclass__(**kwargs)
+        if '__call__' in cls.__dict__ and 'evaluate_into' not in cls.__dict__:
+            cls.evaluate_into = BaseFitFunction.evaluate_into
+        if '__call__' in cls.__dict__ and 'jacobian' not in cls.__dict__:
+            cls.jacobian = BaseFitFunction.jacobian
+
     def update_prefix(self, new: str) -> None:
         """
         Updates the begining of the prefix (before ":")
@@ -142,6 +191,81 @@ class BaseFitFunction(ABC):
         """
         raise NotImplementedError()
 
+    def evaluate_into(self, x: ndarray, out: ndarray,
+                      *kwargs: float) -> ndarray:
+        """
+        Adds the function values to an existing array (in place).
+        This allows sums of functions to be evaluated without
+        creating a new array for each function.
+        By default this calls the function, functions should
+        override this if they can avoid creating new arrays.
+        :param x: x values for function evaluation
+        :param out: the array to add the values to (same length as x)
+        :param kwargs: parameters for the function
+        :return the out array
+        """
+        out += self(x, *kwargs)
+        return out
+
+    def _batch_params(self, P: ndarray) -> ndarray:
+        """
+        Checks the shape of a batch of parameters
+        :param P: the batch of parameters (n_sets, N_params)
+        :return the batch of parameters as a 2D array
+        """
+        P = np.asarray(P, dtype=float)
+        if P.ndim == 1:
+            P = P.reshape(1, len(P))
+        if P.ndim != 2 or P.shape[1] != self.N_params:
+            raise ValueError(f"Expected the parameters to have shape "
+                             f"(n_sets, {self.N_params}), got {P.shape}")
+        return P
+
+    def _batch_columns(self, P: ndarray) -> List[ndarray]:
+        """
+        Splits a batch of parameters into columns, with
+        shape (n_sets, 1), that broadcast against x.
+        :param P: the batch of parameters (n_sets, N_params)
+        :return a list of the columns, one per parameter
+        """
+        P = self._batch_params(P)
+        return [P[:, j:j+1] for j in range(self.N_params)]
+
+    def batch_call(self, x: ndarray, P: ndarray) -> ndarray:
+        """
+        Evaluate the function for a batch of parameter sets.
+        By default this loops over the parameter sets, functions
+        should override this to use broadcasting if they can.
+        :param x: x values for function evaluation
+        :param P: the parameter sets (n_sets, N_params)
+        :return y values for each parameter set (n_sets, len(x))
+        """
+        P = self._batch_params(P)
+        result = np.zeros((len(P), len(x)))
+        for j, params in enumerate(P):
+            result[j] = self(x, *params)
+        return result
+
+    def jacobian(self, x: ndarray, *kwargs: float) -> ndarray:
+        """
+        Implement the analytic derivatives of the function
+        with respect to its parameters. This is optional,
+        if it is not implemented the fit engines will use
+        numerical derivatives.
+        :param x: x values for function evaluation
+        :param kwargs: parameters for the function
+        :return the derivatives, one row per parameter
+        (shape N_params by len(x))
+        """
+        raise NotImplementedError()
+
+    @property
+    def has_jacobian(self) -> bool:
+        """
+        :return if the function has analytic derivatives
+        """
+        return type(self).jacobian is not BaseFitFunction.jacobian
+
     def _check_length(self, values: List[float], label: str) -> None:
         """
         Runs a check that the input has a value for each of the
@@ -65,6 +65,68 @@ class CompositeFunction(BaseFitFunction):
             result += func(x, *fun_args[j])
         return result
 
+    def evaluate_into(self, x: ndarray, out: ndarray, *args) -> ndarray:
+        """
+        Adds the sum of functions to an existing array (in place).
+        Each function adds its values directly to the array.
+        :param x: x values for function evaluation
+        :param out: the array to add the values to
+        :param args: parameters for functions
+        :return the out array
+        """
+        if len(self._funcs) == 0:
+            return out
+        elif len(args) != self.N_params:
+            raise ValueError(f"Expected {self.N_params} args, got {len(args)}")
+
+        j = 0
+        for func in self._funcs:
+            N = func.N_params
+            func.evaluate_into(x, out, *args[j:j+N])
+            j += N
+        return out
+
+    def batch_call(self, x: ndarray, P: ndarray) -> ndarray:
+        """
+        Evaluate the sum of functions for a batch of parameter sets
+        :param x: x values for function evaluation
+        :param P: the parameter sets (n_sets, N_params)
+        :return y values for each parameter set (n_sets, len(x))
+        """
+        P = self._batch_params(P)
+        result = np.zeros((len(P), len(x)))
+        j = 0
+        for func in self._funcs:
+            N = func.N_params
+            result += func.batch_call(x, P[:, j:j+N])
+            j += N
+        return result
+
+    def jacobian(self, x: ndarray, *args) -> ndarray:
+        """
+        The analytic derivatives of the sum of functions.
+        Only available if all of the functions have them.
+        :param x: x values for function evaluation
+        :param args: parameters for functions
+        :return the derivatives, one row per parameter
+        """
+        if len(self._funcs) == 0:
+            return np.zeros((0, len(x)))
+        elif len(args) != self.N_params:
+            raise ValueError(f"Expected {self.N_params} args, got {len(args)}")
+
+        fun_args = self.split_args(list(args))
+        return np.concatenate([func.jacobian(x, *fun_args[j])
+                               for j, func in enumerate(self._funcs)])
+
+    @property
+    def has_jacobian(self) -> bool:
+        """
+        :return if all of the functions have analytic derivatives
+        """
+        return (super().has_jacobian and
+                all(func.has_jacobian for func in self._funcs))
+
     def read_from_report(self, report_dict: Dict[str, List[float]],
                          index: int = 0) -> List[float]:
         """
@@ -1,9 +1,10 @@
-from quickBayes.functions.base import BaseFitFunction
+from quickBayes.functions.base import BaseFitFunction, work_array
 from quickBayes.functions.composite import CompositeFunction
 from quickBayes.utils.crop_data import crop
 from quickBayes.utils.spline import spline
 from numpy import ndarray
-from scipy import signal
+import numpy as np
+from scipy import fft
 import copy
 
 
@@ -25,6 +26,7 @@ class ConvolutionWithResolution(CompositeFunction):
         self._rx, self._ry, _ = crop(self._rx, self._ry, None, start_x, end_x)
         # this is to normalise the kernal to get correct amplitudes
         self._ry /= sum(self._ry)
+        self._kernel = None
 
     def update_x_range(self, new_x: ndarray) -> None:
         """
@@ -38,6 +40,38 @@ class ConvolutionWithResolution(CompositeFunction):
         self._ry = spline(self._rx, self._ry, new_x)
         self._ry /= sum(self._ry)
         self._rx = new_x
+        self._kernel = None
+
+    def _get_kernel(self, N: int) -> (int, ndarray):
+        """
+        Gets the FFT of the resolution function for
+        data of length N. This is cached, as the resolution
+        does not change during a fit.
+        :param N: the number of data points
+        :return the length of the FFT and the FFT of the resolution
+        """
+        if self._kernel is None or self._kernel[0] != N:
+            # pad to avoid wrapping (i.e. a linear convolution)
+            length = fft.next_fast_len(N + len(self._ry) - 1, real=True)
+            self._kernel = (N, length, fft.rfft(self._ry, length))
+        return self._kernel[1], self._kernel[2]
+
+    def _convolve(self, values: ndarray) -> ndarray:
+        """
+        Convolves the values with the resolution function,
+        the output is the same length as the input.
+        If the values are 2D then each row is convolved.
+        This is equivalent to
+        scipy.signal.convolve(values, ry, mode='same')
+        :param values: the values to convolve (1D or 2D)
+        :return the convolved values
+        """
+        N = values.shape[-1]
+        length, kernel = self._get_kernel(N)
+        result = fft.irfft(fft.rfft(values, length, axis=-1)*kernel,
+                           length, axis=-1)
+        start = (len(self._ry) - 1)//2
+        return result[..., start:start + N]
 
     def update_prefix(self, new: str) -> None:
         """
@@ -69,4 +103,47 @@ class ConvolutionWithResolution(CompositeFunction):
         """
         result = super().__call__(x, *args)
         # assume rx and x are the same
-        return signal.convolve(result, self._ry, mode='same')
+        return self._convolve(result)
+
+    def evaluate_into(self, x: ndarray, out: ndarray, *args) -> ndarray:
+        """
+        Adds the convolution to an existing array (in place).
+        The functions are summed into a work array, which
+        is then convolved with the resolution.
+        :param x: x range to calculate function over
+        :param out: the array to add the values to
+        :param args: the arguments for the convolution function
+        :return the out array
+        """
+        with work_array(len(x)) as work:
+            work.fill(0.)
+            super().evaluate_into(x, work, *args)
+            out += self._convolve(work)
+        return out
+
+    def batch_call(self, x: ndarray, P: ndarray) -> ndarray:
+        """
+        Evaluate the convolution for a batch of parameter sets.
+        All of the sets are convolved in a single (batched) FFT.
+        :param x: x range to calculate function over
+        :param P: the parameter sets (n_sets, N_params)
+        :return y values for each parameter set (n_sets, len(x))
+        """
+        result = super().batch_call(x, P)
+        if len(result) == 0:
+            return result
+        return self._convolve(result)
+
+    def jacobian(self, x: ndarray, *args) -> ndarray:
+        """
+        The analytic derivatives of the convolution.
+        The convolution is linear, so the derivatives are
+        the convolution of the derivatives of the functions.
+        :param x: x range to calculate function over
+        :param args: the arguments for the convolution function
+        :return the derivatives, one row per parameter
+        """
+        jac = super().jacobian(x, *args)
+        if len(jac) == 0:
+            return np.zeros((0, len(x)))
+        return self._convolve(jac)
@@ -28,6 +28,23 @@ class Delta(BaseFitFunction):
         """
         return str(f"{self._prefix}Centre")
 
+    @staticmethod
+    def _bin(x: ndarray, x0: float) -> (int, float):
+        """
+        Gets the bin that contains the top hat
+        :param x: x values for function evaluation
+        :param x0: the position of the top hat (can be an array)
+        :return the index of the bin and the bin width
+        """
+        index = np.searchsorted(x, x0)-1
+
+        # integral should normalise to 1*amplitude
+        # so need to divide by bin width
+        last = index == len(x)-1
+        upper = np.where(last, index, index+1)
+        lower = np.where(last, index-1, index)
+        return index, x[upper] - x[lower]
+
     def __call__(self, x: ndarray, amplitude: float, x0: float) -> ndarray:
         """
         Implement the delta/top hat.
@@ -39,19 +56,53 @@ class Delta(BaseFitFunction):
         :return y values for the function evaluation
         """
         data = np.zeros(len(x))
-        index = np.searchsorted(x, x0)-1
+        index, dx = self._bin(x, x0)
+        data[index] = amplitude/dx
+        return data
 
-        # integral should normalise to 1*amplitude
-        # so need to divide by bin width
-        dx = 0.0
-        if index == len(data)-1:
-            dx = x[index] - x[index-1]
-        else:
-            dx = x[index+1] - x[index]
+    def evaluate_into(self, x: ndarray, out: ndarray, amplitude: float,
+                      x0: float) -> ndarray:
+        """
+        Adds the delta/top hat to an existing array (in place).
+        Only a single bin is changed.
+        :param x: x values for function evaluation
+        :param out: the array to add the values to
+        :param amplitude: height of the top hat function
+        :param x0: the position of the top hat
+        :return the out array
+        """
+        index, dx = self._bin(x, x0)
+        out[index] += amplitude/dx
+        return out
 
-        data[index] = amplitude/dx
+    def batch_call(self, x: ndarray, P: ndarray) -> ndarray:
+        """
+        Evaluate the function for a batch of parameter sets
+        :param x: x values for function evaluation
+        :param P: the parameter sets (n_sets, N_params)
+        :return y values for each parameter set (n_sets, len(x))
+        """
+        P = self._batch_params(P)
+        data = np.zeros((len(P), len(x)))
+        index, dx = self._bin(x, P[:, 1])
+        data[np.arange(len(P)), index] = P[:, 0]/dx
         return data
 
+    def jacobian(self, x: ndarray, amplitude: float, x0: float) -> ndarray:
+        """
+        The analytic derivatives of the delta/top hat.
+        The function is piecewise constant in x0, so the
+        derivative wrt x0 is zero.
+        :param x: x values for function evaluation
+        :param amplitude: height of the top hat function
+        :param x0: the position of the top hat
+        :return derivatives wrt amplitude and x0
+        """
+        jac = np.zeros((2, len(x)))
+        index, dx = self._bin(x, x0)
+        jac[0][index] = 1./dx
+        return jac
+
     def read_from_report(self, report_dict: Dict[str, List[float]],
                          index: int = 0) -> List[float]:
         """
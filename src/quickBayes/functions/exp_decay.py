@@ -1,4 +1,4 @@
-from quickBayes.functions.base import BaseFitFunction
+from quickBayes.functions.base import BaseFitFunction, work_array
 from numpy import ndarray
 import numpy as np
 from typing import Dict, List
@@ -39,6 +39,45 @@ class ExpDecay(BaseFitFunction):
         """
         return amplitude*np.exp(-decay_rate*x)
 
+    def evaluate_into(self, x: ndarray, out: ndarray, amplitude: float,
+                      decay_rate: float) -> ndarray:
+        """
+        Adds the exponential decay to an existing array (in place)
+        :param x: x values for the function evaluation
+        :param out: the array to add the values to
+        :param amplitude: amplitude of decay
+        :param decay_rate: the lambda value (decay rate)
+        :return the out array
+        """
+        with work_array(len(x)) as work:
+            np.multiply(-decay_rate, x, out=work)
+            np.exp(work, out=work)
+            work *= amplitude
+            out += work
+        return out
+
+    def batch_call(self, x: ndarray, P: ndarray) -> ndarray:
+        """
+        Evaluate the function for a batch of parameter sets
+        :param x: x values for function evaluation
+        :param P: the parameter sets (n_sets, N_params)
+        :return y values for each parameter set (n_sets, len(x))
+        """
+        amplitude, decay_rate = self._batch_columns(P)
+        return self(x, amplitude, decay_rate)
+
+    def jacobian(self, x: ndarray, amplitude: float,
+                 decay_rate: float) -> ndarray:
+        """
+        The analytic derivatives of the exponential decay
+        :param x: x values for the function evaluation
+        :param amplitude: amplitude of decay
+        :param decay_rate: the lambda value (decay rate)
+        :return derivatives wrt amplitude and decay rate
+        """
+        decay = np.exp(-decay_rate*x)
+        return np.array([decay, -amplitude*x*decay])
+
     def read_from_report(self, report_dict: Dict[str, List[float]],
                          index: int = 0) -> List[float]:
         """
@@ -1,4 +1,4 @@
-from quickBayes.functions.base import BaseFitFunction
+from quickBayes.functions.base import BaseFitFunction, work_array
 from numpy import ndarray, pi
 import numpy as np
 from typing import Dict, List
@@ -49,6 +49,55 @@ class Gaussian(BaseFitFunction):
         pre_factor = amplitude/(sigma*np.sqrt(2.*pi))
         return pre_factor*np.exp(-pow(x-x0, 2)/(2.*sigma*sigma))
 
+    def evaluate_into(self, x: ndarray, out: ndarray, amplitude: float,
+                      x0: float, sigma: float) -> ndarray:
+        """
+        Adds the gaussian to an existing array (in place)
+        :param x: x values for the function evaluation
+        :param out: the array to add the values to
+        :param amplitude: amplitude of gaussian
+        :param x0: the mean value of the gaussian
+        :param sigma: the sigma value of the gaussian
+        :return the out array
+        """
+        pre_factor = amplitude/(sigma*np.sqrt(2.*pi))
+        with work_array(len(x)) as work:
+            np.subtract(x, x0, out=work)
+            work *= work
+            np.negative(work, out=work)
+            work /= 2.*sigma*sigma
+            np.exp(work, out=work)
+            work *= pre_factor
+            out += work
+        return out
+
+    def batch_call(self, x: ndarray, P: ndarray) -> ndarray:
+        """
+        Evaluate the function for a batch of parameter sets
+        :param x: x values for function evaluation
+        :param P: the parameter sets (n_sets, N_params)
+        :return y values for each parameter set (n_sets, len(x))
+        """
+        amplitude, x0, sigma = self._batch_columns(P)
+        return self(x, amplitude, x0, sigma)
+
+    def jacobian(self, x: ndarray, amplitude: float, x0: float,
+                 sigma: float) -> ndarray:
+        """
+        The analytic derivatives of the gaussian
+        :param x: x values for the function evaluation
+        :param amplitude: amplitude of gaussian
+        :param x0: the mean value of the gaussian
+        :param sigma: the sigma value of the gaussian
+        :return derivatives wrt amplitude, x0 and sigma
+        """
+        dx = x - x0
+        shape = np.exp(-pow(dx, 2)/(2.*sigma*sigma))/(sigma*np.sqrt(2.*pi))
+        y = amplitude*shape
+        return np.array([shape,
+                         y*dx/(sigma*sigma),
+                         y*(pow(dx, 2)/pow(sigma, 3) - 1./sigma)])
+
     def read_from_report(self, report_dict: Dict[str, List[float]],
                          index: int = 0) -> List[float]:
         """
@@ -1,5 +1,6 @@
-from quickBayes.functions.base import BaseFitFunction
+from quickBayes.functions.base import BaseFitFunction, work_array
 from numpy import ndarray, pi
+import numpy as np
 from typing import Dict, List
 
 
@@ -48,6 +49,57 @@ class Lorentzian(BaseFitFunction):
         G = Gamma/2.
         return amplitude*G/(pi*(pow(x-x0, 2)+pow(G, 2)))
 
+    def evaluate_into(self, x: ndarray, out: ndarray, amplitude: float,
+                      x0: float, Gamma: float) -> ndarray:
+        """
+        Adds the Lorentzian to an existing array (in place)
+        :param x: x values for function evaluation
+        :param out: the array to add the values to
+        :param amplitude: amplitude of the lorentzian
+        :param x0: the peak centre
+        :param Gamma: half width at half maxima (HWHM)
+        :return the out array
+        """
+        G = Gamma/2.
+        with work_array(len(x)) as work:
+            np.subtract(x, x0, out=work)
+            work *= work
+            work += pow(G, 2)
+            work *= pi
+            np.divide(amplitude*G, work, out=work)
+            out += work
+        return out
+
+    def batch_call(self, x: ndarray, P: ndarray) -> ndarray:
+        """
+        Evaluate the function for a batch of parameter sets
+        :param x: x values for function evaluation
+        :param P: the parameter sets (n_sets, N_params)
+        :return y values for each parameter set (n_sets, len(x))
+        """
+        amplitude, x0, Gamma = self._batch_columns(P)
+        return self(x, amplitude, x0, Gamma)
+
+    def jacobian(self, x: ndarray, amplitude: float,
+                 x0: float, Gamma: float) -> ndarray:
+        """
+        The analytic derivatives of the Lorentzian
+        :param x: x values for function evaluation
+        :param amplitude: amplitude of the lorentzian
+        :param x0: the peak centre
+        :param Gamma: half width at half maxima (HWHM)
+        :return derivatives wrt amplitude, x0 and Gamma
+        """
+        G = Gamma/2.
+        dx = x - x0
+        denominator = pow(dx, 2) + pow(G, 2)
+        d_amp = G/(pi*denominator)
+        d_x0 = 2.*amplitude*G*dx/(pi*pow(denominator, 2))
+        # chain rule: dG/dGamma = 1/2
+        d_Gamma = 0.5*amplitude*(pow(dx, 2) - pow(G, 2))/(
+            pi*pow(denominator, 2))
+        return np.array([d_amp, d_x0, d_Gamma])
+
     def read_from_report(self, report_dict: Dict[str, List[float]],
                          index: int = 0) -> List[float]:
         """
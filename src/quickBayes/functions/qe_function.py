@@ -3,6 +3,7 @@ from quickBayes.functions.convolution import (
 from quickBayes.functions.base import BaseFitFunction
 from quickBayes.functions.delta import Delta
 from numpy import ndarray
+import numpy as np
 from typing import Dict, List
 from abc import abstractmethod
 import copy
@@ -48,6 +49,7 @@ class QEFunction(BaseFitFunction):
 
         self._N_params = self.BG.N_params + self.conv.N_params,
         self._prefix = self.prefix
+        self._compile_param_map()
 
     def update_x_range(self, new_x: ndarray) -> None:
         """
@@ -101,6 +103,7 @@ class QEFunction(BaseFitFunction):
         self.conv.add_function(func)
         # update the labels/prefixes
         self._update_prefixes()
+        self._compile_param_map()
 
     def _add_params(self, offset: int, x0: float,
                     args: List[float]) -> List[float]:
@@ -134,10 +137,34 @@ class QEFunction(BaseFitFunction):
                 # if not elastic, already done first peak
                 offset = 1
 
+        index = N_BG_params + N_f0
         for j in range(self._N_peaks - offset):
-            params += self._add_params(N_BG_params + N_f0 + j*2, x0, args)
+            extra = self._add_params(index, x0, args)
+            params += extra
+            # the peak centre is not in the args
+            index += len(extra) - 1
         return params
 
+    def _compile_param_map(self) -> None:
+        """
+        Creates the map from the parameters (no repeats)
+        to the extended parameters (with repeats for the
+        peak centres). This only changes when a function
+        is added, so it is calculated once and then used
+        to index the parameters.
+        """
+        self._param_map = np.array(self._get_params(list(range(
+            self.N_params))), dtype=int)
+
+    def _expand_params(self, args: List[float]) -> ndarray:
+        """
+        Gets the extended parameter list (with repeats for the
+        peak centres), using the parameter map
+        :param args: the arguments to the function (no repeats)
+        :return the extended parameters
+        """
+        return np.asarray(args, dtype=float)[self._param_map]
+
     def __call__(self, x: ndarray, *args) -> ndarray:
         """
         Implement the function evaluation.
@@ -150,10 +177,65 @@ class QEFunction(BaseFitFunction):
         N_BG_params = self.BG.N_params
         result = self.BG(x, *args[:N_BG_params])
 
-        params = self._get_params(list(args))
+        params = self._expand_params(args)
         result += self.conv(x, *params)
         return result
 
+    def evaluate_into(self, x: ndarray, out: ndarray, *args) -> ndarray:
+        """
+        Adds the function to an existing array (in place)
+        :param x: x values for function evaluation
+        :param out: the array to add the values to
+        :param args: args for functions
+        :return the out array
+        """
+        N_BG_params = self.BG.N_params
+        self.BG.evaluate_into(x, out, *args[:N_BG_params])
+
+        params = self._expand_params(args)
+        self.conv.evaluate_into(x, out, *params)
+        return out
+
+    def batch_call(self, x: ndarray, P: ndarray) -> ndarray:
+        """
+        Evaluate the function for a batch of parameter sets.
+        The tied parameters (peak centres) are repeated
+        using the parameter map.
+        :param x: x values for function evaluation
+        :param P: the parameter sets (n_sets, N_params)
+        :return y values for each parameter set (n_sets, len(x))
+        """
+        P = self._batch_params(P)
+        N_BG_params = self.BG.N_params
+        result = self.BG.batch_call(x, P[:, :N_BG_params])
+        result += self.conv.batch_call(x, P[:, self._param_map])
+        return result
+
+    def jacobian(self, x: ndarray, *args) -> ndarray:
+        """
+        The analytic derivatives of the function.
+        The derivatives for the tied parameters (peak centres)
+        are the sum of the derivatives for each repeat.
+        :param x: x values for function evaluation
+        :param args: args for functions
+        :return the derivatives, one row per parameter
+        """
+        N_BG_params = self.BG.N_params
+        jac = np.zeros((self.N_params, len(x)))
+        jac[:N_BG_params] = self.BG.jacobian(x, *args[:N_BG_params])
+
+        params = self._expand_params(args)
+        np.add.at(jac, self._param_map, self.conv.jacobian(x, *params))
+        return jac
+
+    @property
+    def has_jacobian(self) -> bool:
+        """
+        :return if the functions have analytic derivatives
+        """
+        return (super().has_jacobian and self.BG.has_jacobian and
+                self.conv.has_jacobian)
+
     def _get_func_from_report(self, args: List[float]) -> List[float]:
         return args
 
@@ -205,7 +287,7 @@ class QEFunction(BaseFitFunction):
             raise ValueError(f"Expected {N} args, got {len(args)}")
         report_dict = self.BG.report(report_dict, *args[:self.BG.N_params])
 
-        params = self._get_params(list(args))
+        params = self._expand_params(args)
         report_dict = self.conv.report(report_dict, *params)
         return report_dict
 
@@ -226,8 +308,8 @@ class QEFunction(BaseFitFunction):
                                             errors[:self.BG.N_params],
                                             params[:self.BG.N_params])
 
-        params = self._get_params(params)
-        errors = self._get_params(errors)
+        params = self._expand_params(params)
+        errors = self._expand_params(errors)
         report_dict = self.conv.report_errors(report_dict, errors, params)
         return report_dict
 
@@ -47,7 +47,7 @@ class QlDataFunction(QEFunction):
         :returns updated results dict
         """
         report_dict = super().report(report_dict, *args)
-        params = self._get_params(list(args))
+        params = self._expand_params(args)
         # manually add EISF
         if self.delta and self.conv.N_params > 2:
             BG_N_params = self.BG.N_params
@@ -1,6 +1,7 @@
 from quickBayes.functions.SE_fix import StretchExpWithFixes
 from quickBayes.functions.base import BaseFitFunction
 from quickBayes.functions.qse_function import QSEFunction
+from quickBayes.functions.SE import StretchExpTable
 from numpy import ndarray
 from typing import List
 
@@ -8,7 +9,8 @@ from typing import List
 class QSEFixFunction(QSEFunction):
 
     def __init__(self, bg_function: BaseFitFunction, elastic_peak: bool,
-                 r_x: ndarray, r_y: ndarray, start_x: float, end_x: float):
+                 r_x: ndarray, r_y: ndarray, start_x: float, end_x: float,
+                 table: StretchExpTable = None):
         """
         Create a quasi elastic fitting function using fixed stretched exp
         :param bg_function: background fitting function
@@ -17,16 +19,18 @@ class QSEFixFunction(QSEFunction):
         :param res_y: y values for resolution function
         :param start_x: the start of the fitting range
         :param end_x: the end of the fitting range
+        :param table: the precomputed stretched exp table to use.
+        If None (default) the FFT is used.
         """
         self._se = []
         super().__init__(bg_function, elastic_peak, r_x,
-                         r_y, start_x, end_x)
+                         r_y, start_x, end_x, table)
 
     def add_single_SE(self) -> None:
         """
         adds a single stretched exp with fixes
         """
-        self._se.append(StretchExpWithFixes())
+        self._se.append(StretchExpWithFixes(table=self._table))
         self.add_single_function(self._se[-1])
 
     @staticmethod
@@ -1,6 +1,6 @@
 from quickBayes.functions.base import BaseFitFunction
 from quickBayes.functions.qe_function import QEFunction
-from quickBayes.functions.SE import StretchExp
+from quickBayes.functions.SE import StretchExp, StretchExpTable
 from numpy import ndarray
 import copy
 from typing import List
@@ -8,7 +8,8 @@ from typing import List
 
 class QSEFunction(QEFunction):
     def __init__(self, bg_function: BaseFitFunction, elastic_peak: bool,
-                 r_x: ndarray, r_y: ndarray, start_x: float, end_x: float):
+                 r_x: ndarray, r_y: ndarray, start_x: float, end_x: float,
+                 table: StretchExpTable = None):
         """
         Create a quasi elastic fitting function using stretched exp
         :param bg_function: background fitting function
@@ -17,7 +18,10 @@ class QSEFunction(QEFunction):
         :param res_y: y values for resolution function
         :param start_x: the start of the fitting range
         :param end_x: the end of the fitting range
+        :param table: the precomputed stretched exp table to use.
+        If None (default) the FFT is used.
         """
+        self._table = table
         super().__init__(bg_function, elastic_peak, r_x,
                          r_y, start_x, end_x)
 
@@ -25,7 +29,7 @@ class QSEFunction(QEFunction):
         """
         Add a single Lorentzian function to the qldata function
         """
-        se = StretchExp()
+        se = StretchExp(table=self._table)
         self.add_single_function(se)
 
     def _add_params(self, offset: int, x0: float,
@@ -1,7 +1,28 @@
-from quickBayes.fitting.fit_utils import log10_hessian_det
+from quickBayes.fitting.fit_utils import (log10_hessian_det,
+                                          batch_log10_hessian_det)
 from numpy import ndarray
 import numpy as np
-from math import exp, log10
+from math import exp, log10, lgamma, log
+
+
+# log_10(N!) + N log_10(4 pi) for N = 0, 1, ..., MAX_PEAKS
+MAX_PEAKS = 32
+LOG10_FACTORIAL = np.concatenate(([0.], np.cumsum(
+    np.log10(np.arange(1, MAX_PEAKS + 1)))))
+PEAK_TERMS = LOG10_FACTORIAL + np.arange(MAX_PEAKS + 1)*log10(4.*np.pi)
+
+
+def peak_terms(N_peaks: int) -> float:
+    """
+    The terms in the loglikelihood that only depend on the
+    number of peaks: log_10(N!) + N log_10(4 pi).
+    These are precomputed (PEAK_TERMS) for up to MAX_PEAKS.
+    :param N_peaks: the number of peaks
+    :return the peak terms
+    """
+    if N_peaks <= MAX_PEAKS:
+        return PEAK_TERMS[N_peaks]
+    return lgamma(N_peaks + 1)/log(10.) + N_peaks*log10(4.*np.pi)
 
 
 def loglikelihood(x_len: ndarray, chi2: float, covar: ndarray,
@@ -44,18 +65,50 @@ def loglikelihood(x_len: ndarray, chi2: float, covar: ndarray,
     We will therefore add a penality to the loglikelihood
     via the hessian.
     """
-    log_hess_det = log10_hessian_det(covar)
+    # an invalid (not positive definite) covariance matrix is
+    # expected for overparameterised fits, the value is then
+    # BAD_LOG10_DET and the penalty below is used
+    log_hess_det, _ = log10_hessian_det(covar)
     if np.max(np.abs(covar)) > 1:
         log_hess_det = 100*np.abs(log_hess_det)
 
     # want the unscaled chi^2 -> multiple by length of data
     log_chi2 = log10(exp(1.))*chi2*float(x_len)/2.
 
-    log_likelihood = np.sum(
-        np.log10(np.asarray([k + 1 for k in range(N_peaks)])))
-    log_likelihood += float(N_peaks)*log10(4.*np.pi)
+    log_likelihood = peak_terms(N_peaks)
     log_likelihood -= log_chi2
     log_likelihood -= float(N_peaks)*log10(beta)
     log_likelihood -= 0.5*(log_hess_det)
 
     return log_likelihood
+
+
+def batch_loglikelihood(x_len: int, chi2: ndarray, covars: ndarray,
+                        N_peaks: int, beta: float) -> ndarray:
+    """
+    Calculate the unnormalised logliklihood (see loglikelihood) for
+    a stack of fits with the same number of parameters, e.g. the cells
+    of a grid search or the spectra in a batch.
+    If each covariance matrix is positive definite is also returned,
+    so the caller can decide what to do with the invalid fits.
+    :param x_len: the length of the x data
+    :param chi2: the chi squared for each fit
+    :param covars: the covariance matrices (N by N_params by N_params)
+    :param N_peaks: the number of peaks
+    :param beta: the scale factor, A_max*(x_max - x_min) eq. 4.17
+    :return the loglikelihoods, and if each covariance matrix is
+    positive definite
+    """
+    covars = np.asarray(covars, dtype=float)
+    log_hess_det, valid = batch_log10_hessian_det(covars)
+    # penalty for overparameterised fits
+    penalty = np.max(np.abs(covars), axis=(-2, -1)) > 1
+    log_hess_det = np.where(penalty, 100*np.abs(log_hess_det),
+                            log_hess_det)
+
+    log_chi2 = log10(exp(1.))*np.asarray(chi2, dtype=float)*float(x_len)/2.
+
+    log_likelihood = peak_terms(N_peaks) - log_chi2
+    log_likelihood -= float(N_peaks)*log10(beta)
+    log_likelihood -= 0.5*log_hess_det
+    return log_likelihood, valid
@@ -46,3 +46,24 @@ def spline_data() -> (ndarray, ndarray, ndarray):
         ee.append(e_data[k])
 
     return x_data, y_data, e_data, np.array(xx), np.array(yy), np.array(ee)
+
+
+def central_derivative(func, x_data: ndarray, params: list,
+                       step: float = 1.e-6) -> ndarray:
+    """
+    Central difference derivatives, for checking analytic
+    derivatives against
+    :param func: the function
+    :param x_data: the x data
+    :param params: the parameters
+    :param step: the step size for the parameters
+    :return the derivatives (one row per parameter)
+    """
+    df_by_dp = []
+    for j in range(len(params)):
+        up = np.array(params, dtype=float)
+        down = np.array(params, dtype=float)
+        up[j] += step
+        down[j] -= step
+        df_by_dp.append((func(x_data, *up) - func(x_data, *down))/(2.*step))
+    return np.array(df_by_dp)
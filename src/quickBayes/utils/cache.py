@@ -0,0 +1,90 @@
+from collections import OrderedDict
+from typing import Any, Hashable
+import threading
+
+
+class LRUCache(object):
+    """
+    A simple least recently used (LRU) cache.
+    When the cache is full the least recently used
+    item is removed. It is safe to use with threads.
+    """
+    def __init__(self, maxsize: int = 8):
+        """
+        Create an empty cache
+        :param maxsize: the maximum number of items to store
+        """
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._maxsize = 0
+        self.hits = 0
+        self.misses = 0
+        self.maxsize = maxsize
+
+    @property
+    def maxsize(self) -> int:
+        """
+        :return the maximum number of items in the cache
+        """
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, maxsize: int) -> None:
+        """
+        Change the size of the cache, removes the least
+        recently used items if needed.
+        :param maxsize: the new maximum number of items (>=0)
+        """
+        if maxsize < 0:
+            raise ValueError("The cache size must be positive")
+        with self._lock:
+            self._maxsize = maxsize
+            self._trim()
+
+    def _trim(self) -> None:
+        """
+        Removes the least recently used items until
+        the cache is not too big
+        """
+        while len(self._items) > self._maxsize:
+            self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        """
+        :return the number of items in the cache
+        """
+        return len(self._items)
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Get an item from the cache
+        :param key: the key for the item
+        :return the item (None if not in the cache)
+        """
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Add an item to the cache
+        :param key: the key for the item
+        :param value: the item to store
+        """
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            self._trim()
+
+    def clear(self) -> None:
+        """
+        Removes all of the items from the cache
+        """
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
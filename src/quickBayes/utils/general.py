@@ -2,7 +2,10 @@ from quickBayes.functions.base import BaseFitFunction
 from quickBayes.functions.BG import (LinearBG,
                                      FlatBG,
                                      NoBG)
+from numpy import ndarray
+import numpy as np
 from typing import List
+import os
 
 
 def get_background_function(BG_type: str) -> (BaseFitFunction):
@@ -31,3 +34,19 @@ def update_guess(params: List[float], func: BaseFitFunction) -> List[float]:
     if len(params) > len(func.get_guess()):
         raise ValueError("Too many parameters")
     return params + func.get_guess()[len(params):]
+
+
+def save_npz(file_name: str, **arrays: ndarray) -> None:
+    """
+    Saves arrays to a numpy .npz file. The file is written to a
+    temporary file first and then renamed, so if it is interrupted
+    the file is either complete or unchanged.
+    :param file_name: the name of the file
+    :param arrays: the arrays to save (keyword = name in the file)
+    """
+    tmp_name = file_name + '.tmp'
+    with open(tmp_name, 'wb') as tmp:
+        np.savez(tmp, **arrays)
+        tmp.flush()
+        os.fsync(tmp.fileno())
+    os.replace(tmp_name, file_name)
@@ -1,10 +1,51 @@
 import multiprocessing
 from joblib import Parallel, delayed
-from collections.abc import Callable
+from collections.abc import Callable, Iterator
+from functools import partial
+
+
+BACKENDS = {'threads': 'threads', 'loky': 'processes',
+            'multiprocessing': None}
+
+
+def _check_chunk_size(chunk_size: int) -> None:
+    """
+    Checks that the chunk size is valid
+    :param chunk_size: the number of items per chunk (None for automatic)
+    """
+    if chunk_size is not None and chunk_size < 1:
+        raise ValueError("The chunk size must be at least 1, "
+                         f"got {chunk_size}")
+
+
+def _get_context(start_method: str) -> multiprocessing.context.BaseContext:
+    """
+    Gets the multiprocessing context for a start method
+    :param start_method: the start method (fork, spawn or forkserver).
+    None gives the default for the platform
+    :return the multiprocessing context
+    """
+    methods = multiprocessing.get_all_start_methods()
+    if start_method is not None and start_method not in methods:
+        raise ValueError(f"The start method {start_method} is not valid, "
+                         f"please use one of {methods}")
+    return multiprocessing.get_context(start_method)
+
+
+def _check_backend(backend: str) -> None:
+    """
+    Checks that the backend is valid
+    :param backend: the name of the backend
+    """
+    if backend not in BACKENDS.keys():
+        raise ValueError(f"The backend {backend} is not valid, "
+                         f"please use one of {list(BACKENDS.keys())}")
 
 
 def parallel(items: list, function: Callable,
-             N: int = multiprocessing.cpu_count()):
+             N: int = multiprocessing.cpu_count(),
+             backend: str = 'threads', chunk_size: int = None,
+             start_method: str = None):
     """
     This is a wrapper of the joblib Parallel function.
     It will run the function over multiple cores and then return the result.
@@ -13,9 +54,78 @@ def parallel(items: list, function: Callable,
     :input items: the list to loop over
     :input function: the function to run in parallel
     :input N: the number of process to use
+    :input backend: the backend to use, threads (default), loky
+    (processes) or multiprocessing (a multiprocessing pool).
+    For processes the function and items must be picklable.
+    :input chunk_size: the number of items sent to a worker at a time.
+    None (default) lets the backend decide.
+    :input start_method: the start method for the multiprocessing
+    backend (fork, spawn or forkserver). None (default) uses the
+    platform default.
     :return a list of the outputs from function. If multuple outputs
     from function then the first index is for the loop value and the
     second index is for the item from function.
     """
+    _check_backend(backend)
+    _check_chunk_size(chunk_size)
+
+    if backend == 'multiprocessing':
+        context = _get_context(start_method)
+        with context.Pool(N) as pool:
+            return pool.map(function, items, chunk_size)
+
+    batch_size = 'auto' if chunk_size is None else chunk_size
     return Parallel(n_jobs=N,
-                    prefer="threads")(delayed(function)(j) for j in items)
+                    prefer=BACKENDS[backend],
+                    batch_size=batch_size)(delayed(function)(j)
+                                           for j in items)
+
+
+def _with_item(item, function: Callable) -> tuple:
+    """
+    Runs the function and keeps the item with the output
+    :param item: the item
+    :param function: the function to run
+    :return the item and the output of the function
+    """
+    return item, function(item)
+
+
+def parallel_iter(items: list, function: Callable,
+                  N: int = multiprocessing.cpu_count(),
+                  backend: str = 'threads', chunk_size: int = None,
+                  start_method: str = None) -> Iterator[tuple]:
+    """
+    The same as parallel, but the outputs are given as soon as
+    each item is completed (in any order), rather than once all
+    of them are. So the outputs can be used (e.g. saved) while
+    the other items are running.
+    :input items: the list to loop over
+    :input function: the function to run in parallel
+    :input N: the number of process to use
+    :input backend: the backend to use, threads (default), loky
+    (processes) or multiprocessing (a multiprocessing pool)
+    :input chunk_size: the number of items sent to a worker at a time.
+    None (default) lets the backend decide.
+    :input start_method: the start method for the multiprocessing
+    backend. None (default) uses the platform default.
+    :return an iterator of the (item, output) pairs
+    """
+    _check_backend(backend)
+    _check_chunk_size(chunk_size)
+    task = partial(_with_item, function=function)
+
+    if backend == 'multiprocessing':
+        context = _get_context(start_method)
+
+        def run():
+            with context.Pool(N) as pool:
+                yield from pool.imap_unordered(task, items,
+                                               chunk_size or 1)
+        return run()
+
+    batch_size = 'auto' if chunk_size is None else chunk_size
+    return Parallel(n_jobs=N, prefer=BACKENDS[backend],
+                    batch_size=batch_size,
+                    return_as='generator_unordered')(delayed(task)(j)
+                                                     for j in items)
@@ -0,0 +1,253 @@
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict
+from numpy import ndarray
+import threading
+import time
+
+
+"""
+Opt in instrumentation of the workflows and fit engines.
+A Profiler records the wall time, number of calls, function
+evaluations and optimiser iterations for each stage of a
+calculation (e.g. preprocessing, the optimiser, derivatives),
+grouped by the number of features (N).
+When profiling is not enabled the workflows and fit engines
+only check that their profiler is None, so it has no
+noticeable cost.
+"""
+
+
+# the profiler used by new workflows, set by the profile context manager
+_ACTIVE = None
+# an empty context manager, for when profiling is disabled
+NO_STAGE = nullcontext()
+FIELDS = ['time', 'calls', 'evaluations', 'iterations']
+
+
+def _unwrap(func: Callable) -> Callable:
+    """
+    Used to pickle a CountingFunction, only the original
+    function is sent (e.g. to another process).
+    :param func: the original function
+    :return the original function
+    """
+    return func
+
+
+class CountingFunction(object):
+    """
+    Wraps a fitting function so that the number of
+    evaluations are recorded by a profiler. Everything
+    else is passed to the original function.
+    """
+    def __init__(self, func: Callable, profiler: 'Profiler'):
+        """
+        :param func: the fitting function
+        :param profiler: the profiler to record the evaluations
+        """
+        self._func = func
+        self._profiler = profiler
+
+    def __call__(self, x: ndarray, *args) -> ndarray:
+        self._profiler.add_evaluations(1)
+        return self._func(x, *args)
+
+    def evaluate_into(self, x: ndarray, out: ndarray, *args) -> ndarray:
+        self._profiler.add_evaluations(1)
+        if hasattr(self._func, 'evaluate_into'):
+            return self._func.evaluate_into(x, out, *args)
+        out += self._func(x, *args)
+        return out
+
+    def batch_call(self, x: ndarray, P: ndarray) -> ndarray:
+        self._profiler.add_evaluations(len(P))
+        return self._func.batch_call(x, P)
+
+    def __getattr__(self, name: str):
+        return getattr(self._func, name)
+
+    def __reduce__(self):
+        return (_unwrap, (self._func,))
+
+
+class Profiler(object):
+    """
+    Records the cost of each stage of a calculation.
+    It is safe to use with threads, each thread has its
+    own current stage and number of features.
+    """
+    def __init__(self):
+        """
+        Creates an empty profiler
+        """
+        self._records = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _state(self):
+        """
+        :return the state (N and stages) for the current thread
+        """
+        local = self._local
+        if not hasattr(local, 'stages'):
+            local.stages = []
+            local.N = None
+        return local
+
+    def _record(self, stage: str) -> Dict[str, float]:
+        """
+        Gets the record for a stage (at the current N),
+        must be called with the lock
+        :param stage: the name of the stage
+        :return the record
+        """
+        key = (self._state().N, stage)
+        if key not in self._records:
+            self._records[key] = {field: 0 for field in FIELDS}
+        return self._records[key]
+
+    def set_N(self, N: int) -> None:
+        """
+        Sets the number of features for the following stages
+        :param N: the number of features (None if not relevant)
+        """
+        self._state().N = N
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        A context manager for timing a stage. Stages can be nested,
+        the evaluations and iterations are added to the inner stage.
+        :param name: the name of the stage
+        """
+        state = self._state()
+        state.stages.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            state.stages.pop()
+            with self._lock:
+                record = self._record(name)
+                record['time'] += duration
+                record['calls'] += 1
+
+    def _add(self, field: str, value: int) -> None:
+        """
+        Adds to a count for the current stage
+        :param field: the field to add to
+        :param value: the value to add
+        """
+        stages = self._state().stages
+        name = stages[-1] if len(stages) > 0 else 'other'
+        with self._lock:
+            self._record(name)[field] += value
+
+    def add_evaluations(self, N_evals: int) -> None:
+        """
+        Records function evaluations for the current stage
+        :param N_evals: the number of evaluations
+        """
+        self._add('evaluations', N_evals)
+
+    def add_iterations(self, N_iterations: int) -> None:
+        """
+        Records optimiser iterations for the current stage
+        :param N_iterations: the number of iterations
+        """
+        self._add('iterations', N_iterations)
+
+    def count_evaluations(self, func: Callable) -> CountingFunction:
+        """
+        Wraps a fitting function to count its evaluations
+        :param func: the fitting function
+        :return the wrapped function
+        """
+        if isinstance(func, CountingFunction):
+            return func
+        return CountingFunction(func, self)
+
+    def report(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """
+        Gets a report of the stages. The first key is the number of
+        features (e.g. N1, or all if it is not relevant) and the
+        second is the stage. Each stage has the time (seconds),
+        calls, evaluations and iterations.
+        :return the report
+        """
+        report = {}
+        with self._lock:
+            for (N, stage), record in self._records.items():
+                label = 'all' if N is None else f'N{N}'
+                report.setdefault(label, {})[stage] = dict(record)
+        return report
+
+    def clear(self) -> None:
+        """
+        Removes all of the records
+        """
+        with self._lock:
+            self._records = {}
+
+    def __deepcopy__(self, memo: dict) -> 'Profiler':
+        """
+        Copies of a workflow record into the same profiler
+        :param memo: the memo dict
+        :return the profiler
+        """
+        return self
+
+    def __getstate__(self) -> dict:
+        """
+        The records are sent to other processes, but any
+        new records from the other processes are not returned.
+        :return the state
+        """
+        with self._lock:
+            return {'records': dict(self._records)}
+
+    def __setstate__(self, state: dict) -> None:
+        self._records = state['records']
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+
+def stage(profiler: Profiler, name: str):
+    """
+    Gets the context manager for a stage
+    :param profiler: the profiler (None if disabled)
+    :param name: the name of the stage
+    :return the context manager
+    """
+    if profiler is None:
+        return NO_STAGE
+    return profiler.stage(name)
+
+
+def get_active_profiler() -> Profiler:
+    """
+    :return the profiler from the profile context manager (None if
+    profiling is not enabled)
+    """
+    return _ACTIVE
+
+
+@contextmanager
+def profile(profiler: Profiler = None):
+    """
+    A context manager that enables profiling for the workflows
+    created within it (e.g. by ql_data_main).
+    :param profiler: the profiler to use, if None (default) a new one
+    is created
+    :return the profiler
+    """
+    global _ACTIVE
+    if profiler is None:
+        profiler = Profiler()
+    previous = _ACTIVE
+    _ACTIVE = profiler
+    try:
+        yield profiler
+    finally:
+        _ACTIVE = previous
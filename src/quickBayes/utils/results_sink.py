@@ -0,0 +1,465 @@
+from quickBayes.utils.general import save_npz
+
+from numpy import ndarray
+import numpy as np
+from typing import Dict, List
+import hashlib
+import glob
+import os
+
+
+"""
+Results sinks write the results of a batch calculation (see
+batch_model_selection) to disk as each spectrum is completed,
+so that large runs do not have to keep every result (and fitted
+curve) in memory. If a run is interrupted the completed spectra
+are in the sink, so a new run with the same sink only needs to
+do the remaining spectra. The sink stores a fingerprint of the
+calculation, so it can not be resumed with different data or
+settings.
+"""
+
+
+def _update_hash(digest, value) -> None:
+    """
+    Adds a value to the hash of a fingerprint
+    :param digest: the hash object
+    :param value: the value (array, list, dict, number, string,
+    function or object)
+    """
+    if isinstance(value, ndarray):
+        digest.update(f'array{value.dtype.str}{value.shape}'.encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f'list{len(value)}'.encode())
+        for item in value:
+            _update_hash(digest, item)
+    elif isinstance(value, dict):
+        digest.update(f'dict{len(value)}'.encode())
+        for key in sorted(value.keys(), key=str):
+            _update_hash(digest, key)
+            _update_hash(digest, value[key])
+    elif value is None or isinstance(value, (bool, int, float, str,
+                                             np.number)):
+        digest.update(repr(value).encode())
+    elif callable(value) and hasattr(value, '__qualname__'):
+        # e.g. the workflow main function
+        digest.update(f'{value.__module__}.{value.__qualname__}'.encode())
+    else:
+        digest.update(type(value).__qualname__.encode())
+
+
+def fingerprint(*values) -> str:
+    """
+    Creates a fingerprint (hash) of the inputs to a calculation,
+    e.g. the data and the settings of a batch. Arrays are hashed
+    by their values, functions by their names and other objects
+    by their type.
+    :param values: the inputs to the calculation
+    :return the fingerprint
+    """
+    digest = hashlib.sha256()
+    _update_hash(digest, list(values))
+    return digest.hexdigest()
+
+
+class ResultsSink(object):
+    """
+    The base class for a results sink.
+    Each row is the results for one spectrum (index), it contains
+    the dicts of the fit parameters and errors (including the
+    loglikelihoods) and optionally the fitted curves.
+
+    Each row is saved as soon as it is written (_save_row), the
+    buffered rows are then combined (_write_rows) once there are
+    flush_every of them.
+
+    The derived class must include:
+    - _save_row, to save a single row
+    - _write_rows, to combine the buffered rows
+    - _read_rows, to read all of the stored rows
+    - _read_fingerprint and _write_fingerprint
+    - completed, the indices of the stored rows
+    """
+    def __init__(self, flush_every: int = 64, save_curves: bool = False):
+        """
+        :param flush_every: the maximum number of rows to keep in
+        memory before they are written
+        :param save_curves: if to store the x values and fitted
+        curves (default False)
+        """
+        if flush_every < 1:
+            raise ValueError("flush_every must be at least 1, "
+                             f"got {flush_every}")
+        self._flush_every = flush_every
+        self._save_curves = save_curves
+        self._buffer = []
+
+    @property
+    def flush_every(self) -> int:
+        """
+        :return the maximum number of rows kept in memory
+        """
+        return self._flush_every
+
+    @property
+    def save_curves(self) -> bool:
+        """
+        :return if the fitted curves are stored
+        """
+        return self._save_curves
+
+    @property
+    def completed(self) -> set:
+        """
+        :return the set of indices that have been stored
+        """
+        raise NotImplementedError()
+
+    def write(self, index: int, results: Dict[str, List[float]],
+              errors: Dict[str, List[float]], x_data: ndarray = None,
+              fits: List[ndarray] = None,
+              fit_errors: List[ndarray] = None) -> None:
+        """
+        Saves the results for a spectrum, the buffered rows are
+        combined once there are flush_every of them.
+        :param index: the index of the spectrum
+        :param results: the dict of fit parameters (one value per key)
+        :param errors: the dict of fit parameter errors
+        :param x_data: the x values for the fits
+        :param fits: the list of fitted curves
+        :param fit_errors: the list of errors for the fitted curves
+        """
+        row = {'index': index,
+               'results': {key: results[key][-1] for key in results},
+               'errors': {key: errors[key][-1] for key in errors}}
+        if self._save_curves:
+            row['x'] = np.asarray(x_data, dtype=float)
+            row['fits'] = [np.asarray(fit, dtype=float) for fit in fits]
+            row['fit_errors'] = [np.asarray(fit, dtype=float)
+                                 for fit in fit_errors]
+        self._save_row(row)
+        self._buffer.append(row)
+        if len(self._buffer) >= self._flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Combines the buffered rows
+        """
+        if len(self._buffer) > 0:
+            self._write_rows(self._buffer)
+            self._buffer = []
+
+    def close(self) -> None:
+        """
+        Writes any remaining rows
+        """
+        self.flush()
+
+    def check_fingerprint(self, value: str) -> None:
+        """
+        Checks that the sink is for the same calculation (see
+        fingerprint). If the sink does not have a fingerprint
+        the value is stored.
+        :param value: the fingerprint of the calculation
+        """
+        stored = self._read_fingerprint()
+        if stored is None:
+            self._write_fingerprint(value)
+        elif stored != value:
+            raise ValueError("The results sink is for a different "
+                             "calculation (the data or settings have "
+                             "changed), please use a new sink")
+
+    def _read_fingerprint(self) -> str:
+        """
+        :return the stored fingerprint (None if there is not one)
+        """
+        raise NotImplementedError()
+
+    def _write_fingerprint(self, value: str) -> None:
+        """
+        Stores the fingerprint
+        :param value: the fingerprint
+        """
+        raise NotImplementedError()
+
+    def _save_row(self, row: dict) -> None:
+        """
+        Saves a single row, so it is not lost if the run is
+        interrupted before the rows are combined
+        :param row: the row
+        """
+        raise NotImplementedError()
+
+    def _write_rows(self, rows: List[dict]) -> None:
+        """
+        Combines the saved rows in the storage
+        :param rows: the list of rows
+        """
+        raise NotImplementedError()
+
+    def _read_rows(self) -> List[dict]:
+        """
+        Reads all of the stored rows
+        :return the list of rows
+        """
+        raise NotImplementedError()
+
+    def load(self, num_spectra: int = None) -> (Dict[str, ndarray],
+                                                Dict[str, ndarray],
+                                                List[ndarray],
+                                                List[List[ndarray]],
+                                                List[List[ndarray]]):
+        """
+        Loads the stored results, in the same layout as
+        batch_model_selection. Missing values are NaN and the
+        curves for missing spectra are None.
+        :param num_spectra: the number of spectra, if None it is
+        one more than the largest stored index
+        :return dict of the fit parameters, their errors (one value per
+        spectrum for each key), list of the x ranges used, list of the
+        fit values and list of their errors. The lists are empty if the
+        curves are not stored.
+        """
+        self.flush()
+        rows = {row['index']: row for row in self._read_rows()}
+        if num_spectra is None:
+            num_spectra = max(rows.keys()) + 1 if len(rows) > 0 else 0
+
+        aligned = {'results': {}, 'errors': {}}
+        for index in sorted(rows.keys()):
+            for name, values in aligned.items():
+                for key, value in rows[index][name].items():
+                    if key not in values:
+                        values[key] = np.full(num_spectra, np.nan)
+                    values[key][index] = value
+
+        x_data, fits, fit_errors = [], [], []
+        if self._save_curves:
+            for index in range(num_spectra):
+                row = rows.get(index, {})
+                x_data.append(row.get('x', None))
+                fits.append(row.get('fits', None))
+                fit_errors.append(row.get('fit_errors', None))
+        return (aligned['results'], aligned['errors'],
+                x_data, fits, fit_errors)
+
+    def __enter__(self) -> 'ResultsSink':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def _pack_values(rows: List[dict], name: str) -> (ndarray, ndarray):
+    """
+    Puts the values from a dict in each row into a 2D array,
+    missing values are NaN
+    :param rows: the list of rows
+    :param name: the name of the dict (results or errors)
+    :return the array of keys and the 2D array of values
+    """
+    keys = []
+    for row in rows:
+        keys += [key for key in row[name].keys() if key not in keys]
+    values = np.full((len(rows), len(keys)), np.nan)
+    for j, row in enumerate(rows):
+        for k, key in enumerate(keys):
+            if key in row[name]:
+                values[j, k] = row[name][key]
+    return np.array(keys, dtype=str), values
+
+
+def _pack_curves(rows: List[dict], name: str) -> ndarray:
+    """
+    Puts the curves from each row into a single 2D array.
+    The rows are joined along the x values, with a column
+    for each curve (NaN if a row has fewer curves).
+    :param rows: the list of rows
+    :param name: the name of the curves (fits or fit_errors)
+    :return the 2D array of curves
+    """
+    N_curves = max(len(row[name]) for row in rows)
+    packed = []
+    for row in rows:
+        values = np.full((len(row['x']), N_curves), np.nan)
+        for k, curve in enumerate(row[name]):
+            values[:, k] = curve
+        packed.append(values)
+    return np.concatenate(packed)
+
+
+def _pack_rows(rows: List[dict], save_curves: bool) -> Dict[str, ndarray]:
+    """
+    Puts the rows into arrays, for saving to a .npz file
+    :param rows: the list of rows
+    :param save_curves: if to include the curves
+    :return the dict of arrays
+    """
+    packed = {'index': np.array([row['index'] for row in rows])}
+    for name in ['results', 'errors']:
+        packed[f'{name}_keys'], packed[name] = _pack_values(rows, name)
+    if save_curves:
+        packed['lengths'] = np.array([len(row['x']) for row in rows])
+        packed['x'] = np.concatenate([row['x'] for row in rows])
+        for name in ['fits', 'fit_errors']:
+            packed[name] = _pack_curves(rows, name)
+    return packed
+
+
+def _unpack_rows(file_name: str, save_curves: bool) -> List[dict]:
+    """
+    Reads the rows from a .npz file (see _pack_rows)
+    :param file_name: the name of the file
+    :param save_curves: if to read the curves
+    :return the list of rows
+    """
+    with np.load(file_name) as packed:
+        packed = {key: packed[key] for key in packed.files}
+    if 'lengths' in packed:
+        ends = np.cumsum(packed['lengths'])
+        starts = ends - packed['lengths']
+    rows = []
+    for j, index in enumerate(packed['index']):
+        row = {'index': int(index)}
+        for name in ['results', 'errors']:
+            row[name] = {str(key): value for key, value
+                         in zip(packed[f'{name}_keys'], packed[name][j])
+                         if not np.isnan(value)}
+        if save_curves and 'lengths' in packed:
+            rows_slice = slice(starts[j], ends[j])
+            row['x'] = packed['x'][rows_slice]
+            for name in ['fits', 'fit_errors']:
+                curves = packed[name][rows_slice].T
+                row[name] = [curve for curve in curves
+                             if not np.all(np.isnan(curve))]
+        rows.append(row)
+    return rows
+
+
+class NpzSink(ResultsSink):
+    """
+    Stores the results as a directory of numpy (.npz) files.
+    Each row is saved to its own file when it is written, and
+    each flush combines the saved rows into a new shard. The
+    files are written via a temporary file, so a file is either
+    complete or missing if the run is interrupted.
+    Creating a sink for a directory that already has results
+    resumes from them.
+    """
+    def __init__(self, directory: str, flush_every: int = 64,
+                 save_curves: bool = False):
+        """
+        :param directory: the directory for the results (created
+        if it does not exist)
+        :param flush_every: the maximum number of rows to keep in
+        memory before they are combined into a shard
+        :param save_curves: if to store the x values and fitted
+        curves (default False)
+        """
+        super().__init__(flush_every, save_curves)
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._completed = set()
+        for file_name in self._shards():
+            with np.load(file_name) as shard:
+                self._completed.update(int(j) for j in shard['index'])
+        self._N_shards = len(self._shards())
+        # the saved rows that are not in a shard yet
+        for file_name in self._row_files():
+            row = _unpack_rows(file_name, save_curves)[0]
+            if row['index'] in self._completed:
+                os.remove(file_name)
+            else:
+                self._buffer.append(row)
+
+    @property
+    def directory(self) -> str:
+        """
+        :return the directory of the results
+        """
+        return self._directory
+
+    @property
+    def completed(self) -> set:
+        """
+        :return the set of indices that have been stored
+        (including the rows that are not in a shard yet)
+        """
+        return self._completed | set(row['index'] for row in self._buffer)
+
+    def _shards(self) -> List[str]:
+        """
+        :return the list of shard files, in the order they were written
+        """
+        return sorted(glob.glob(os.path.join(self._directory,
+                                             'shard_*.npz')))
+
+    def _row_files(self) -> List[str]:
+        """
+        :return the list of saved row files
+        """
+        return sorted(glob.glob(os.path.join(self._directory,
+                                             'row_*.npz')))
+
+    def _row_file(self, index: int) -> str:
+        """
+        :param index: the index of the row
+        :return the name of the file for the row
+        """
+        return os.path.join(self._directory, f'row_{index:06d}.npz')
+
+    def _fingerprint_file(self) -> str:
+        """
+        :return the name of the file for the fingerprint
+        """
+        return os.path.join(self._directory, 'fingerprint.npz')
+
+    def _read_fingerprint(self) -> str:
+        """
+        :return the stored fingerprint (None if there is not one)
+        """
+        if not os.path.exists(self._fingerprint_file()):
+            return None
+        with np.load(self._fingerprint_file()) as stored:
+            return str(stored['fingerprint'])
+
+    def _write_fingerprint(self, value: str) -> None:
+        """
+        Stores the fingerprint
+        :param value: the fingerprint
+        """
+        save_npz(self._fingerprint_file(), fingerprint=np.array(value))
+
+    def _save_row(self, row: dict) -> None:
+        """
+        Saves a single row to its own file
+        :param row: the row
+        """
+        save_npz(self._row_file(row['index']),
+                 **_pack_rows([row], self._save_curves))
+
+    def _write_rows(self, rows: List[dict]) -> None:
+        """
+        Writes the rows to a new shard, then removes their files
+        :param rows: the list of rows
+        """
+        file_name = os.path.join(self._directory,
+                                 f'shard_{self._N_shards:06d}.npz')
+        save_npz(file_name, **_pack_rows(rows, self._save_curves))
+        self._N_shards += 1
+        self._completed.update(row['index'] for row in rows)
+        for row in rows:
+            os.remove(self._row_file(row['index']))
+
+    def _read_rows(self) -> List[dict]:
+        """
+        Reads the rows from all of the shards
+        :return the list of rows
+        """
+        rows = []
+        for file_name in self._shards():
+            rows += _unpack_rows(file_name, self._save_curves)
+        return rows
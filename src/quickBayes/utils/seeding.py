@@ -0,0 +1,103 @@
+from numpy import ndarray
+import numpy as np
+from typing import List
+
+
+"""
+Estimates for the parameters of a new feature, from the
+residuals of the previous fit. When a feature is added to a
+fitting function, the missing feature is the largest
+structure left in the residuals. So its amplitude, width
+and centre can be estimated from them, which gives a better
+starting point than a fixed default guess.
+"""
+
+
+# the scale factors for the width (or rate) of the candidates
+SCALES = [1., 0.5, 2.]
+
+
+def smooth(values: ndarray, N_points: int = None) -> ndarray:
+    """
+    Smooths the values with a moving average, to reduce the
+    effect of the noise on the estimates.
+    :param values: the values to smooth
+    :param N_points: the (odd) width of the moving average, if None
+    (default) about 1/64 of the number of values
+    :return the smoothed values
+    """
+    if N_points is None:
+        N_points = max(1, len(values)//64)
+    N_points += 1 - N_points % 2
+    kernel = np.ones(N_points)/N_points
+    # use the edge values, so the ends are not pulled to zero
+    padded = np.pad(values, N_points//2, mode='edge')
+    return np.convolve(padded, kernel, mode='valid')
+
+
+def estimate_peak(x_data: ndarray,
+                  residuals: ndarray) -> (float, float, float):
+    """
+    Estimates the height, centre and full width at half
+    maximum (FWHM) of the largest peak in the residuals.
+    :param x_data: the x values
+    :param residuals: the residuals (data - fit)
+    :return the height, centre and FWHM (None if there is no peak)
+    """
+    smoothed = smooth(residuals)
+    j = int(np.argmax(smoothed))
+    height = smoothed[j]
+    if not height > 0.:
+        return None
+
+    # the region around the peak that is above half of the maximum
+    below = np.flatnonzero(smoothed < height/2.)
+    left = below[below < j]
+    right = below[below > j]
+    start = left[-1] + 1 if len(left) > 0 else 0
+    end = right[0] - 1 if len(right) > 0 else len(x_data) - 1
+    dx = np.abs(x_data[1] - x_data[0]) if len(x_data) > 1 else 1.
+    FWHM = max(np.abs(x_data[end] - x_data[start]), dx)
+    return height, x_data[j], FWHM
+
+
+def estimate_decay(x_data: ndarray,
+                   residuals: ndarray) -> (float, float):
+    """
+    Estimates the amplitude and rate of an exponential
+    decay (amplitude*exp(-rate*x)) in the residuals.
+    The rate is from the ratio of the starting value
+    and the area of the residuals.
+    :param x_data: the x values
+    :param residuals: the residuals (data - fit)
+    :return the amplitude and rate (None if there is no decay)
+    """
+    smoothed = smooth(residuals)
+    start = smoothed[0]
+    positive = np.clip(smoothed, 0., None)
+    # trapezium rule
+    area = np.sum(0.5*(positive[1:] + positive[:-1])*np.diff(x_data))
+    if not (start > 0. and area > 0.):
+        return None
+    rate = start/area
+    return start*np.exp(rate*x_data[0]), rate
+
+
+def clip_candidates(candidates: List[List[float]], lower: List[float],
+                    upper: List[float]) -> List[List[float]]:
+    """
+    Moves the candidate parameters inside of the bounds.
+    The candidates are for the last parameters, so only
+    the last bounds are used.
+    :param candidates: the list of candidate parameters
+    :param lower: the lower bounds
+    :param upper: the upper bounds
+    :return the list of clipped candidates
+    """
+    clipped = []
+    for candidate in candidates:
+        N = len(candidate)
+        values = np.clip(candidate, lower[len(lower) - N:],
+                         upper[len(upper) - N:])
+        clipped.append([float(value) for value in values])
+    return clipped
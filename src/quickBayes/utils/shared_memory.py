@@ -0,0 +1,191 @@
+from multiprocessing import shared_memory, resource_tracker
+from numpy import ndarray
+import numpy as np
+import sys
+
+
+"""
+Arrays in shared memory, for sending large arrays
+(e.g. x, y, e data or resolution functions) to worker
+processes. When a SharedArray is pickled only the name
+of the memory block is sent, the worker then attaches
+to the same block. So the data is not copied per task.
+"""
+
+
+# blocks that could not be closed, as an array still uses them
+_PENDING = []
+
+
+def _close_pending() -> None:
+    """
+    Tries to close the blocks that are waiting to be closed
+    """
+    for shm in list(_PENDING):
+        try:
+            shm.close()
+            _PENDING.remove(shm)
+        except BufferError:
+            continue
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """
+    Attaches to an existing shared memory block, without
+    registering it with the resource tracker. Otherwise the
+    tracker of a worker process can free the memory
+    while the owner is still using it.
+    :param name: the name of the shared memory block
+    :return the shared memory
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class SharedArray(object):
+    """
+    A numpy array stored in shared memory.
+    The process that creates it owns the memory and
+    should call close (or use it as a context manager)
+    to free it.
+    The values are available from the array property
+    (or np.asarray).
+    """
+    def __init__(self, values: ndarray):
+        """
+        Copies the values into a new shared memory block
+        :param values: the array to share
+        """
+        values = np.ascontiguousarray(values)
+        self._shape = values.shape
+        self._dtype = values.dtype
+        self._owner = True
+        self._shm = shared_memory.SharedMemory(create=True,
+                                               size=max(values.nbytes, 1))
+        self.array[...] = values
+
+    @property
+    def name(self) -> str:
+        """
+        :return the name of the shared memory block
+        """
+        return self._shm.name
+
+    @property
+    def shape(self) -> tuple:
+        """
+        :return the shape of the array
+        """
+        return self._shape
+
+    @property
+    def array(self) -> ndarray:
+        """
+        :return the array (uses the shared memory)
+        """
+        return np.ndarray(self._shape, dtype=self._dtype,
+                          buffer=self._shm.buf)
+
+    def __array__(self, dtype=None) -> ndarray:
+        """
+        Allows np.asarray to be used
+        :param dtype: the data type (None for no change)
+        :return the array
+        """
+        if dtype is None:
+            return self.array
+        return self.array.astype(dtype, copy=False)
+
+    def __len__(self) -> int:
+        """
+        :return the length of the array
+        """
+        return self._shape[0]
+
+    def __getstate__(self) -> dict:
+        """
+        Only the name and layout are pickled, not the values
+        :return the state
+        """
+        return {'name': self._shm.name, 'shape': self._shape,
+                'dtype': self._dtype.str}
+
+    def __setstate__(self, state: dict) -> None:
+        """
+        Attaches to the existing shared memory block
+        :param state: the pickled state
+        """
+        _close_pending()
+        self._shape = state['shape']
+        self._dtype = np.dtype(state['dtype'])
+        self._owner = False
+        self._shm = _attach(state['name'])
+
+    def __deepcopy__(self, memo: dict) -> 'SharedArray':
+        """
+        The memory is shared, so a copy is the same object
+        :param memo: the memo dict
+        :return the shared array
+        """
+        return self
+
+    def close(self) -> None:
+        """
+        Closes the shared memory, if this process owns it
+        then it is also freed. If an array still uses the
+        memory then it is closed later.
+        """
+        if self._shm is None:
+            return
+        if self._owner:
+            self._shm.unlink()
+        try:
+            self._shm.close()
+        except BufferError:
+            _PENDING.append(self._shm)
+        self._shm = None
+
+    def __del__(self):
+        """
+        Make sure that the memory is closed
+        """
+        if getattr(self, '_shm', None) is not None:
+            self.close()
+
+    def __enter__(self) -> 'SharedArray':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def share_arrays(values: dict) -> dict:
+    """
+    Copies the arrays in a dict into shared memory.
+    Values that are not arrays (e.g. None) are not changed.
+    :param values: the dict of values
+    :return a dict with the same keys, with SharedArrays
+    """
+    shared = {}
+    for key, value in values.items():
+        if isinstance(value, (ndarray, list)):
+            shared[key] = SharedArray(np.asarray(value, dtype=float))
+        else:
+            shared[key] = value
+    return shared
+
+
+def close_arrays(values: dict) -> None:
+    """
+    Closes the SharedArrays in a dict
+    :param values: the dict of values
+    """
+    for value in values.values():
+        if isinstance(value, SharedArray):
+            value.close()
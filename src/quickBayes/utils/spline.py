@@ -1,5 +1,25 @@
+from quickBayes.utils.cache import LRUCache
 from numpy import ndarray
-from scipy.interpolate import interp1d
+import numpy as np
+from typing import List
+from scipy.interpolate import interp1d, make_interp_spline, BSpline
+from scipy.linalg import solve_banded
+from scipy.sparse import csr_matrix
+import hashlib
+
+
+# cache of the splined resolutions, keyed on the data and new x values
+SPLINE_CACHE = LRUCache(maxsize=8)
+# cache of the interpolation operators (or the number of times a
+# pair of x values has been used), keyed on the old and new x values
+OPERATOR_CACHE = LRUCache(maxsize=8)
+# the number of times a pair of x values is used before an operator is made
+OPERATOR_THRESHOLD = 32
+# the rows of the inverse spline matrix are found in blocks, each using
+# a window of the matrix. The inverse decays by about a factor of 4 per
+# data point, so the window is exact to machine precision
+BLOCK_SIZE = 64
+WINDOW_PADDING = 64
 
 
 def spline(x_data: ndarray, y_data: ndarray,
@@ -15,3 +35,188 @@ def spline(x_data: ndarray, y_data: ndarray,
     func = interp1d(x_data, y_data, bounds_error=False,
                     fill_value=0., kind='cubic')
     return func(new_x_values)
+
+
+def _banded_inverse(matrix: csr_matrix) -> csr_matrix:
+    """
+    Calculates the inverse of a banded spline (collocation) matrix.
+    The rows of the inverse are found in blocks (of BLOCK_SIZE) by
+    only using a window of the matrix around each block.
+    :param matrix: the spline matrix
+    :return the (sparse) inverse of the matrix
+    """
+    N = matrix.shape[0]
+    # row j of the inverse is the solution of matrix^T z = e_j
+    transpose = matrix.T.tocsr()
+    rows, cols, values = [], [], []
+    for start in range(0, N, BLOCK_SIZE):
+        first = max(0, start - WINDOW_PADDING)
+        last = min(N, start + BLOCK_SIZE + WINDOW_PADDING)
+        window = transpose[first:last, first:last].todia()
+        below = max(0, -np.min(window.offsets))
+        above = max(0, np.max(window.offsets))
+        bands = np.zeros((below + above + 1, last - first))
+        for offset, band in zip(window.offsets, window.data):
+            bands[above - offset] = band
+
+        M = min(BLOCK_SIZE, N - start)
+        rhs = np.zeros((last - first, M))
+        rhs[np.arange(M) + start - first, np.arange(M)] = 1.
+        solution = solve_banded((below, above), bands, rhs,
+                                check_finite=False)
+        j, k = np.nonzero(solution)
+        rows.append(start + k)
+        cols.append(first + j)
+        values.append(solution[j, k])
+    return csr_matrix((np.concatenate(values),
+                       (np.concatenate(rows), np.concatenate(cols))),
+                      shape=(N, N))
+
+
+def _array_key(*arrays) -> bytes:
+    """
+    Creates a key from the contents of the arrays
+    :param arrays: the arrays
+    :return the key
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for values in arrays:
+        values = np.ascontiguousarray(values, dtype=float)
+        digest.update(str(values.shape).encode())
+        digest.update(values.tobytes())
+    return digest.digest()
+
+
+class SplineOperator(object):
+    """
+    The cubic spline (as used by spline) from one set of x
+    values to another, as a sparse matrix. The spline is
+    linear in the y values, so once the matrix has been
+    made each new set of y values only needs a (sparse)
+    matrix-vector product.
+    The weights decay quickly away from each new x value,
+    so very small weights are removed.
+    """
+    def __init__(self, x_data: ndarray, new_x_values: ndarray,
+                 tolerance: float = 1.e-14):
+        """
+        Creates the interpolation matrix
+        :param x_data: the original x data
+        :param new_x_values: the new x data
+        :param tolerance: weights smaller than this (relative to the
+        largest weight for the new x value) are removed
+        """
+        x_data = np.asarray(x_data, dtype=float)
+        new_x_values = np.asarray(new_x_values, dtype=float)
+        self._key = _array_key(x_data, new_x_values)
+        self._order = np.argsort(x_data, kind='stable')
+        x_sorted = x_data[self._order]
+
+        # not-a-knot knots, the same as interp1d
+        knots = make_interp_spline(x_sorted, np.zeros(len(x_sorted)),
+                                   k=3).t
+        inside = ((new_x_values >= x_sorted[0]) &
+                  (new_x_values <= x_sorted[-1]))
+        # spline = D c with the coefficients c = A^{-1} y,
+        # outside of the data the spline is zero (empty rows)
+        A = BSpline.design_matrix(x_sorted, knots, 3)
+        D = BSpline.design_matrix(new_x_values[inside], knots, 3)
+        weights = (D @ _banded_inverse(A.tocsr())).tocoo()
+        rows = np.flatnonzero(inside)[weights.row]
+        matrix = csr_matrix((weights.data, (rows, weights.col)),
+                            shape=(len(new_x_values), len(x_data)))
+
+        largest = abs(matrix).max(axis=1).toarray()
+        small = np.abs(matrix.data) < tolerance*np.repeat(
+            largest.ravel(), np.diff(matrix.indptr))
+        matrix.data[small] = 0.
+        matrix.eliminate_zeros()
+        self._matrix = matrix
+
+    def matches(self, x_data: ndarray, new_x_values: ndarray) -> bool:
+        """
+        Checks if the operator is for the x values
+        :param x_data: the original x data
+        :param new_x_values: the new x data
+        :return if the operator is for the x values
+        """
+        return self._key == _array_key(x_data, new_x_values)
+
+    @property
+    def matrix(self) -> csr_matrix:
+        """
+        :return the interpolation matrix (new x by sorted original x)
+        """
+        return self._matrix
+
+    def __call__(self, y_data: ndarray) -> ndarray:
+        """
+        Interpolates the y values onto the new x values
+        :param y_data: the original y data
+        :return the new y values
+        """
+        return self._matrix @ np.asarray(y_data, dtype=float)[self._order]
+
+
+def get_spline_operator(x_data: ndarray,
+                        new_x_values: ndarray) -> SplineOperator:
+    """
+    Gets the interpolation operator for the x values,
+    from the cache (OPERATOR_CACHE) if it has already been made.
+    :param x_data: the original x data
+    :param new_x_values: the new x data
+    :return the interpolation operator
+    """
+    key = _array_key(x_data, new_x_values)
+    operator = OPERATOR_CACHE.get(key)
+    if not isinstance(operator, SplineOperator):
+        operator = SplineOperator(x_data, new_x_values)
+        OPERATOR_CACHE.set(key, operator)
+    return operator
+
+
+def spline_many(x_data: ndarray, y_values: List[ndarray],
+                new_x_values: ndarray) -> List[ndarray]:
+    """
+    Splines several sets of y values, that share the same
+    x values (e.g. the y and e values of a spectrum).
+    Making an interpolation operator is slower than a few splines.
+    So the number of times each pair of x values is used is
+    recorded and once it reaches OPERATOR_THRESHOLD (e.g. for
+    a batch of spectra) an operator is made and used from then on.
+    :param x_data: the original x data
+    :param y_values: the list of original y values
+    :param new_x_values: the new x data
+    :return a list of the new y values
+    """
+    key = _array_key(x_data, new_x_values)
+    entry = OPERATOR_CACHE.get(key)
+    if not isinstance(entry, SplineOperator):
+        uses = 1 if entry is None else entry + 1
+        if uses < OPERATOR_THRESHOLD:
+            OPERATOR_CACHE.set(key, uses)
+            return [spline(x_data, y_data, new_x_values)
+                    for y_data in y_values]
+        entry = get_spline_operator(x_data, new_x_values)
+    return [entry(y_data) for y_data in y_values]
+
+
+def cached_spline(x_data: ndarray, y_data: ndarray,
+                  new_x_values: ndarray) -> ndarray:
+    """
+    The same as spline, but the results are stored in a cache
+    (SPLINE_CACHE) keyed on the contents of the arrays.
+    This is for data that is the same for lots of calculations
+    (e.g. the resolution for a batch of spectra).
+    :param x_data: the origianl x data
+    :param y_data: the original y data
+    :param new_x_values: the new x data
+    :return the new y values
+    """
+    key = _array_key(x_data, y_data, new_x_values)
+    new_y = SPLINE_CACHE.get(key)
+    if new_y is None:
+        new_y = spline(x_data, y_data, new_x_values)
+        new_y.setflags(write=False)
+        SPLINE_CACHE.set(key, new_y)
+    return np.array(new_y)
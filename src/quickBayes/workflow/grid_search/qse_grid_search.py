@@ -1,6 +1,6 @@
 from quickBayes.workflow.grid_search.template import GridSearchTemplate
 from quickBayes.functions.qse_fixed import QSEFixFunction
-from quickBayes.utils.spline import spline
+from quickBayes.utils.spline import spline_many, cached_spline
 from numpy import ndarray
 from typing import Dict
 import numpy as np
@@ -51,9 +51,9 @@ class QSEGridSearch(GridSearchTemplate):
         dx = x_data[1] - x_data[0]
         new_x = np.linspace(start_x, end_x, int((end_x - start_x)/dx))
 
-        sy = spline(x_data, y_data, new_x)
-        se = spline(x_data, e_data, new_x)
-        ry = spline(res['x'], res['y'], new_x)
+        sy, se = spline_many(x_data, [y_data, e_data], new_x)
+        # the resolution is often the same for lots of spectra
+        ry = cached_spline(res['x'], res['y'], new_x)
         super().preprocess_data(new_x, sy, se)
 
         return new_x, ry
@@ -1,10 +1,19 @@
 from quickBayes.workflow.template import WorkflowTemplate
 from quickBayes.log_likelihood import loglikelihood
 from quickBayes.functions.base import BaseFitFunction
+from quickBayes.utils.parallel import parallel
+from quickBayes.utils.shared_memory import (share_arrays, close_arrays,
+                                            SharedArray)
+from quickBayes.utils.general import save_npz
 
 from numpy import ndarray
 import numpy as np
 from abc import abstractmethod
+from functools import partial
+from typing import List
+import copy
+import os
+import time
 
 
 class Axis(object):
@@ -79,6 +88,8 @@ class GridSearchTemplate(WorkflowTemplate):
     - set_x_axis
     - set_y_axis
     - N
+    - save_checkpoint
+    - load_checkpoint
     """
     def __init__(self):
         """
@@ -88,6 +99,8 @@ class GridSearchTemplate(WorkflowTemplate):
         self._x_axis = None
         self._y_axis = None
         self._grid = None
+        self._completed = None
+        self._params = []
 
     def set_x_axis(self, start: float, end: float,
                    N: int, label: str) -> None:
@@ -231,23 +244,25 @@ class GridSearchTemplate(WorkflowTemplate):
         """
         return self._engine._lower, self._engine._upper
 
-    def execute(self, func: BaseFitFunction) -> (ndarray, ndarray):
+    def _fit_columns(self, func: BaseFitFunction,
+                     columns: List[int]) -> ndarray:
         """
-        Does the grid search. Needs the x and y axis to be set.
-        Also needs a fitting engine to be set.
+        Does the fits for the grid cells in the given columns
+        (indices on the x axis). Each fit is warm started from
+        the result of the previous cell.
         :param func: the fitting function
-        :return the X and Y values for the grid
+        :param columns: the indices of the x axis values to fit
+        :return the (unnormalised) z values for the columns,
+        the shape is (len(y axis), len(columns))
         """
-        if self._engine is None:
-            raise ValueError("please set a fit engine")
         x_data = self._data['x']
         y_data = self._data['y']
         e_data = self._data['e']
         scale = np.max(y_data)*(np.max(x_data) - np.min(x_data))
 
-        X, Y = self._generate_grid()
-        for i, xx in enumerate(self.get_x_axis.values):
-            func = self._set_x_value(func, xx)
+        z_values = np.zeros((self.get_y_axis.len, len(columns)))
+        for k, i in enumerate(columns):
+            func = self._set_x_value(func, self.get_x_axis.values[i])
             params = func.get_guess()
 
             for j, yy in enumerate(self.get_y_axis.values):
@@ -256,9 +271,266 @@ class GridSearchTemplate(WorkflowTemplate):
                 params, _ = self._engine.get_fit_parameters()
 
                 num = self.N(func)
-                self._grid[j][i] = self._get_z_value(len(x_data),
-                                                     num,
-                                                     scale)
-                self.update_fit_engine(func, params)
+                z_values[j][k] = self._get_z_value(len(x_data),
+                                                   num,
+                                                   scale)
+                with self.profile_stage('update'):
+                    self.update_fit_engine(func, params)
+        return z_values
+
+    def _tile_workflow(self, data: dict, raw: dict) -> 'GridSearchTemplate':
+        """
+        Creates a copy of the workflow for a tile of the grid.
+        The copy does not include the grid, the fit history or
+        the data, so it is small enough to send to the workers.
+        :param data: the dict of the data to fit (x, y, e)
+        :param raw: the dict of the original data (x, y, e)
+        :return the copy of the workflow
+        """
+        workflow = copy.copy(self)
+        workflow._data = data
+        workflow._raw = raw
+        workflow._grid = None
+        workflow._completed = None
+        workflow._params = []
+        workflow._engine = self._engine.empty_copy(raw['x'], raw['y'],
+                                                   raw['e'])
+        return workflow
+
+    def _get_tiles(self, N_jobs: int, chunk_size: int,
+                   columns: List[int] = None) -> List[List[int]]:
+        """
+        Splits the columns (x axis values) of the grid into tiles
+        :param N_jobs: the number of jobs, used if the chunk size is None
+        :param chunk_size: the number of columns per tile
+        :param columns: the indices of the columns to split, if None
+        (default) all of the columns are used
+        :return a list of the column indices for each tile
+        """
+        if columns is None:
+            columns = list(range(self.get_x_axis.len))
+        if chunk_size is None:
+            return [list(tile) for tile in np.array_split(columns, N_jobs)
+                    if len(tile) > 0]
+        if chunk_size < 1:
+            raise ValueError("The chunk size must be at least 1, "
+                             f"got {chunk_size}")
+        return [columns[j:j + chunk_size]
+                for j in range(0, len(columns), chunk_size)]
+
+    @property
+    def get_completed(self) -> ndarray:
+        """
+        Get the mask of the grid cells that have been fitted
+        :return the completed mask (same shape as the grid)
+        """
+        return self._completed
+
+    def save_checkpoint(self, file_name: str) -> None:
+        """
+        Saves the (unnormalised) grid values, the mask of completed
+        cells and the latest fit parameters (the warm start) to a
+        numpy .npz file.
+        :param file_name: the name of the checkpoint file
+        """
+        with self.profile_stage('checkpoint'):
+            save_npz(file_name, x_values=self.get_x_axis.values,
+                     y_values=self.get_y_axis.values, grid=self._grid,
+                     completed=self._completed,
+                     params=np.asarray(self._params, dtype=float))
+
+    def load_checkpoint(self, file_name: str) -> None:
+        """
+        Loads the grid values, the completed cells and the latest
+        fit parameters from a checkpoint. The x and y axes must
+        be set and match those in the checkpoint.
+        :param file_name: the name of the checkpoint file
+        """
+        with np.load(file_name) as checkpoint:
+            for name, axis in [('x_values', self.get_x_axis),
+                               ('y_values', self.get_y_axis)]:
+                if not np.array_equal(checkpoint[name], axis.values):
+                    raise ValueError(f"The {axis.label} axis does not "
+                                     "match the checkpoint "
+                                     f"{file_name}")
+            self._grid = np.array(checkpoint['grid'])
+            self._completed = np.array(checkpoint['completed'])
+            self._params = list(checkpoint['params'])
+
+    def _update_grid(self, columns: List[int], z_values: ndarray,
+                     params: ndarray) -> None:
+        """
+        Records the results for some columns of the grid
+        :param columns: the indices of the columns
+        :param z_values: the (unnormalised) z values for the columns
+        :param params: the latest fit parameters
+        """
+        self._grid[:, columns] = z_values
+        self._completed[:, columns] = True
+        self._params = list(params)
+
+    def execute(self, func: BaseFitFunction, N_jobs: int = 1,
+                backend: str = 'threads', chunk_size: int = None,
+                start_method: str = None, checkpoint: str = None,
+                resume: bool = False,
+                checkpoint_interval: float = 60.) -> (ndarray, ndarray):
+        """
+        Does the grid search. Needs the x and y axis to be set.
+        Also needs a fitting engine to be set.
+        If more than one job is requested the columns of the grid
+        (x axis values) are split into tiles, which are fitted in
+        parallel and then merged back into the grid. Each tile starts
+        from the current guess of the fit engine.
+        Smaller tiles (chunk_size) balance the load between the jobs
+        better, but each tile starts its fits from the guess.
+        Only the latest fit and covariance matrix are kept by the fit
+        engine (scalars retention), so the memory only grows with the
+        chi^2 values and parameters for each grid point. The previous
+        retention of the fit engine is restored at the end.
+        With a checkpoint file the grid is saved (at most every
+        checkpoint_interval seconds) after each column, or after
+        each set of N_jobs tiles, is completed.
+        :param func: the fitting function
+        :param N_jobs: the number of jobs (tiles) to use
+        :param backend: the parallel backend (threads, loky or
+        multiprocessing)
+        :param chunk_size: the number of columns per tile. None (default)
+        gives one tile per job
+        :param start_method: the start method for the multiprocessing
+        backend (e.g. fork or spawn)
+        :param checkpoint: the name of the checkpoint file (.npz), None
+        (default) for no checkpoints
+        :param resume: if to continue from the checkpoint file (if it
+        exists), the completed cells are skipped and the fits are
+        warm started from the saved parameters
+        :param checkpoint_interval: the minimum time (seconds) between
+        checkpoints, the final grid is always saved
+        :return the X and Y values for the grid
+        """
+        if self._engine is None:
+            raise ValueError("please set a fit engine")
+        if resume and checkpoint is None:
+            raise ValueError("A checkpoint file is needed to resume")
+        # restored after the grid search
+        retention = self._engine.retention
+        N_keep = self._engine.N_keep
+        self._engine.set_retention('scalars')
+        try:
+            X, Y = self._search(func, N_jobs, backend, chunk_size,
+                                start_method, checkpoint, resume,
+                                checkpoint_interval)
+        finally:
+            self._engine.set_retention(retention, N_keep)
         self._normalise_grid()
         return X, Y
+
+    def _search(self, func: BaseFitFunction, N_jobs: int, backend: str,
+                chunk_size: int, start_method: str, checkpoint: str,
+                resume: bool,
+                checkpoint_interval: float) -> (ndarray, ndarray):
+        """
+        Fits each point of the grid (see execute)
+        :param func: the fitting function
+        :param N_jobs: the number of jobs (tiles) to use
+        :param backend: the parallel backend
+        :param chunk_size: the number of columns per tile
+        :param start_method: the start method for the multiprocessing
+        backend
+        :param checkpoint: the name of the checkpoint file
+        :param resume: if to continue from the checkpoint file
+        :param checkpoint_interval: the minimum time (seconds) between
+        checkpoints
+        :return the X and Y values for the grid
+        """
+        X, Y = self._generate_grid()
+        self._completed = np.zeros(self._grid.shape, dtype=bool)
+        self._params = []
+        if resume and os.path.exists(checkpoint):
+            self.load_checkpoint(checkpoint)
+            if len(self._params) > 0:
+                self.update_fit_engine(func, self._params)
+        columns = [i for i in range(self.get_x_axis.len)
+                   if not np.all(self._completed[:, i])]
+
+        last_save = time.perf_counter()
+        serial = N_jobs <= 1 and chunk_size is None
+        if serial:
+            rounds = [[[i]] for i in columns]
+        else:
+            tiles = self._get_tiles(N_jobs, chunk_size, columns)
+            N_jobs = max(1, min(N_jobs, len(tiles)))
+            # with a checkpoint, only N_jobs tiles are done at a time
+            step = len(tiles) if checkpoint is None else N_jobs
+            rounds = [tiles[j:j + step] for j in range(0, len(tiles), step)]
+
+        data, raw = self._data, self._raw
+        if not serial and backend != 'threads':
+            # the workers get the names of the shared memory blocks
+            data = share_arrays(self._data)
+            same = all(self._raw[key] is self._data[key] for key in data)
+            raw = data if same else share_arrays(self._raw)
+        try:
+            if not serial:
+                fit_tile = partial(_fit_tile,
+                                   workflow=self._tile_workflow(data, raw),
+                                   func=func)
+            for tiles in rounds:
+                if serial:
+                    z_values = [self._fit_columns(func, tiles[0])]
+                    params = [self._engine.get_fit_parameters()[0]]
+                else:
+                    output = parallel(tiles, fit_tile, N_jobs, backend,
+                                      start_method=start_method)
+                    z_values, params = zip(*output)
+                for tile, z in zip(tiles, z_values):
+                    self._update_grid(tile, z, params[-1])
+
+                if (checkpoint is not None and time.perf_counter() -
+                        last_save >= checkpoint_interval):
+                    self.save_checkpoint(checkpoint)
+                    last_save = time.perf_counter()
+        finally:
+            if data is not self._data:
+                close_arrays(data)
+            if raw is not self._raw and raw is not data:
+                close_arrays(raw)
+
+        if checkpoint is not None:
+            self.save_checkpoint(checkpoint)
+        return X, Y
+
+
+def _as_array(value):
+    """
+    Gets the values of a SharedArray as a numpy array,
+    other values are not changed
+    :param value: the value
+    :return the numpy array (uses the shared memory) or the value
+    """
+    if isinstance(value, SharedArray):
+        return np.asarray(value)
+    return value
+
+
+def _fit_tile(columns: List[int], workflow: GridSearchTemplate,
+              func: BaseFitFunction) -> (ndarray, ndarray):
+    """
+    Does the fits for a tile (set of columns) of the grid.
+    The tile uses its own copy of the workflow (including
+    the fit engine) and the fitting function.
+    So the tiles are independent of each other.
+    The data can be in shared memory (SharedArrays), then
+    the tile uses the shared values rather than a copy.
+    :param columns: the indices of the x axis values to fit
+    :param workflow: the workflow for the tiles (see _tile_workflow)
+    :param func: the fitting function
+    :return the (unnormalised) z values for the columns and
+    the latest fit parameters
+    """
+    data = {key: _as_array(value) for key, value in workflow._data.items()}
+    # keep the raw data the same as the data, if they were the same
+    raw = {key: data[key] if value is workflow._data.get(key)
+           else _as_array(value) for key, value in workflow._raw.items()}
+    workflow = workflow._tile_workflow(data, raw)
+    z_values = workflow._fit_columns(copy.deepcopy(func), columns)
+    return z_values, workflow.fit_engine.get_fit_parameters()[0]
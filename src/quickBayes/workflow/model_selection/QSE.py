@@ -1,7 +1,10 @@
 from quickBayes.functions.qse_function import QSEFunction
-from quickBayes.utils.spline import spline
+from quickBayes.functions.SE import StretchExpTable
+from quickBayes.utils.spline import spline_many, cached_spline
 from quickBayes.utils.general import get_background_function
 from quickBayes.workflow.model_selection.template import ModelSelectionWorkflow
+from quickBayes.workflow.model_selection.batch import batch_model_selection
+from quickBayes.utils.results_sink import ResultsSink
 from quickBayes.functions.base import BaseFitFunction
 from quickBayes.utils.crop_data import crop
 
@@ -9,6 +12,8 @@ from quickBayes.utils.crop_data import crop
 from numpy import ndarray
 import numpy as np
 from typing import Dict, List
+from functools import partial
+import multiprocessing
 
 
 class QlStretchedExp(ModelSelectionWorkflow):
@@ -34,9 +39,9 @@ class QlStretchedExp(ModelSelectionWorkflow):
         dx = x_data[1] - x_data[0]
         new_x = np.linspace(start_x, end_x, int((end_x - start_x)/dx))
 
-        sy = spline(x_data, y_data, new_x)
-        se = spline(x_data, e_data, new_x)
-        ry = spline(res['x'], res['y'], new_x)
+        sy, se = spline_many(x_data, [y_data, e_data], new_x)
+        # the resolution is often the same for lots of spectra
+        ry = cached_spline(res['x'], res['y'], new_x)
         super().preprocess_data(new_x, sy, se)
 
         # Set the raw data
@@ -86,11 +91,12 @@ def qse_data_main(sample: Dict[str, ndarray], res: Dict[str, ndarray],
                   elastic: bool,
                   results: Dict[str, ndarray],
                   results_errors: Dict[str, ndarray],
-                  init_params: List[float] = None) -> (Dict[str, ndarray],
-                                                       Dict[str, ndarray],
-                                                       ndarray,
-                                                       List[ndarray],
-                                                       List[ndarray]):
+                  init_params: List[float] = None,
+                  table: StretchExpTable = None) -> (Dict[str, ndarray],
+                                                     Dict[str, ndarray],
+                                                     ndarray,
+                                                     List[ndarray],
+                                                     List[ndarray]):
     """
     The main function for calculating QSEdata.
     This uses the stretch exponential workflow
@@ -103,20 +109,23 @@ def qse_data_main(sample: Dict[str, ndarray], res: Dict[str, ndarray],
     :param results: dict of results
     :param results_errors: the dict of parameter errors
     :param init_params: initial values, if None (default) a guess will be made
+    :param table: the precomputed stretched exp table to use, if None
+    (default) the FFT is used
     :result dict of the fit parameters, their errors, the x range used, list
     of fit values and their errors.
     """
     # setup workflow
     workflow = QlStretchedExp(results, results_errors)
-    new_x, ry = workflow.preprocess_data(sample['x'], sample['y'],
-                                         sample['e'],
-                                         start_x, end_x, res)
+    with workflow.profile_stage('preprocess'):
+        new_x, ry = workflow.preprocess_data(sample['x'], sample['y'],
+                                             sample['e'],
+                                             start_x, end_x, res)
 
     max_num_peaks = 1
 
     # setup fit function
     BG = get_background_function(BG_type)
-    func = QSEFunction(BG, elastic, new_x, ry, start_x, end_x)
+    func = QSEFunction(BG, elastic, new_x, ry, start_x, end_x, table)
     lower, upper = func.get_bounds()
     """
     if the parameters have come in from another calculation bounds won't match
@@ -139,3 +148,50 @@ def qse_data_main(sample: Dict[str, ndarray], res: Dict[str, ndarray],
         fits.append(y)
         errors_fit.append(e)
     return results, results_errors, x_data, fits, errors_fit
+
+
+def qse_data_batch(x_data: ndarray, y_data: ndarray, e_data: ndarray,
+                   res: Dict[str, ndarray], BG_type: str,
+                   start_x: float, end_x: float, elastic: bool,
+                   init_params: List[float] = None,
+                   N: int = multiprocessing.cpu_count(),
+                   backend: str = 'threads', chunk_size: int = None,
+                   start_method: str = None, share_memory: bool = False,
+                   table: StretchExpTable = None,
+                   sink: ResultsSink = None
+                   ) -> (Dict[str, ndarray], Dict[str, ndarray],
+                         List[ndarray], List[List[ndarray]],
+                         List[List[ndarray]]):
+    """
+    The main function for calculating QSEdata for a stack of spectra.
+    :param x_data: the sample x data, 1D if shared or 2D
+    :param y_data: the sample y data, 2D (one row per spectrum)
+    :param e_data: the sample e data, 2D (one row per spectrum)
+    :param res: dict containing the resolution x, y data (keys = x, y),
+    the values are 1D if shared or 2D (one row per spectrum)
+    :param BG_type: the type of BG ("none", "flat", "linear")
+    :param start_x: the start x for the calculation
+    :param end_x: the end x for the calculation
+    :param elastic: if to include the elastic peak
+    :param init_params: initial values, if None (default) a guess will be made
+    :param N: the number of processes to use
+    :param backend: the parallel backend (threads, loky or multiprocessing)
+    :param chunk_size: the number of spectra sent to a worker at a time
+    :param start_method: the start method for the multiprocessing backend
+    :param share_memory: if to put the data into shared memory for the
+    process backends
+    :param table: the precomputed stretched exp table to use, if None
+    (default) the FFT is used
+    :param sink: the results sink to write the results to, None (default)
+    keeps them in memory
+    :result dict of the fit parameters, their errors (one value per
+    spectrum), list of the x ranges used, list of fit values and their
+    errors (one entry per spectrum).
+    """
+    main = partial(qse_data_main, table=table)
+    return batch_model_selection(main, x_data, y_data, e_data,
+                                 BG_type, start_x, end_x, elastic,
+                                 res=res, init_params=init_params, N=N,
+                                 backend=backend, chunk_size=chunk_size,
+                                 start_method=start_method,
+                                 share_memory=share_memory, sink=sink)
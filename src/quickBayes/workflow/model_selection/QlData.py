@@ -1,14 +1,19 @@
 from quickBayes.functions.qldata_function import QlDataFunction
-from quickBayes.utils.spline import spline
+from quickBayes.utils.spline import spline_many, cached_spline
 from quickBayes.utils.general import get_background_function
 from quickBayes.workflow.model_selection.template import ModelSelectionWorkflow
+from quickBayes.workflow.model_selection.batch import batch_model_selection
+from quickBayes.utils.results_sink import ResultsSink
 from quickBayes.functions.base import BaseFitFunction
 from quickBayes.utils.crop_data import crop
+from quickBayes.utils.seeding import estimate_peak, SCALES
 
 
 from numpy import ndarray
 import numpy as np
 from typing import Dict, List
+from functools import partial
+import multiprocessing
 
 
 class QLData(ModelSelectionWorkflow):
@@ -34,9 +39,9 @@ class QLData(ModelSelectionWorkflow):
         dx = x_data[1] - x_data[0]
         new_x = np.linspace(start_x, end_x, int((end_x - start_x)/dx))
 
-        sy = spline(x_data, y_data, new_x)
-        se = spline(x_data, e_data, new_x)
-        ry = spline(res['x'], res['y'], new_x)
+        sy, se = spline_many(x_data, [y_data, e_data], new_x)
+        # the resolution is often the same for lots of spectra
+        ry = cached_spline(res['x'], res['y'], new_x)
         super().preprocess_data(new_x, sy, se)
 
         # Set the raw data
@@ -56,17 +61,48 @@ class QLData(ModelSelectionWorkflow):
         func.add_single_lorentzian()
         return func
 
+    def _residual_guesses(self, func: BaseFitFunction, x_data: ndarray,
+                          residuals: ndarray) -> List[List[float]]:
+        """
+        Estimates the parameters of the new Lorentzian from the
+        largest peak in the residuals. The peak centre is tied to
+        the first function, so it is only a parameter of the new
+        Lorentzian if it is the first peak and there is no elastic
+        peak. Since the width is the least certain, there is a
+        candidate for each of the SCALES.
+        :param func: the fitting function (with the new Lorentzian)
+        :param x_data: the x data
+        :param residuals: the residuals (data - fit)
+        :return a list of the candidate [amplitude, FWHM], or
+        [amplitude, peak centre, FWHM] if the centre is a parameter
+        """
+        peak = estimate_peak(x_data, residuals)
+        if peak is None:
+            return []
+        height, centre, FWHM = peak
+        has_centre = not func.delta and func.N_peaks == 1
+        guesses = []
+        for scale in SCALES:
+            # the area of a Lorentzian with the same height
+            guess = [np.pi*height*scale*FWHM/2., scale*FWHM]
+            if has_centre:
+                guess.insert(1, centre)
+            guesses.append(guess)
+        return guesses
+
 
 def ql_data_main(sample: Dict[str, ndarray], res: Dict[str, ndarray],
                  BG_type: str, start_x: float, end_x: float,
                  elastic: bool,
                  results: Dict[str, ndarray],
                  results_errors: Dict[str, ndarray],
-                 init_params: List[float] = None) -> (Dict[str, ndarray],
-                                                      Dict[str, ndarray],
-                                                      ndarray,
-                                                      List[ndarray],
-                                                      List[ndarray]):
+                 init_params: List[float] = None,
+                 early_stopping: dict = None,
+                 speculative: dict = None) -> (Dict[str, ndarray],
+                                               Dict[str, ndarray],
+                                               ndarray,
+                                               List[ndarray],
+                                               List[ndarray]):
     """
     Method for wrapping the qldata workflow.
     :param sample: dict containing the sample x, y and e data (keys = x, y, e)
@@ -78,15 +114,22 @@ def ql_data_main(sample: Dict[str, ndarray], res: Dict[str, ndarray],
     :param results: dict of results
     :param results_errors: dict of errors for results
     :param init_params: initial values, if None a guess will be made
+    :param early_stopping: the options for the early stopping (see
+    enable_early_stopping), None (default) fits every number of features
+    :param speculative: the options for fitting every number of features
+    at the same time (see enable_speculative_fits), None (default) fits
+    them in order
     :result dict of the fit parameters, their errors, the x range used, list of
-    fit values and their errors.
+    fit values and their errors. The skipped numbers of features have a NaN
+    loglikelihood and no fit values.
     """
 
     # setup workflow
     workflow = QLData(results, results_errors)
-    new_x, ry = workflow.preprocess_data(sample['x'], sample['y'],
-                                         sample['e'],
-                                         start_x, end_x, res)
+    with workflow.profile_stage('preprocess'):
+        new_x, ry = workflow.preprocess_data(sample['x'], sample['y'],
+                                             sample['e'],
+                                             start_x, end_x, res)
 
     max_num_peaks = 3
 
@@ -98,6 +141,10 @@ def ql_data_main(sample: Dict[str, ndarray], res: Dict[str, ndarray],
     params = init_params if init_params is not None else func.get_guess()
     # just want a guess the same length as lower, it is not used
     workflow.set_scipy_engine(func.get_guess(), lower, upper)
+    if early_stopping is not None:
+        workflow.enable_early_stopping(**early_stopping)
+    if speculative is not None:
+        workflow.enable_speculative_fits(**speculative)
 
     # do the calculation
     func = workflow.execute(max_num_peaks, func, params)
@@ -107,8 +154,60 @@ def ql_data_main(sample: Dict[str, ndarray], res: Dict[str, ndarray],
     fits = []
     errors_fit = []
     x_data = []
-    for j in range(max_num_peaks):
+    for j in range(max_num_peaks - len(workflow.skipped)):
         x_data, y, e, df, de = engine.get_fit_values(j)
         fits.append(y)
         errors_fit.append(e)
     return results, results_errors, x_data, fits, errors_fit
+
+
+def ql_data_batch(x_data: ndarray, y_data: ndarray, e_data: ndarray,
+                  res: Dict[str, ndarray], BG_type: str,
+                  start_x: float, end_x: float, elastic: bool,
+                  init_params: List[float] = None,
+                  N: int = multiprocessing.cpu_count(),
+                  backend: str = 'threads', chunk_size: int = None,
+                  start_method: str = None, share_memory: bool = False,
+                  sink: ResultsSink = None,
+                  early_stopping: dict = None,
+                  speculative: dict = None
+                  ) -> (Dict[str, ndarray], Dict[str, ndarray],
+                        List[ndarray], List[List[ndarray]],
+                        List[List[ndarray]]):
+    """
+    Method for running the qldata workflow over a stack of spectra.
+    :param x_data: the sample x data, 1D if shared or 2D
+    :param y_data: the sample y data, 2D (one row per spectrum)
+    :param e_data: the sample e data, 2D (one row per spectrum)
+    :param res: dict containing the resolution x, y data (keys = x, y),
+    the values are 1D if shared or 2D (one row per spectrum)
+    :param BG_type: the type of BG ("none", "flat", "linear")
+    :param start_x: the start x for the calculation
+    :param end_x: the end x for the calculation
+    :param elastic: if to include the elastic peak
+    :param init_params: initial values, if None a guess will be made
+    :param N: the number of processes to use
+    :param backend: the parallel backend (threads, loky or multiprocessing)
+    :param chunk_size: the number of spectra sent to a worker at a time
+    :param start_method: the start method for the multiprocessing backend
+    :param share_memory: if to put the data into shared memory for the
+    process backends
+    :param sink: the results sink to write the results to, None (default)
+    keeps them in memory
+    :param early_stopping: the options for the early stopping (see
+    enable_early_stopping), None (default) fits every number of features
+    :param speculative: the options for fitting every number of features
+    at the same time (see enable_speculative_fits), None (default) fits
+    them in order
+    :result dict of the fit parameters, their errors (one value per
+    spectrum), list of the x ranges used, list of fit values and their
+    errors (one entry per spectrum).
+    """
+    main = partial(ql_data_main, early_stopping=early_stopping,
+                   speculative=speculative)
+    return batch_model_selection(main, x_data, y_data, e_data,
+                                 BG_type, start_x, end_x, elastic,
+                                 res=res, init_params=init_params, N=N,
+                                 backend=backend, chunk_size=chunk_size,
+                                 start_method=start_method,
+                                 share_memory=share_memory, sink=sink)
@@ -0,0 +1,198 @@
+from quickBayes.utils.parallel import parallel, parallel_iter
+from quickBayes.utils.shared_memory import share_arrays, close_arrays
+from quickBayes.utils.results_sink import ResultsSink, fingerprint
+
+from numpy import ndarray
+import numpy as np
+from functools import partial
+from typing import Callable, Dict, List
+import multiprocessing
+
+
+"""
+This file contains the code for running a model selection
+workflow over a stack of spectra (e.g. every Q value).
+Each spectrum is an independent calculation, so they are
+distributed over a worker pool and the results are
+collected into column-aligned arrays.
+For process backends the data can be put into shared
+memory, so it is not copied for every spectrum.
+For large stacks the results can be written to a results
+sink as each spectrum is completed, instead of being kept
+in memory.
+"""
+
+
+def _get_row(values: ndarray, index: int) -> ndarray:
+    """
+    Gets a single spectrum from the stack.
+    If the values are 1D they are shared by all spectra.
+    :param values: the 1D or 2D array of values
+    :param index: the index of the spectrum
+    :return the values for the spectrum
+    """
+    values = np.asarray(values)
+    if values.ndim == 1:
+        return values
+    return values[index]
+
+
+def _num_spectra(y_data: ndarray) -> int:
+    """
+    Gets the number of spectra in the stack
+    :param y_data: the 2D array of y values
+    :return the number of spectra
+    """
+    y_data = np.asarray(y_data)
+    if y_data.ndim != 2:
+        raise ValueError("The y data must be a 2D array "
+                         "(number of spectra, number of points)")
+    return y_data.shape[0]
+
+
+def _fit_spectrum(index: int, main: Callable, x_data: ndarray,
+                  y_data: ndarray, e_data: ndarray,
+                  res: Dict[str, ndarray], args: tuple,
+                  init_params: List[float]) -> tuple:
+    """
+    Runs the workflow main function for a single spectrum
+    :param index: the index of the spectrum
+    :param main: the workflow main function (e.g. ql_data_main)
+    :param x_data: the x data (1D or 2D)
+    :param y_data: the y data (2D)
+    :param e_data: the e data (2D)
+    :param res: the resolution (None if not needed), the
+    values can be 1D or 2D
+    :param args: the remaining arguments for the main function
+    :param init_params: the initial parameters (can be None)
+    :return the output of the main function
+    """
+    sample = {'x': _get_row(x_data, index),
+              'y': _get_row(y_data, index),
+              'e': _get_row(e_data, index)}
+    inputs = [sample]
+    if res is not None:
+        inputs.append({'x': _get_row(res['x'], index),
+                       'y': _get_row(res['y'], index)})
+    return main(*inputs, *args, {}, {}, init_params)
+
+
+def _align(dicts: List[Dict[str, List[float]]]) -> Dict[str, ndarray]:
+    """
+    Combines the results dicts (one per spectrum) into
+    a single dict of arrays. Each array has one value per
+    spectrum. If a spectrum is missing a key the value
+    is NaN.
+    :param dicts: the list of results dicts
+    :return a dict of column-aligned arrays
+    """
+    keys = []
+    for results in dicts:
+        keys += [key for key in results.keys() if key not in keys]
+
+    aligned = {}
+    for key in keys:
+        aligned[key] = np.full(len(dicts), np.nan)
+        for j, results in enumerate(dicts):
+            if key in results.keys():
+                aligned[key][j] = results[key][0]
+    return aligned
+
+
+def _run_with_sink(sink: ResultsSink, num_spectra: int,
+                   function: Callable, N: int, backend: str,
+                   chunk_size: int, start_method: str) -> None:
+    """
+    Runs the remaining spectra (those not in the sink), each one
+    is written to the sink as soon as it is complete.
+    :param sink: the results sink
+    :param num_spectra: the number of spectra
+    :param function: the function to run for each spectrum
+    :param N: the number of processes to use
+    :param backend: the parallel backend
+    :param chunk_size: the number of spectra sent to a worker at a time
+    :param start_method: the start method for the multiprocessing backend
+    """
+    completed = sink.completed
+    remaining = [j for j in range(num_spectra) if j not in completed]
+    for index, output in parallel_iter(remaining, function, N, backend,
+                                       chunk_size, start_method):
+        sink.write(index, *output)
+    sink.flush()
+
+
+def batch_model_selection(main: Callable, x_data: ndarray,
+                          y_data: ndarray, e_data: ndarray,
+                          *args, res: Dict[str, ndarray] = None,
+                          init_params: List[float] = None,
+                          N: int = multiprocessing.cpu_count(),
+                          backend: str = 'threads', chunk_size: int = None,
+                          start_method: str = None,
+                          share_memory: bool = False,
+                          sink: ResultsSink = None
+                          ) -> (Dict[str, ndarray],
+                                Dict[str, ndarray],
+                                List[ndarray],
+                                List[List[ndarray]],
+                                List[List[ndarray]]):
+    """
+    Runs a model selection main function over a stack of spectra.
+    :param main: the workflow main function (e.g. ql_data_main)
+    :param x_data: the x data, 1D if shared or 2D (one row per spectrum)
+    :param y_data: the y data, 2D (one row per spectrum)
+    :param e_data: the e data, 2D (one row per spectrum)
+    :param args: the arguments for the main function, excluding the
+    sample, resolution, results and errors
+    :param res: the resolution dict (keys = x, y). The values can be 1D if
+    shared or 2D (one row per spectrum). None if the workflow does not
+    use a resolution.
+    :param init_params: initial values, if None a guess will be made
+    :param N: the number of processes to use
+    :param backend: the parallel backend (threads, loky or multiprocessing)
+    :param chunk_size: the number of spectra sent to a worker at a time,
+    None (default) lets the backend decide
+    :param start_method: the start method for the multiprocessing backend
+    :param share_memory: if to put the x, y, e and resolution data into
+    shared memory for the process backends (default False)
+    :param sink: the results sink (e.g. NpzSink) to write the results to,
+    None (default) keeps them in memory. Each spectrum is written as soon
+    as it is complete. Spectra that are already in the sink are skipped,
+    so an interrupted run can be resumed. The sink must be for the same
+    data and arguments, otherwise a ValueError is raised.
+    :return dict of the fit parameters, their errors (one value per spectrum
+    for each key), list of the x ranges used, list of the fit values and list
+    of their errors (one entry per spectrum). With a sink these are loaded
+    from it (the lists are empty if it does not store the curves)
+    """
+    num_spectra = _num_spectra(y_data)
+    if sink is not None:
+        sink.check_fingerprint(fingerprint(main, x_data, y_data, e_data,
+                                           res, args, init_params))
+    data = {'x': x_data, 'y': y_data, 'e': e_data}
+    if share_memory and backend != 'threads':
+        data = share_arrays(data)
+        if res is not None:
+            res = share_arrays(res)
+    function = partial(_fit_spectrum, main=main, x_data=data['x'],
+                       y_data=data['y'], e_data=data['e'], res=res,
+                       args=args, init_params=init_params)
+    try:
+        if sink is None:
+            output = parallel(list(range(num_spectra)), function, N,
+                              backend, chunk_size, start_method)
+        else:
+            _run_with_sink(sink, num_spectra, function, N, backend,
+                           chunk_size, start_method)
+    finally:
+        close_arrays(data)
+        if res is not None:
+            close_arrays(res)
+
+    if sink is not None:
+        return sink.load(num_spectra)
+    results = _align([out[0] for out in output])
+    errors = _align([out[1] for out in output])
+    x_data = [out[2] for out in output]
+    fits = [out[3] for out in output]
+    fit_errors = [out[4] for out in output]
+    return results, errors, x_data, fits, fit_errors
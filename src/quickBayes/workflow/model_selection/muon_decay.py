@@ -3,9 +3,15 @@ from quickBayes.functions.exp_decay import ExpDecay
 from quickBayes.utils.general import get_background_function
 from quickBayes.utils.crop_data import crop
 from quickBayes.workflow.model_selection.template import ModelSelectionWorkflow
+from quickBayes.workflow.model_selection.batch import batch_model_selection
+from quickBayes.utils.results_sink import ResultsSink
 from quickBayes.functions.base import BaseFitFunction
+from quickBayes.utils.seeding import estimate_decay, SCALES
 from numpy import ndarray
+import numpy as np
 from typing import Dict, List
+from functools import partial
+import multiprocessing
 
 
 class MuonExpDecay(ModelSelectionWorkflow):
@@ -41,16 +47,38 @@ class MuonExpDecay(ModelSelectionWorkflow):
         func.add_function(exp_function)
         return func
 
+    def _residual_guesses(self, func: BaseFitFunction, x_data: ndarray,
+                          residuals: ndarray) -> List[List[float]]:
+        """
+        Estimates the amplitude and decay rate of the new
+        exponential decay from the residuals. There is a candidate
+        for each of the SCALES of the rate, with the same
+        starting value.
+        :param func: the fitting function (with the new decay)
+        :param x_data: the x data
+        :param residuals: the residuals (data - fit)
+        :return a list of the candidate [amplitude, lambda]
+        """
+        decay = estimate_decay(x_data, residuals)
+        if decay is None:
+            return []
+        amplitude, rate = decay
+        start = amplitude*np.exp(-rate*x_data[0])
+        return [[start*np.exp(scale*rate*x_data[0]), scale*rate]
+                for scale in SCALES]
+
 
 def muon_expdecay_main(sample: Dict[str, ndarray],
                        BG_type: str, start_x: float, end_x: float,
                        results: Dict[str, ndarray],
                        results_errors: Dict[str, ndarray],
-                       init_params: List[float] = None) -> (Dict[str, ndarray],
-                                                            Dict[str, ndarray],
-                                                            ndarray,
-                                                            List[ndarray],
-                                                            List[ndarray]):
+                       init_params: List[float] = None,
+                       early_stopping: dict = None,
+                       speculative: dict = None) -> (Dict[str, ndarray],
+                                                     Dict[str, ndarray],
+                                                     ndarray,
+                                                     List[ndarray],
+                                                     List[ndarray]):
     """
     The main function for calculating muon decay rates.
     Uses the muon exp decay workflow
@@ -61,8 +89,14 @@ def muon_expdecay_main(sample: Dict[str, ndarray],
     :param results: dict of results
     :param results_errors: dict of errors for results
     :param init_params: initial values, if None a guess will be made
+    :param early_stopping: the options for the early stopping (see
+    enable_early_stopping), None (default) fits every number of features
+    :param speculative: the options for fitting every number of features
+    at the same time (see enable_speculative_fits), None (default) fits
+    them in order
     :result dict of the fit parameters, their errors, the x range used, list of
-    fit values and their errors.
+    fit values and their errors. The skipped numbers of features have a NaN
+    loglikelihood and no fit values.
     """
     # construct fitting function
     BG = get_background_function(BG_type)
@@ -72,10 +106,15 @@ def muon_expdecay_main(sample: Dict[str, ndarray],
 
     # setup workflow
     workflow = MuonExpDecay(results, results_errors)
-    workflow.preprocess_data(sample['x'], sample['y'], sample['e'],
-                             start_x, end_x)
+    with workflow.profile_stage('preprocess'):
+        workflow.preprocess_data(sample['x'], sample['y'], sample['e'],
+                                 start_x, end_x)
     params = init_params if init_params is not None else func.get_guess()
     workflow.set_scipy_engine(params, lower, upper)
+    if early_stopping is not None:
+        workflow.enable_early_stopping(**early_stopping)
+    if speculative is not None:
+        workflow.enable_speculative_fits(**speculative)
 
     # do the calculation
     max_features = 4
@@ -86,9 +125,58 @@ def muon_expdecay_main(sample: Dict[str, ndarray],
     fits = []
     errors_fit = []
     x_data = []
-    for j in range(max_features):
+    for j in range(max_features - len(workflow.skipped)):
         x_data, y, e, df, de = engine.get_fit_values(j)
         fits.append(y)
         errors_fit.append(e)
 
     return results, results_errors, x_data, fits, errors_fit
+
+
+def muon_expdecay_batch(x_data: ndarray, y_data: ndarray, e_data: ndarray,
+                        BG_type: str, start_x: float, end_x: float,
+                        init_params: List[float] = None,
+                        N: int = multiprocessing.cpu_count(),
+                        backend: str = 'threads', chunk_size: int = None,
+                        start_method: str = None, share_memory: bool = False,
+                        sink: ResultsSink = None,
+                        early_stopping: dict = None,
+                        speculative: dict = None
+                        ) -> (Dict[str, ndarray], Dict[str, ndarray],
+                              List[ndarray], List[List[ndarray]],
+                              List[List[ndarray]]):
+    """
+    The main function for calculating muon decay rates for a
+    stack of spectra (e.g. detectors).
+    :param x_data: the sample x data, 1D if shared or 2D
+    :param y_data: the sample y data, 2D (one row per spectrum)
+    :param e_data: the sample e data, 2D (one row per spectrum)
+    :param BG_type: the type of BG ("none", "flat", "linear")
+    :param start_x: the start x for the calculation
+    :param end_x: the end x for the calculation
+    :param init_params: initial values, if None a guess will be made
+    :param N: the number of processes to use
+    :param backend: the parallel backend (threads, loky or multiprocessing)
+    :param chunk_size: the number of spectra sent to a worker at a time
+    :param start_method: the start method for the multiprocessing backend
+    :param share_memory: if to put the data into shared memory for the
+    process backends
+    :param sink: the results sink to write the results to, None (default)
+    keeps them in memory
+    :param early_stopping: the options for the early stopping (see
+    enable_early_stopping), None (default) fits every number of features
+    :param speculative: the options for fitting every number of features
+    at the same time (see enable_speculative_fits), None (default) fits
+    them in order
+    :result dict of the fit parameters, their errors (one value per
+    spectrum), list of the x ranges used, list of fit values and their
+    errors (one entry per spectrum).
+    """
+    main = partial(muon_expdecay_main, early_stopping=early_stopping,
+                   speculative=speculative)
+    return batch_model_selection(main, x_data, y_data, e_data,
+                                 BG_type, start_x, end_x,
+                                 init_params=init_params, N=N,
+                                 backend=backend, chunk_size=chunk_size,
+                                 start_method=start_method,
+                                 share_memory=share_memory, sink=sink)
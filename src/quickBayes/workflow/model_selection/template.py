@@ -2,11 +2,42 @@ from quickBayes.functions.base import BaseFitFunction
 from quickBayes.workflow.template import WorkflowTemplate
 
 from quickBayes.log_likelihood import loglikelihood
+from quickBayes.utils.general import update_guess
+from quickBayes.utils.parallel import parallel
+from quickBayes.utils.seeding import clip_candidates
 
 from numpy import ndarray
 import numpy as np
-from typing import Dict
+from typing import Dict, List
 from abc import abstractmethod
+import copy
+
+
+def _fit_candidate(args: tuple):
+    """
+    Does a fit for a candidate starting point, on a copy of the
+    fit engine (and function) so the fits can run in parallel.
+    :param args: the fit engine, fitting function, x, y and e data
+    :return the fit engine after the fit
+    """
+    engine, func, x_data, y_data, e_data = args
+    engine.do_fit(x_data, y_data, e_data, func)
+    return engine
+
+
+def _fit_order(args: tuple):
+    """
+    Does the fit for one number of features (model order), on a
+    copy of the fit engine, so all of the orders can run in parallel.
+    :param args: the number of features, fit engine, fitting function,
+    x, y and e data
+    :return the fit engine after the fit
+    """
+    N, engine, func, x_data, y_data, e_data = args
+    if engine.profiler is not None:
+        engine.profiler.set_N(N)
+    engine.do_fit(x_data, y_data, e_data, func)
+    return engine
 
 
 class ModelSelectionWorkflow(WorkflowTemplate):
@@ -22,10 +53,12 @@ class ModelSelectionWorkflow(WorkflowTemplate):
     The properties are:
     - fit_engine
     - get_parameters_and_errors
+    - skipped
 
     To add a fit engine:
     - set_scipy_engine (scipy curve fit)
     - set_gofit_engine (gofit)
+    - set_mcmc_engine (MCMC)
 
     Other methods:
     - preprocess_data
@@ -33,6 +66,13 @@ class ModelSelectionWorkflow(WorkflowTemplate):
     - update_function (call this one not the overwritten one)
     - report
     - execute
+    - enable_seeding
+    - enable_early_stopping
+    - enable_speculative_fits
+
+    The inherited class can include:
+    - _residual_guesses, to estimate the new feature from the
+    residuals (used by the seeding)
     """
 
     def __init__(self, results: Dict[str, ndarray],
@@ -44,6 +84,10 @@ class ModelSelectionWorkflow(WorkflowTemplate):
         """
         self._results_dict = results
         self._errors_dict = results_errors
+        self._seeding = None
+        self._stopping = None
+        self._speculative = None
+        self._skipped = []
         super().__init__()
 
     @property
@@ -55,6 +99,15 @@ class ModelSelectionWorkflow(WorkflowTemplate):
         """
         return self._results_dict, self._errors_dict
 
+    @property
+    def skipped(self) -> List[int]:
+        """
+        The number of features that were not fitted by the last
+        execute, because of the early stopping.
+        :return the list of skipped numbers of features
+        """
+        return self._skipped
+
     @abstractmethod
     def _update_function(self, func: BaseFitFunction) -> BaseFitFunction:
         """
@@ -79,6 +132,206 @@ class ModelSelectionWorkflow(WorkflowTemplate):
         function.update_prefix(f'N{N}:')
         return function
 
+    def enable_seeding(self, N_candidates: int = 3,
+                       fit_candidates: bool = False, N_jobs: int = 1,
+                       backend: str = 'threads') -> None:
+        """
+        Enables the residual seeding. Before a feature is added, the
+        residuals of the previous fit are used to estimate the
+        parameters of the new feature (see _residual_guesses).
+        The candidates (and the default guess) are ranked by their
+        chi^2 and the best N_candidates are kept.
+        If fit_candidates is False, the best one is used as the
+        starting point for the fit. Otherwise a fit is done from each
+        of them (in parallel) and the one with the lowest chi^2 is kept.
+        The gofit engine uses all of them as seeds instead.
+        :param N_candidates: the maximum number of candidates
+        :param fit_candidates: if to fit from every candidate
+        :param N_jobs: the number of candidates to fit at the same time
+        :param backend: the parallel backend (threads, loky or
+        multiprocessing)
+        """
+        if N_candidates < 1:
+            raise ValueError("N_candidates must be at least 1, "
+                             f"got {N_candidates}")
+        self._seeding = {'N_candidates': N_candidates,
+                         'fit_candidates': fit_candidates,
+                         'N_jobs': N_jobs, 'backend': backend}
+
+    def enable_early_stopping(self, margin: float = 1., N_drops: int = 1,
+                              overparameterised: bool = True) -> None:
+        """
+        Enables the early stopping of execute. It stops adding features
+        once the loglikelihood has been more than margin below the best
+        loglikelihood for N_drops consecutive numbers of features, or
+        (if overparameterised) the fit is overparameterised (a
+        covariance matrix value is greater than 1, see loglikelihood).
+        The skipped numbers of features are reported with NaN values
+        (loglikelihood, parameters and errors) and are in the skipped
+        property.
+        :param margin: the drop in the loglikelihood (log_10) that counts
+        :param N_drops: the number of consecutive drops to stop after
+        :param overparameterised: if to stop for an overparameterised fit
+        """
+        if margin < 0.:
+            raise ValueError(f"The margin must not be negative, got {margin}")
+        if N_drops < 1:
+            raise ValueError(f"N_drops must be at least 1, got {N_drops}")
+        self._stopping = {'margin': margin, 'N_drops': N_drops,
+                          'overparameterised': overparameterised}
+
+    def enable_speculative_fits(self, N_jobs: int = 1,
+                                backend: str = 'threads',
+                                refine: bool = False) -> None:
+        """
+        Enables the speculative mode of execute. The fits only depend
+        on the previous number of features for the starting guess.
+        So in this mode every number of features is fitted at the same
+        time (N_jobs at a time), each starting from the default guess.
+        The fits are then reported in the usual order.
+        If refine is True, each number of features (from N=2) is then
+        fitted again starting from the previous result (as in the
+        sequential mode) and the fit with the lowest chi^2 is kept.
+        The seeding and early stopping are not used in this mode.
+        :param N_jobs: the number of fits to do at the same time
+        :param backend: the parallel backend (threads, loky or
+        multiprocessing)
+        :param refine: if to refine the fits with a warm start
+        """
+        self._speculative = {'N_jobs': N_jobs, 'backend': backend,
+                             'refine': refine}
+
+    def _is_overparameterised(self) -> bool:
+        """
+        Checks if the latest fit is overparameterised, using the
+        same test as the loglikelihood
+        :return if the fit is overparameterised
+        """
+        covar = self._engine.get_covariance_matrix()
+        return bool(np.max(np.abs(covar)) > 1)
+
+    def _skip(self, func: BaseFitFunction, N_values: List[int]) -> None:
+        """
+        Records the numbers of features that are not fitted.
+        They have NaN values for every result that a fit would
+        report (the loglikelihood, parameters and errors), so
+        the results for each spectrum still line up if the dicts
+        are used for lots of spectra.
+        :param func: the fitting function (for the last fit)
+        :param N_values: the skipped numbers of features
+        """
+        func = copy.deepcopy(func)
+        for N in N_values:
+            self._skipped.append(N)
+            func = self.update_function(func, N)
+            values = [np.nan]*func.N_params
+            self._results_dict = func.report(self._results_dict, *values)
+            self._errors_dict = func.report_errors(self._errors_dict,
+                                                   values, values)
+            names = [f'N{N}:loglikelihood']
+            if self._engine.name == 'mcmc':
+                names.append(f'N{N}:log10_evidence')
+            for name in names:
+                if name in self._results_dict.keys():
+                    self._results_dict[name].append(np.nan)
+                else:
+                    self._results_dict[name] = [np.nan]
+
+    def _residual_guesses(self, func: BaseFitFunction, x_data: ndarray,
+                          residuals: ndarray) -> List[List[float]]:
+        """
+        Estimates the parameters for the new feature from the
+        residuals of the previous fit. The parameters are the ones
+        added to the end of the guess when the feature is added,
+        so each candidate must have all of them (in the same order).
+        It will be unique to the workflow, by default there are none.
+        :param func: the fitting function (with the new feature)
+        :param x_data: the x data
+        :param residuals: the residuals (data - fit)
+        :return a list of the candidate parameters for the new feature
+        """
+        return []
+
+    def _get_residuals(self, func: BaseFitFunction,
+                       params: ndarray) -> ndarray:
+        """
+        Gets the residuals of the fitting function (before the
+        new feature is added), if the seeding is enabled.
+        :param func: the fitting function
+        :param params: the fitting parameters
+        :return the residuals (None if the seeding is not enabled)
+        """
+        if self._seeding is None:
+            return None
+        guess = update_guess(list(params), func)
+        return self._data['y'] - func(self._data['x'], *guess)
+
+    def _get_candidates(self, func: BaseFitFunction, params: ndarray,
+                        residuals: ndarray,
+                        N_previous: int) -> List[ndarray]:
+        """
+        Gets the starting parameters for the fit, best first.
+        Without seeding this is just the parameters.
+        :param func: the fitting function (with the new feature)
+        :param params: the fitting parameters (without the new feature)
+        :param residuals: the residuals of the previous fit
+        :param N_previous: the number of parameters without the new
+        feature
+        :return the list of candidate parameters
+        """
+        if residuals is None:
+            return [params]
+        x, y, e = self._data['x'], self._data['y'], self._data['e']
+        with self.profile_stage('seeding'):
+            default = update_guess(list(params), func)
+            lower, upper = self._get_bounds(func)
+            guesses = clip_candidates(self._residual_guesses(func, x,
+                                                             residuals),
+                                      lower, upper)
+            N_new = len(default) - N_previous
+            candidates = [default]
+            for guess in guesses:
+                if len(guess) != N_new:
+                    raise ValueError("The guess for the new feature must "
+                                     f"have {N_new} parameters, got "
+                                     f"{len(guess)}")
+                candidates.append(default[:N_previous] + guess)
+
+            chi2 = [np.sum(((func(x, *candidate) - y)/e)**2)
+                    for candidate in candidates]
+        # stable, so the default is first if there is a tie
+        order = np.argsort(chi2, kind='stable')
+        return [candidates[j] for j in
+                order[:self._seeding['N_candidates']]]
+
+    def _fit_candidates(self, func: BaseFitFunction,
+                        candidates: List[ndarray]) -> None:
+        """
+        Does the fit, from the best candidate or (if requested)
+        from each of the candidates in parallel.
+        :param func: the fitting function
+        :param candidates: the list of starting parameters, best first
+        """
+        x, y, e = self._data['x'], self._data['y'], self._data['e']
+        seeding = self._seeding
+        if seeding is not None and self._engine.name == 'gofit':
+            self._engine.set_seeds(candidates)
+        if (seeding is None or not seeding['fit_candidates'] or
+                self._engine.name == 'gofit' or len(candidates) == 1):
+            self._engine.do_fit(x, y, e, func)
+            return
+
+        # the copies do not include the fit history
+        fits = []
+        for candidate in candidates:
+            self.update_fit_engine(func, candidate)
+            fits.append((self._engine.empty_copy(), copy.deepcopy(func),
+                         x, y, e))
+        engines = parallel(fits, _fit_candidate, seeding['N_jobs'],
+                           seeding['backend'])
+        chi2 = [engine.get_chi_squared() for engine in engines]
+        self._engine.add_fit_from(engines[int(np.argmin(chi2))])
+
     def report(self, func: BaseFitFunction, N: int, beta: float) -> ndarray:
         """
         Reports the latest fit parameters and records the fit
@@ -110,6 +363,15 @@ class ModelSelectionWorkflow(WorkflowTemplate):
                                                            covar,
                                                            N, beta)]
 
+        if self._engine.name == 'mcmc':
+            # the evidence from the samples is an alternative
+            evidence_name = f'N{N}:log10_evidence'
+            evidence = self._engine.get_log10_evidence()
+            if evidence_name in self._results_dict.keys():
+                self._results_dict[evidence_name].append(evidence)
+            else:
+                self._results_dict[evidence_name] = [evidence]
+
         return params
 
     def execute(self, max_num_features: int,
@@ -119,6 +381,8 @@ class ModelSelectionWorkflow(WorkflowTemplate):
         The main part of the analysis.
         It increments the number of features in the fitting function,
         does a fit and then records the results.
+        If early stopping is enabled, it can stop before
+        max_num_features (see enable_early_stopping).
         :param max_num_features: the maximum number of features
         :param func: the fitting function
         :param params: the (optional) initial fit parameters
@@ -136,11 +400,86 @@ class ModelSelectionWorkflow(WorkflowTemplate):
         beta = np.max(self._data['y'])*(np.max(self._data['x']) -
                                         np.min(self._data['x']))
 
+        if self._speculative is not None:
+            self._execute_speculative(max_num_features, func, params, beta)
+            return
+
+        self._skipped = []
+        best = -np.inf
+        N_drops = 0
         for N in range(1, max_num_features + 1):
-            func = self.update_function(func, N)
-            self.update_fit_engine(func, params)
+            self._set_profile_N(N)
+            with self.profile_stage('update'):
+                residuals = self._get_residuals(func, params)
+                N_previous = func.N_params
+                func = self.update_function(func, N)
+                candidates = self._get_candidates(func, params, residuals,
+                                                  N_previous)
+                self.update_fit_engine(func, candidates[0])
+
+            self._fit_candidates(func, candidates)
+
+            with self.profile_stage('report'):
+                params = self.report(func, N, beta)
 
-            self._engine.do_fit(self._data['x'], self._data['y'],
-                                self._data['e'], func)
+            if self._stopping is None:
+                continue
+            prob = self._results_dict[f'N{N}:loglikelihood'][-1]
+            margin = self._stopping['margin']
+            N_drops = N_drops + 1 if prob < best - margin else 0
+            best = max(best, prob)
+            if (N_drops >= self._stopping['N_drops'] or
+                    (self._stopping['overparameterised'] and
+                     self._is_overparameterised())):
+                self._skip(func, range(N + 1, max_num_features + 1))
+                break
+        self._set_profile_N(None)
 
-            params = self.report(func, N, beta)
+    def _execute_speculative(self, max_num_features: int,
+                             func: BaseFitFunction, params: ndarray,
+                             beta: float) -> None:
+        """
+        Fits every number of features at the same time
+        (see enable_speculative_fits) and then records the results.
+        :param max_num_features: the maximum number of features
+        :param func: the fitting function
+        :param params: the (optional) initial fit parameters
+        :param beta: the beta scaling factor
+        """
+        x, y, e = self._data['x'], self._data['y'], self._data['e']
+        speculative = self._speculative
+        self._skipped = []
+
+        # a copy of the function and fit engine for each order
+        funcs = []
+        orders = []
+        for N in range(1, max_num_features + 1):
+            self._set_profile_N(N)
+            with self.profile_stage('update'):
+                func = self.update_function(func, N)
+                funcs.append(copy.deepcopy(func))
+                self.update_fit_engine(funcs[-1], params)
+                orders.append((N, self._engine.empty_copy(), funcs[-1],
+                               x, y, e))
+        self._set_profile_N(None)
+        engines = parallel(orders, _fit_order, speculative['N_jobs'],
+                           speculative['backend'])
+
+        if speculative['refine']:
+            for N in range(2, max_num_features + 1):
+                self._set_profile_N(N)
+                with self.profile_stage('refine'):
+                    previous, _ = engines[N - 2].get_fit_parameters()
+                    self.update_fit_engine(funcs[N - 1], previous)
+                    engine = self._engine.empty_copy()
+                    engine.do_fit(x, y, e, funcs[N - 1])
+                    if (engine.get_chi_squared() <
+                            engines[N - 1].get_chi_squared()):
+                        engines[N - 1] = engine
+
+        for N in range(1, max_num_features + 1):
+            self._set_profile_N(N)
+            with self.profile_stage('report'):
+                self._engine.add_fit_from(engines[N - 1])
+                self.report(funcs[N - 1], N, beta)
+        self._set_profile_N(None)
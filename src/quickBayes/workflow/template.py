@@ -1,8 +1,11 @@
 from quickBayes.fitting.scipy_engine import ScipyFitEngine
 from quickBayes.fitting.gofit_engine import GoFitEngine
+from quickBayes.fitting.mcmc_engine import MCMCFitEngine
 from quickBayes.functions.base import BaseFitFunction
 
 from quickBayes.utils.general import update_guess
+from quickBayes.utils.profiling import (Profiler, get_active_profiler,
+                                        stage)
 
 from numpy import ndarray
 from abc import abstractmethod
@@ -17,24 +20,31 @@ class WorkflowTemplate(object):
 
     The properties are:
     - fit_engine
+    - profile_report
 
     To add a fit engine:
     - set_scipy_engine (scipy curve fit)
     - set_gofit_engine (gofit)
+    - set_mcmc_engine (MCMC)
 
     Other methods:
     - preprocess_data
     - update_fit_engine
     - update_function (call this one not the overwritten one)
     - execute
+    - enable_profiling
+    - profile_stage
     """
     def __init__(self):
         """
-        Set the results and error dicts for reporting
+        Set the results and error dicts for reporting.
+        If a profile context is active, it is used to profile
+        the workflow.
         """
         self._engine = None
         self._data = None
         self._raw = None
+        self._profiler = get_active_profiler()
 
     @property
     def get_raw(self):
@@ -53,6 +63,44 @@ class WorkflowTemplate(object):
         """
         return self._engine
 
+    @property
+    def profile_report(self) -> dict:
+        """
+        Gets the time, calls, function evaluations and optimiser
+        iterations for each stage of the workflow (see Profiler.report).
+        :return the profile report (None if profiling is not enabled)
+        """
+        if self._profiler is None:
+            return None
+        return self._profiler.report()
+
+    def enable_profiling(self, profiler: Profiler = None) -> None:
+        """
+        Enables profiling of the workflow and its fit engine.
+        :param profiler: the profiler to use, if None (default)
+        a new one is created
+        """
+        self._profiler = Profiler() if profiler is None else profiler
+        if self._engine is not None:
+            self._engine.set_profiler(self._profiler)
+
+    def profile_stage(self, name: str):
+        """
+        Gets a context manager for timing a stage of the workflow.
+        It does nothing if profiling is not enabled.
+        :param name: the name of the stage
+        :return the context manager
+        """
+        return stage(self._profiler, name)
+
+    def _set_profile_N(self, N: int) -> None:
+        """
+        Sets the number of features for the profile
+        :param N: the number of features (None if not relevant)
+        """
+        if self._profiler is not None:
+            self._profiler.set_N(N)
+
     def preprocess_data(self, x_data: ndarray,
                         y_data: ndarray, e_data: ndarray,
                         *args) -> None:
@@ -83,7 +131,9 @@ class WorkflowTemplate(object):
         if self._engine.name == 'scipy':
             self.update_scipy_fit_engine(func, params)
         elif self._engine.name == 'gofit':
-            self.update_gofit_engine(func)
+            self.update_gofit_engine(func, params)
+        elif self._engine.name == 'mcmc':
+            self.update_mcmc_engine(func, params)
         else:
             raise RuntimeError("The fit engine is "
                                f"{self._engine.name} "
@@ -115,17 +165,19 @@ class WorkflowTemplate(object):
                              "an equivalent method")
 
     def set_scipy_engine(self, guess: ndarray, lower: ndarray,
-                         upper: ndarray) -> None:
+                         upper: ndarray, method: str = 'curve_fit') -> None:
         """
         Method to set the fit engine to be scipy
         :param guess: the starting guess for the fit
         :param lower: the lower bound for the fit
         :param upper: the upper bound for the fit
+        :param method: the scipy method (curve_fit or least_squares)
         """
         self._check_engine_and_data_set_valid()
         self._engine = ScipyFitEngine(self._raw['x'], self._raw['y'],
                                       self._raw['e'], lower, upper,
-                                      guess)
+                                      guess, method=method)
+        self._engine.set_profiler(self._profiler)
 
     def _get_bounds(self, func: BaseFitFunction) -> (ndarray, ndarray):
         """
@@ -147,21 +199,58 @@ class WorkflowTemplate(object):
         self._engine.set_guess_and_bounds(guess, lower, upper)
 
     def set_gofit_engine(self, samples: int, lower: ndarray,
-                         upper: ndarray) -> None:
+                         upper: ndarray, **kwargs) -> None:
         """
         Method to set the fit engine to be gofit
         :param samples: the number of samples to use
         :param lower: the lower bound for the fit
         :param upper: the upper bound for the fit
+        :param kwargs: the other options for the GoFitEngine
+        (e.g. adaptive, round_samples, N_agree, tolerance)
         """
         self._check_engine_and_data_set_valid()
         self._engine = GoFitEngine(self._raw['x'], self._raw['y'],
-                                   self._raw['e'], lower, upper, samples)
+                                   self._raw['e'], lower, upper, samples,
+                                   **kwargs)
+        self._engine.set_profiler(self._profiler)
 
-    def update_gofit_engine(self, func: BaseFitFunction):
+    def update_gofit_engine(self, func: BaseFitFunction,
+                            params: ndarray = None):
         """
-        This updates the bounds for gofit engine
+        This updates the bounds for gofit engine.
+        The fit parameters (with the guess for any new parameters)
+        are used as a seed by the adaptive multistart.
         :param func: the fitting function
+        :param params: the fitting parameters (None for no seed)
         """
         lower, upper = func.get_bounds()
         self._engine.set_bounds_and_N_params(lower, upper)
+        if params is not None and len(params) > 0:
+            self._engine.set_seeds([update_guess(list(params), func)])
+
+    def set_mcmc_engine(self, guess: ndarray, lower: ndarray,
+                        upper: ndarray, **kwargs) -> None:
+        """
+        Method to set the fit engine to be MCMC
+        :param guess: the starting guess for the walkers
+        :param lower: the lower bound for the fit (prior)
+        :param upper: the upper bound for the fit (prior)
+        :param kwargs: the other options for the MCMCFitEngine
+        (e.g. N_walkers, N_steps, seed)
+        """
+        self._check_engine_and_data_set_valid()
+        self._engine = MCMCFitEngine(self._raw['x'], self._raw['y'],
+                                     self._raw['e'], lower, upper,
+                                     guess, **kwargs)
+        self._engine.set_profiler(self._profiler)
+
+    def update_mcmc_engine(self, func: BaseFitFunction, params: ndarray):
+        """
+        This updates the bounds and guess for the MCMC engine
+        :param func: the fitting function
+        :param params: the fitting parameters
+        """
+        lower, upper = self._get_bounds(func)
+
+        guess = update_guess(list(params), func)
+        self._engine.set_guess_and_bounds(guess, lower, upper)
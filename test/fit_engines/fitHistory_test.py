@@ -0,0 +1,168 @@
+import unittest
+import numpy as np
+from quickBayes.fitting.fit_history import FitHistory
+
+
+class FitHistoryTest(unittest.TestCase):
+
+    @staticmethod
+    def add_fits(history, N, N_x=3):
+        """
+        Adds N fits, fit j has j+1 parameters
+        """
+        for j in range(N):
+            params = np.arange(j + 1) + 10.*j
+            errors = 0.1*params
+            covar = np.diag(errors**2)
+            fit = np.full(N_x, float(j))
+            history.add(params, errors, covar, fit, 2.*fit, 3.*fit, j/10.)
+
+    def assert_scalars(self, history, N):
+        self.assertEqual(len(history), N)
+        for j in range(N):
+            params, errors = history.get_fit_parameters(j)
+            np.testing.assert_allclose(params, np.arange(j + 1) + 10.*j)
+            np.testing.assert_allclose(errors, 0.1*params)
+            self.assertAlmostEqual(history.get_chi_squared(j), j/10.)
+
+    def assert_stored(self, history, j):
+        fit, fit_errors, diff = history.get_fit_values(j)
+        np.testing.assert_allclose(fit, [j, j, j])
+        np.testing.assert_allclose(fit_errors, [2*j, 2*j, 2*j])
+        np.testing.assert_allclose(diff, [3*j, 3*j, 3*j])
+        covar = history.get_covariance_matrix(j)
+        self.assertEqual(covar.shape, (j + 1, j + 1))
+        params, errors = history.get_fit_parameters(j)
+        np.testing.assert_allclose(np.diag(covar), errors**2)
+
+    def test_all(self):
+        # small block size to check it grows
+        history = FitHistory(3, block_size=2)
+        self.add_fits(history, 5)
+        self.assertEqual(history.retention, 'all')
+        self.assert_scalars(history, 5)
+        for j in range(5):
+            self.assert_stored(history, j)
+
+    def test_negative_index(self):
+        history = FitHistory(3)
+        self.add_fits(history, 3)
+        self.assertAlmostEqual(history.get_chi_squared(), 0.2)
+        self.assertAlmostEqual(history.get_chi_squared(-3), 0.)
+        np.testing.assert_allclose(history.get_fit_values(-1)[0], [2, 2, 2])
+        params, _ = history.get_fit_parameters(-2)
+        np.testing.assert_allclose(params, [10, 11])
+
+    def test_last(self):
+        history = FitHistory(3, 'last', N_keep=2, block_size=2)
+        self.add_fits(history, 5)
+        self.assert_scalars(history, 5)
+        for j in range(3):
+            with self.assertRaises(IndexError):
+                history.get_fit_values(j)
+            with self.assertRaises(IndexError):
+                history.get_covariance_matrix(j)
+        self.assert_stored(history, 3)
+        self.assert_stored(history, 4)
+
+    def test_scalars(self):
+        history = FitHistory(3, 'scalars', N_keep=4)
+        self.assertEqual(history.N_keep, 1)
+        self.add_fits(history, 4)
+        self.assert_scalars(history, 4)
+        self.assertEqual(len(history._curves), 1)
+        with self.assertRaises(IndexError):
+            history.get_fit_values(2)
+        self.assert_stored(history, 3)
+
+    def test_empty_is_small(self):
+        # the large values are allocated by the first stored fit
+        history = FitHistory(1000, 'last', N_keep=2)
+        self.assertEqual(history._curves.nbytes, 0)
+        history.add([1.], [0.1], np.zeros((0, 0)), None, None, None, 0.5,
+                    store=False)
+        self.assertEqual(history._curves.nbytes, 0)
+        history.add([1.], [0.1], np.ones((1, 1)), np.ones(1000),
+                    np.ones(1000), np.ones(1000), 0.5)
+        self.assertEqual(history._curves.shape, (2, 3, 1000))
+        np.testing.assert_allclose(history.get_fit_values()[0], 1.)
+
+    def test_returns_copies(self):
+        history = FitHistory(3)
+        self.add_fits(history, 2)
+        params, _ = history.get_fit_parameters()
+        fit, _, _ = history.get_fit_values()
+        params[0] = -1
+        fit[0] = -1
+        self.assertEqual(history.get_fit_parameters()[0][0], 10.)
+        self.assertEqual(history.get_fit_values()[0][0], 1.)
+
+    def test_out_of_range(self):
+        history = FitHistory(3)
+        with self.assertRaises(IndexError):
+            history.get_chi_squared()
+        self.add_fits(history, 2)
+        with self.assertRaises(IndexError):
+            history.get_fit_parameters(2)
+        with self.assertRaises(IndexError):
+            history.get_fit_parameters(-3)
+
+    def test_bad_retention(self):
+        with self.assertRaises(ValueError):
+            FitHistory(3, 'some')
+        with self.assertRaises(ValueError):
+            FitHistory(3, 'last', N_keep=0)
+
+    def test_with_retention(self):
+        history = FitHistory(3)
+        self.add_fits(history, 4)
+
+        last = history.with_retention('last', 2)
+        self.assert_scalars(last, 4)
+        self.assert_stored(last, 2)
+        self.assert_stored(last, 3)
+        with self.assertRaises(IndexError):
+            last.get_fit_values(1)
+
+        # cannot get back the removed fits
+        restored = last.with_retention('all')
+        self.assert_scalars(restored, 4)
+        self.assert_stored(restored, 2)
+        with self.assertRaises(IndexError):
+            restored.get_fit_values(1)
+        self.add_fits(restored, 1)
+        self.assertEqual(len(restored), 5)
+        np.testing.assert_allclose(restored.get_fit_values(4)[0], [0, 0, 0])
+        self.assert_stored(restored, 3)
+
+    def test_with_retention_memory(self):
+        history = FitHistory(3, 'scalars')
+        self.add_fits(history, 100)
+
+        # only the stored fits use space
+        restored = history.with_retention('all')
+        self.assert_scalars(restored, 100)
+        self.assert_stored(restored, 99)
+        self.assertLessEqual(len(restored._curves), 16)
+        self.add_fits(restored, 2)
+        self.assertEqual(len(restored), 102)
+        self.assert_stored(restored, 99)
+        np.testing.assert_allclose(restored.get_fit_values(101)[0], [1, 1, 1])
+        with self.assertRaises(IndexError):
+            restored.get_fit_values(98)
+
+    def test_add_not_stored(self):
+        history = FitHistory(3, 'last', N_keep=2)
+        self.add_fits(history, 2)
+        history.add([1.], [0.1], np.zeros((0, 0)), None, None, None, 0.5,
+                    store=False)
+        self.assertEqual(len(history), 3)
+        self.assertAlmostEqual(history.get_chi_squared(), 0.5)
+        self.assert_stored(history, 0)
+        self.assert_stored(history, 1)
+        with self.assertRaises(IndexError):
+            history.get_fit_values(2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,10 +2,16 @@ import unittest
 import numpy as np
 from quickBayes.functions.BG import LinearBG
 from quickBayes.fitting.fit_utils import (log10_hessian_det,
+                                          batch_log10_hessian_det,
                                           chi_squared,
                                           param_errors,
                                           derivative,
+                                          jacobian,
+                                          stack_derivatives,
                                           fit_errors,
+                                          batch_fit_errors,
+                                          t_value,
+                                          T_CACHE,
                                           var,
                                           res)
 
@@ -14,16 +20,67 @@ class FitUtilsTest(unittest.TestCase):
 
     def test_log10HessDet(self):
         covar = np.array([np.array([1, -5]), np.array([2, 1])])
-        result = log10_hessian_det(covar)
+        result, valid = log10_hessian_det(covar)
         self.assertAlmostEqual(result, -1.041, 3)
+        self.assertTrue(valid)
 
     def test_log10HessDetBadData(self):
         # this data will produce a negative arg for a log
         covar = np.array([np.array([-.08, -0.04]), np.array([-0.04, 0.9])])
-        result = log10_hessian_det(covar)
+        result, valid = log10_hessian_det(covar)
+        self.assertFalse(valid)
         # should return a negative number instead of NAN
         self.assertAlmostEqual(result, -9.0, 3)
 
+    def test_log10HessDetLarge(self):
+        # the determinant of the Hessian is 10^600
+        covar = 1.e-3*np.identity(200)
+        self.assertAlmostEqual(log10_hessian_det(covar)[0], 600., 8)
+
+    def test_batch_log10HessDet(self):
+        covars = np.array([[[1, -5], [2, 1]],
+                           [[-.08, -0.04], [-0.04, 0.9]],
+                           [[1, 1], [1, 1]]])
+        result, valid = batch_log10_hessian_det(covars)
+        self.assertEqual(list(valid), [True, False, False])
+        self.assertAlmostEqual(result[0], -1.041, 3)
+        self.assertAlmostEqual(result[1], -9.0, 3)
+        self.assertAlmostEqual(result[2], -9.0, 3)
+
+    def test_batch_log10HessDetIndefinite(self):
+        # both have a positive determinant, but are not positive definite
+        covars = np.array([-np.eye(2),
+                           [[-1, 0.5], [0.2, -2]],
+                           [[2, 0], [0, 3]]])
+        result, valid = batch_log10_hessian_det(covars)
+        self.assertEqual(list(valid), [False, False, True])
+        self.assertAlmostEqual(result[0], -9.0, 3)
+        self.assertAlmostEqual(result[1], -9.0, 3)
+        self.assertAlmostEqual(result[2], -0.778, 3)
+
+    def test_log10HessDetIndefinite(self):
+        result, valid = log10_hessian_det(-np.eye(2))
+        self.assertFalse(valid)
+        self.assertAlmostEqual(result, -9.0, 3)
+
+    def test_batch_log10HessDetCholesky(self):
+        # compare to slogdet for symmetric matrices
+        rng = np.random.default_rng(1)
+        A = rng.normal(size=(5, 4, 4))
+        covars = np.einsum('nij,nkj->nik', A, A) + 0.1*np.eye(4)
+        result, valid = batch_log10_hessian_det(covars)
+        self.assertTrue(np.all(valid))
+        _, log_det = np.linalg.slogdet(covars)
+        np.testing.assert_allclose(result, -log_det/np.log(10.))
+
+        # one matrix is not positive definite
+        covars[2] = -covars[2]
+        result, valid = batch_log10_hessian_det(covars)
+        self.assertEqual(list(valid), [True, True, False, True, True])
+        self.assertAlmostEqual(result[2], -9.0, 3)
+        np.testing.assert_allclose(result[valid],
+                                   -log_det[valid]/np.log(10.))
+
     def test_chi2(self):
         x = np.array([0, 1, 2, 3, 4])
         y = np.array([-0.9, 1.1, 2.05, 2.8, 2.9])
@@ -75,6 +132,42 @@ class FitUtilsTest(unittest.TestCase):
         for k in range(len(result)):
             self.assertAlmostEqual(errors[k], result[k], 3)
 
+    def test_fit_errors_matches_loop(self):
+        rng = np.random.default_rng(1)
+        x = np.linspace(0, 1, 20)
+        df_by_dp = rng.normal(size=(3, len(x)))
+        A = rng.normal(size=(3, 3))
+        covar = A @ A.T
+
+        errors = fit_errors(x, [1, 2, 3], x, covar, df_by_dp)
+        df_sq = np.zeros(len(x))
+        for j in range(3):
+            for k in range(3):
+                df_sq += df_by_dp[j]*df_by_dp[k]*covar[j, k]
+        np.testing.assert_allclose(errors, t_value(17)*np.sqrt(df_sq))
+
+    def test_t_value_cached(self):
+        T_CACHE.clear()
+        tval = t_value(10)
+        self.assertAlmostEqual(tval, 1.052, 3)
+        self.assertEqual(T_CACHE.misses, 1)
+        self.assertEqual(t_value(10), tval)
+        self.assertEqual(T_CACHE.hits, 1)
+
+    def test_batch_fit_errors(self):
+        rng = np.random.default_rng(1)
+        x = np.linspace(0, 1, 20)
+        df_by_dp = rng.normal(size=(4, 2, len(x)))
+        A = rng.normal(size=(4, 2, 2))
+        covars = A @ np.transpose(A, (0, 2, 1))
+        params = np.ones((4, 2))
+
+        errors = batch_fit_errors(x, params, covars, df_by_dp)
+        self.assertEqual(errors.shape, (4, len(x)))
+        for j in range(4):
+            expect = fit_errors(x, params[j], x, covars[j], df_by_dp[j])
+            np.testing.assert_allclose(errors[j], expect)
+
     def test_var(self):
         x = np.array([0, 1, 2, 3])
         y = 2*x + .1
@@ -82,6 +175,8 @@ class FitUtilsTest(unittest.TestCase):
         bg = LinearBG()
         result = var(bg, x, y, params)
         self.assertAlmostEqual(result, .14, 3)
+        fit = bg(x, *params)
+        self.assertEqual(var(bg, x, y, params, fit), result)
 
     def test_res(self):
         x = np.array([0, 1, 2, 3])
@@ -91,6 +186,67 @@ class FitUtilsTest(unittest.TestCase):
         bg = LinearBG()
         result = res(bg, x, y, e, params)
         self.assertAlmostEqual(result, 14., 3)
+        fit = bg(x, *params)
+        self.assertEqual(res(bg, x, y, e, params, fit), result)
+
+    def test_derivative_zero_param(self):
+        x = np.linspace(0, 5)
+
+        def func(x, m, c):
+            return m*x + c
+
+        params = [0., -2]
+        result = derivative(x, params, func)
+
+        for k in range(len(x)):
+            self.assertAlmostEqual(result[0][k], x[k], 3)
+            self.assertAlmostEqual(result[1][k], 1.0, 3)
+
+    def test_jacobian_analytic(self):
+        x = np.linspace(0, 5)
+        bg = LinearBG()
+        result = jacobian(x, [0., -2], bg)
+
+        self.assertEqual(result.shape, (2, len(x)))
+        for k in range(len(x)):
+            self.assertEqual(result[0][k], x[k])
+            self.assertEqual(result[1][k], 1.0)
+
+    def test_jacobian_numerical(self):
+        x = np.linspace(0, 5)
+
+        def func(x, m, c):
+            return m*x + c
+
+        result = jacobian(x, [1., -2], func)
+        for k in range(len(x)):
+            self.assertAlmostEqual(result[0][k], x[k], 3)
+            self.assertAlmostEqual(result[1][k], 1.0, 3)
+
+    def test_stack_derivatives(self):
+        x = np.linspace(0, 5)
+        # a constant derivative is a single value
+        result = stack_derivatives([x, 1.], len(x))
+        self.assertEqual(result.shape, (2, len(x)))
+        np.testing.assert_allclose(result[0], x)
+        np.testing.assert_allclose(result[1], np.ones(len(x)))
+        jac = np.ones((2, len(x)))
+        self.assertIs(stack_derivatives(jac, len(x)), jac)
+
+    def test_derivative_with_fit(self):
+        x = np.linspace(0, 5)
+        calls = []
+
+        def func(x, m, c):
+            calls.append((m, c))
+            return m*x + c
+
+        expect = derivative(x, [1., -2], func)
+        self.assertEqual(len(calls), 3)
+        calls.clear()
+        result = jacobian(x, [1., -2], func, func(x, 1., -2))
+        self.assertEqual(len(calls), 3)
+        np.testing.assert_array_equal(result, expect)
 
 
 if __name__ == '__main__':
@@ -1,9 +1,13 @@
 import unittest
+import numpy as np
 from numpy import ndarray
 from typing import Callable
 from scipy.optimize import curve_fit
 from quickBayes.fitting.fit_engine import FitEngine
 from quickBayes.test_helpers.template_scipy_fit import ScipyFitTemplate
+from quickBayes.test_helpers.fitting_data import basic_data
+from quickBayes.functions.BG import LinearBG
+from quickBayes.utils.profiling import Profiler
 
 
 class SimpleTestEngine(FitEngine):
@@ -57,6 +61,128 @@ class BaseFitEngineTest(ScipyFitTemplate, unittest.TestCase):
         expected_de = [0.153, 0.118, 0.134, 0.153]
         return expected_y, expected_e, expected_d, expected_de
 
+    def do_fits(self, N):
+        # shift the data for each fit
+        x_data, y_data, e_data = basic_data()
+        self.engine = self.get_test_engine(x_data, y_data, e_data)
+        lin = LinearBG()
+        for j in range(N):
+            self.engine.do_fit(x_data, y_data + j, e_data, lin)
+
+    def test_retention_all(self):
+        self.do_fits(3)
+        self.assertEqual(self.engine.retention, 'all')
+        self.assertEqual(self.engine.N_fits, 3)
+        _, y0, _, _, _ = self.engine.get_fit_values(0)
+        _, y2, _, _, _ = self.engine.get_fit_values(2)
+        np.testing.assert_allclose(y2 - y0, 2, atol=1e-6)
+
+    def test_add_fit_from(self):
+        self.do_fits(2)
+        x_data, y_data, e_data = basic_data()
+        engine = self.get_test_engine(x_data, y_data, e_data)
+        engine.add_fit_from(self.engine, 0)
+        engine.add_fit_from(self.engine)
+        self.assertEqual(engine.N_fits, 2)
+        for j in range(2):
+            np.testing.assert_allclose(engine.get_fit_parameters(j),
+                                       self.engine.get_fit_parameters(j))
+            np.testing.assert_allclose(engine.get_covariance_matrix(j),
+                                       self.engine.get_covariance_matrix(j))
+            self.assertEqual(engine.get_chi_squared(j),
+                             self.engine.get_chi_squared(j))
+            for value, expect in zip(engine.get_fit_values(j),
+                                     self.engine.get_fit_values(j)):
+                np.testing.assert_allclose(value, expect)
+
+    def test_retention_last(self):
+        self.do_fits(3)
+        params, _ = self.engine.get_fit_parameters(1)
+        covar = self.engine.get_covariance_matrix(1)
+        self.engine.set_retention('last', 2)
+        self.assertEqual(self.engine.retention, 'last')
+        with self.assertRaises(IndexError):
+            self.engine.get_fit_values(0)
+        np.testing.assert_allclose(self.engine.get_fit_parameters(1)[0],
+                                   params)
+        np.testing.assert_allclose(self.engine.get_covariance_matrix(1),
+                                   covar)
+
+    def test_retention_scalars(self):
+        x_data, y_data, e_data = basic_data()
+        self.engine = self.get_test_engine(x_data, y_data, e_data)
+        self.engine.set_retention('scalars')
+        for j in range(3):
+            self.engine.do_fit(x_data, y_data + j, e_data, LinearBG())
+        self.assertEqual(self.engine.N_fits, 3)
+        self.assertEqual(len(self.engine.get_fit_parameters(0)[0]), 2)
+        self.assertGreater(self.engine.get_chi_squared(0), 0)
+        with self.assertRaises(IndexError):
+            self.engine.get_covariance_matrix(1)
+        self.assertEqual(self.engine.get_covariance_matrix().shape, (2, 2))
+
+    def test_function_evaluations(self):
+        x_data, y_data, e_data = basic_data()
+        self.engine = self.get_test_engine(x_data, y_data, e_data)
+        lin = LinearBG()
+        calls = []
+
+        def line(x, m, c):
+            calls.append((m, c))
+            return lin(x, m, c)
+
+        # only count the calls after the fit
+        self.engine._do_fit = lambda *args: np.array([1., 0.1])
+        self.engine.do_fit(x_data, y_data, e_data, line)
+        # once at the fit parameters and once for each derivative
+        self.assertEqual(len(calls), 3)
+
+    def test_profiler(self):
+        x_data, y_data, e_data = basic_data()
+        self.engine = self.get_test_engine(x_data, y_data, e_data)
+        self.assertIsNone(self.engine.profiler)
+        profiler = Profiler()
+        self.engine.set_profiler(profiler)
+        self.engine._do_fit = lambda *args: np.array([1., 0.1])
+        # no analytic derivatives
+        lin = LinearBG()
+        self.engine.do_fit(x_data, y_data, e_data,
+                           lambda x, m, c: lin(x, m, c))
+
+        report = profiler.report()['all']
+        self.assertEqual(list(report.keys()), ['optimiser', 'evaluate',
+                                               'derivatives', 'covariance',
+                                               'fit_errors', 'history'])
+        for stage in report.values():
+            self.assertEqual(stage['calls'], 1)
+        self.assertEqual(report['evaluate']['evaluations'], 1)
+        self.assertEqual(report['derivatives']['evaluations'], 2)
+        self.assertEqual(report['optimiser']['evaluations'], 0)
+
+    def test_empty_copy(self):
+        self.do_fits(2)
+        self.engine.set_retention('last', 2)
+        x_data, y_data, e_data = basic_data()
+        engine = self.engine.empty_copy(y_data=y_data + 1)
+        self.assertEqual(engine.N_fits, 0)
+        self.assertEqual(engine.retention, 'last')
+        self.assertEqual(engine.N_keep, 2)
+        self.assertIsNone(engine._params)
+        # the data is not copied
+        self.assertIs(engine._x_data, self.engine._x_data)
+        self.assertIs(engine._e_data, self.engine._e_data)
+        np.testing.assert_allclose(engine._y_data, y_data + 1)
+        # the original is not changed
+        self.assertEqual(self.engine.N_fits, 2)
+        engine.do_fit(x_data, y_data, e_data, LinearBG())
+        self.assertEqual(engine.N_fits, 1)
+        self.assertEqual(self.engine.N_fits, 2)
+
+    def test_bad_retention(self):
+        self.engine = self.get_test_engine(*basic_data())
+        with self.assertRaises(ValueError):
+            self.engine.set_retention('none')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,12 @@
 import unittest
+from unittest import mock
 from numpy import ndarray
 import numpy as np
-from quickBayes.fitting.gofit_engine import GoFitEngine
+from quickBayes.fitting.gofit_engine import (GoFitEngine, ChiSquared,
+                                             _distinct_minima)
+from quickBayes.functions.BG import LinearBG
+from quickBayes.functions.lorentz import Lorentzian
+from quickBayes.functions.composite import CompositeFunction
 from quickBayes.test_helpers.template_fit_test import FitEngineTemplate
 
 
@@ -112,6 +117,162 @@ class GoFitEngineTest(FitEngineTemplate, unittest.TestCase):
             self.engine.set_bounds_and_N_params([0, 0],
                                                 [2])
 
+    def test_chi_squared(self):
+        x = np.linspace(-1, 1, 50)
+        y = np.cos(x)
+        e = 0.1 + 0.05*x**2
+        func = CompositeFunction()
+        func.add_function(LinearBG())
+        func.add_function(Lorentzian())
+        params = np.array([0.1, 0.2, 1., 0.05, 0.3])
+
+        cost = ChiSquared(x, y, e, func)
+        expect = ((func(x, *params) - y)/e)**2
+        first = cost(params)
+        np.testing.assert_allclose(first, expect)
+        # a new array is returned every time
+        second = cost(params + 0.1)
+        self.assertIsNot(first, second)
+        np.testing.assert_allclose(first, expect)
+
+        # same as numerical derivatives
+        self.assertTrue(cost.has_jacobian)
+        jac = cost.jacobian(params)
+        self.assertEqual(jac.shape, (50, 5))
+        for j in range(5):
+            step = np.zeros(5)
+            step[j] = 1.e-6
+            numerical = (cost(params + step) -
+                         cost(params - step))/2.e-6
+            np.testing.assert_allclose(jac[:, j], numerical,
+                                       rtol=1.e-5, atol=1.e-6)
+
+    def test_chi_squared_batch(self):
+        x = np.linspace(-1, 1, 50)
+        y = np.cos(x)
+        e = 0.1*np.ones(50)
+        func = LinearBG()
+        P = np.array([[0.1, 0.9], [0., 1.], [-0.2, 1.1]])
+
+        cost = ChiSquared(x, y, e, func)
+        residuals = cost.batch_call(P)
+        self.assertEqual(residuals.shape, (3, 50))
+        for j, params in enumerate(P):
+            np.testing.assert_allclose(residuals[j], cost(params))
+            self.assertAlmostEqual(cost.batch_cost(P)[j],
+                                   np.sum(cost(params)**2))
+
+    def test_chi_squared_no_jacobian(self):
+        x = np.linspace(-1, 1, 50)
+        cost = ChiSquared(x, x, np.ones(50), self.function)
+        self.assertFalse(cost.has_jacobian)
+        np.testing.assert_allclose(cost([1., 1., 0.]),
+                                   (self.function(x, 1., 1., 0.) - x)**2)
+
+    def test_cost_function_is_reused(self):
+        x = np.linspace(-1, 1, 50)
+        y = np.cos(x)
+        e = 0.1*np.ones(50)
+        engine = self.get_test_engine(x, y, e)
+        cost = engine.get_cost_function(x, y, e, LinearBG())
+        self.assertIs(engine.get_cost_function(x, y, e, Lorentzian()), cost)
+        self.assertIsNot(engine.get_cost_function(x, 2.*y, e, LinearBG()),
+                         cost)
+
+    def adaptive_data(self):
+        x = np.linspace(-1, 1, 100)
+        func = CompositeFunction()
+        func.add_function(LinearBG())
+        func.add_function(Lorentzian())
+        np.random.seed(1)
+        y = func(x, 0.1, 0.2, 1., 0.05, 0.3) + 0.01*np.random.normal(size=100)
+        e = 0.01*np.ones(100)
+        return x, y, e, func
+
+    def test_adaptive(self):
+        x, y, e, func = self.adaptive_data()
+        lower, upper = func.get_bounds()
+        engine = GoFitEngine(x, y, e, lower, upper, samples=40,
+                             adaptive=True, round_samples=4, N_agree=2)
+        self.assertTrue(engine.adaptive)
+        engine.do_fit(x, y, e, func)
+        params, _ = engine.get_fit_parameters()
+        np.testing.assert_allclose(params, [0.1, 0.2, 1., 0.05, 0.3],
+                                   atol=0.02)
+
+        stats = engine.get_multistart_stats()
+        # the best minima agreed, so not all of the samples are used
+        self.assertTrue(stats['stopped_early'])
+        self.assertLess(stats['starts'], 40)
+        self.assertEqual(stats['starts'], 4*stats['rounds'])
+        self.assertGreaterEqual(stats['rounds'], 2)
+        self.assertGreaterEqual(stats['minima'], 1)
+
+    def test_adaptive_seed(self):
+        x, y, e, func = self.adaptive_data()
+        lower, upper = func.get_bounds()
+        engine = GoFitEngine(x, y, e, lower, upper, samples=40,
+                             adaptive=True, round_samples=4, N_agree=2)
+        engine.do_fit(x, y, e, func)
+        params, _ = engine.get_fit_parameters()
+
+        # the seed is a minimum, so only one round is needed
+        engine.set_seeds([params, [1., 2.]])
+        engine.do_fit(x, y, e, func)
+        stats = engine.get_multistart_stats()
+        self.assertEqual(stats['rounds'], 1)
+        self.assertEqual(stats['starts'], 5)
+        np.testing.assert_allclose(engine.get_fit_parameters()[0], params,
+                                   atol=1.e-3)
+
+        # the seeds are only used once
+        engine.do_fit(x, y, e, func)
+        self.assertGreaterEqual(engine.get_multistart_stats()['rounds'], 2)
+        self.assertEqual(len(engine._multistart_stats), 3)
+        self.assertEqual(engine.get_multistart_stats(1)['rounds'], 1)
+
+    def test_adaptive_seed_fails(self):
+        x, y, e, func = self.adaptive_data()
+        lower, upper = func.get_bounds()
+        engine = GoFitEngine(x, y, e, lower, upper, samples=1,
+                             adaptive=True)
+        engine.set_seeds([[0.1, 0.2, 1., 0.05, 0.3]])
+        with mock.patch('quickBayes.fitting.gofit_engine.regularisation',
+                        return_value=(np.full(5, np.nan), 1)):
+            engine.do_fit(x, y, e, func)
+        # the seed is rejected, so multistart is still used
+        stats = engine.get_multistart_stats()
+        self.assertEqual(stats['starts'], 2)
+        self.assertEqual(stats['rounds'], 1)
+
+    def test_not_adaptive_stats(self):
+        x, y, e, func = self.adaptive_data()
+        lower, upper = func.get_bounds()
+        engine = GoFitEngine(x, y, e, lower, upper, samples=3)
+        self.assertFalse(engine.adaptive)
+        engine.do_fit(x, y, e, func)
+        self.assertEqual(engine.get_multistart_stats(),
+                         {'starts': 3, 'rounds': 1, 'minima': 1,
+                          'stopped_early': False})
+
+        copy = GoFitEngine(x, y, e, lower, upper)
+        copy.add_fit_from(engine)
+        self.assertEqual(copy.N_fits, 1)
+        self.assertEqual(copy.get_multistart_stats(),
+                         engine.get_multistart_stats())
+
+    def test_bad_adaptive_options(self):
+        with self.assertRaises(ValueError):
+            GoFitEngine([], [], [], [0], [1], round_samples=0)
+        with self.assertRaises(ValueError):
+            GoFitEngine([], [], [], [0], [1], N_agree=0)
+
+    def test_distinct_minima(self):
+        minima = [np.array([0., 1.]), np.array([1.e-5, 1.]),
+                  np.array([0.5, 1.])]
+        self.assertEqual(_distinct_minima(minima, [0, 0], [1, 2], 1.e-4), 2)
+        self.assertEqual(_distinct_minima(minima, [0, 0], [1, 2], 0.9), 1)
+
     """
     The following is to demonstrate that gofit
     can get better fits than scipy, in certain
@@ -0,0 +1,182 @@
+import unittest
+import numpy as np
+from quickBayes.fitting.mcmc_engine import (MCMCFitEngine, LogPosterior,
+                                            run_chain)
+from quickBayes.fitting.scipy_engine import ScipyFitEngine
+from quickBayes.functions.BG import LinearBG
+from quickBayes.test_helpers.fitting_data import func
+
+
+def linear_data():
+    x = np.linspace(0, 1, 10)
+    rng = np.random.default_rng(2)
+    y = func(x) + rng.normal(0, .1, len(x))
+    e = 0.1*np.ones(len(x))
+    return x, y, e
+
+
+class MCMCFitEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.x, self.y, self.e = linear_data()
+        # the posterior is a gaussian, so compare to scipy
+        self.scipy = ScipyFitEngine(self.x, self.y, self.e,
+                                    [-10, -10], [10, 10], [0, 0])
+        self.scipy.do_fit(self.x, self.y, self.e, LinearBG())
+
+    def test_name(self):
+        engine = MCMCFitEngine(self.x, self.y, self.e, [-10, -10], [10, 10])
+        self.assertEqual(engine.name, "mcmc")
+
+    def test_infinite_bounds(self):
+        with self.assertRaises(ValueError):
+            _ = MCMCFitEngine(self.x, self.y, self.e,
+                              [-np.inf, -10], [10, 10])
+
+    def test_bounds_length(self):
+        with self.assertRaises(ValueError):
+            _ = MCMCFitEngine(self.x, self.y, self.e,
+                              [-10, -10], [10, 10], guess=[1.])
+
+    def test_log_posterior(self):
+        log_posterior = LogPosterior(self.x, self.y, self.e, LinearBG(),
+                                     [-10, -10], [10, 10])
+        P = np.array([[0.9, 0.1], [0.5, 0.2], [11., 0.]])
+        result = log_posterior(P)
+
+        for j in range(2):
+            chi2 = np.sum((LinearBG()(self.x, *P[j]) - self.y)**2 /
+                          self.e**2)
+            self.assertAlmostEqual(result[j],
+                                   -0.5*chi2 - np.log(400.), 8)
+        # outside of the bounds
+        self.assertEqual(result[2], -np.inf)
+
+    def test_run_chain(self):
+        log_posterior = LogPosterior(self.x, self.y, self.e, LinearBG(),
+                                     [-10, -10], [10, 10])
+        start = np.random.default_rng(1).random((8, 2))
+        (samples, log_prob, acceptance,
+         best, best_log_prob) = run_chain(np.random.SeedSequence(3),
+                                          log_posterior, start,
+                                          N_steps=100, burn_in=50, thin=10)
+        self.assertEqual(samples.shape, (10, 8, 2))
+        self.assertEqual(log_prob.shape, (10, 8))
+        self.assertTrue(0 < acceptance < 1)
+        self.assertEqual(best_log_prob, log_posterior(best[np.newaxis])[0])
+        self.assertGreaterEqual(best_log_prob, np.max(log_prob))
+        np.testing.assert_allclose(log_prob[-1], log_posterior(samples[-1]))
+
+    def test_fit(self):
+        engine = MCMCFitEngine(self.x, self.y, self.e,
+                               [-10, -10], [10, 10], seed=1)
+        engine.do_fit(self.x, self.y, self.e, LinearBG())
+
+        params, errors = engine.get_fit_parameters()
+        expect_p, expect_e = self.scipy.get_fit_parameters()
+        np.testing.assert_allclose(params, expect_p, atol=1.e-2)
+        np.testing.assert_allclose(errors, expect_e, rtol=0.1)
+        np.testing.assert_allclose(engine.get_covariance_matrix(),
+                                   self.scipy.get_covariance_matrix(),
+                                   rtol=0.2)
+        self.assertAlmostEqual(engine.get_chi_squared(),
+                               self.scipy.get_chi_squared(), 3)
+
+        samples = engine.get_samples()
+        self.assertEqual(samples.shape, (200*32, 2))
+        self.assertEqual(engine.get_samples(flat=False).shape,
+                         (1, 200, 32, 2))
+        self.assertEqual(engine.get_sample_log_posterior().shape,
+                         (1, 200, 32))
+        self.assertTrue(0.3 < engine.get_acceptance_fraction()[0] < 0.9)
+
+    def test_evidence(self):
+        """
+        For a linear model the evidence is known.
+        ln(Z) = -chi^2/2 + ln(prior) + ln(2 pi) + ln(det(covar))/2
+        """
+        engine = MCMCFitEngine(self.x, self.y, self.e,
+                               [-10, -10], [10, 10], guess=[0, 0], seed=1)
+        engine.do_fit(self.x, self.y, self.e, LinearBG())
+
+        params, _ = self.scipy.get_fit_parameters()
+        covar = self.scipy.get_covariance_matrix()
+        chi2 = np.sum((LinearBG()(self.x, *params) - self.y)**2/self.e**2)
+        expect = (-0.5*chi2 - np.log(400.) + np.log(2.*np.pi) +
+                  0.5*np.log(np.linalg.det(covar)))/np.log(10.)
+        self.assertAlmostEqual(engine.get_log10_evidence(), expect, 1)
+
+    def test_add_fit_from(self):
+        engine = MCMCFitEngine(self.x, self.y, self.e,
+                               [-10, -10], [10, 10], N_walkers=6,
+                               N_steps=100, burn_in=100, seed=1)
+        engine.do_fit(self.x, self.y, self.e, LinearBG())
+        copy = MCMCFitEngine(self.x, self.y, self.e,
+                             [-10, -10], [10, 10])
+        copy.add_fit_from(engine)
+        self.assertEqual(copy.N_fits, 1)
+        self.assertEqual(copy.get_log10_evidence(),
+                         engine.get_log10_evidence())
+        np.testing.assert_allclose(copy.get_samples(), engine.get_samples())
+        np.testing.assert_allclose(copy.get_acceptance_fraction(),
+                                   engine.get_acceptance_fraction())
+
+    def test_chains(self):
+        engine = MCMCFitEngine(self.x, self.y, self.e,
+                               [-10, -10], [10, 10], N_walkers=6,
+                               N_steps=100, burn_in=100, N_chains=3,
+                               N_jobs=2, backend='threads', seed=1)
+        engine.do_fit(self.x, self.y, self.e, LinearBG())
+        self.assertEqual(engine.get_samples(flat=False).shape,
+                         (3, 10, 6, 2))
+        self.assertEqual(len(engine.get_acceptance_fraction()), 3)
+
+        # same seed -> same results
+        serial = MCMCFitEngine(self.x, self.y, self.e,
+                               [-10, -10], [10, 10], N_walkers=6,
+                               N_steps=100, burn_in=100, N_chains=3,
+                               seed=1)
+        serial.do_fit(self.x, self.y, self.e, LinearBG())
+        np.testing.assert_allclose(serial.get_samples(),
+                                   engine.get_samples())
+
+    def test_chain_seeds(self):
+        engine = MCMCFitEngine(self.x, self.y, self.e,
+                               [-10, -10], [10, 10], N_chains=3, seed=1)
+        seeds = engine._chain_seeds()
+        self.assertEqual(len(seeds), 3)
+        # the start and chain random numbers are independent
+        draws = [np.random.default_rng(seed).random(4)
+                 for pair in seeds for seed in pair]
+        for j in range(len(draws)):
+            for k in range(j):
+                self.assertFalse(np.allclose(draws[j], draws[k]))
+
+    def test_min_walkers(self):
+        engine = MCMCFitEngine(self.x, self.y, self.e,
+                               [-10, -10], [10, 10], N_walkers=3,
+                               N_steps=10, burn_in=0, thin=1, seed=1)
+        engine.do_fit(self.x, self.y, self.e, LinearBG())
+        self.assertEqual(engine.get_samples(flat=False).shape,
+                         (1, 10, 4, 2))
+
+    def test_thin(self):
+        with self.assertRaises(ValueError):
+            _ = MCMCFitEngine(self.x, self.y, self.e, [-10, -10], [10, 10],
+                              N_steps=5, thin=10)
+
+    def test_history(self):
+        engine = MCMCFitEngine(self.x, self.y, self.e,
+                               [-10, -10], [10, 10], N_steps=100,
+                               burn_in=100, seed=1)
+        engine.do_fit(self.x, self.y, self.e, LinearBG())
+        engine.do_fit(self.x[::2], self.y[::2], self.e[::2], LinearBG())
+
+        self.assertEqual(len(engine.get_samples(0)), 320)
+        self.assertEqual(len(engine._log10_evidence), 2)
+        _, y_fit, _, _, _ = engine.get_fit_values(0)
+        self.assertEqual(len(y_fit), len(self.x))
+
+
+if __name__ == '__main__':
+    unittest.main()
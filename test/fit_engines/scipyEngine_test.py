@@ -1,7 +1,9 @@
 import unittest
 import numpy as np
 from quickBayes.fitting.scipy_engine import ScipyFitEngine
+from quickBayes.functions.BG import LinearBG
 from quickBayes.test_helpers.template_scipy_fit import ScipyFitTemplate
+from quickBayes.test_helpers.fitting_data import basic_data
 
 
 class ScipyFitEngineTest(ScipyFitTemplate, unittest.TestCase):
@@ -101,5 +103,77 @@ class ScipyFitEngineTest(ScipyFitTemplate, unittest.TestCase):
                                              [2])
 
 
+class ScipyLeastSquaresTest(ScipyFitEngineTest):
+
+    @staticmethod
+    def get_test_engine(x, y, e):
+        return ScipyFitEngine(x, y, e,
+                              lower=[-10, -10],
+                              upper=[10, 10],
+                              guess=[0, 0],
+                              method='least_squares')
+
+    def test_method(self):
+        x_data, y_data, e_data = basic_data()
+        self.engine = self.get_test_engine(x_data, y_data, e_data)
+        self.assertEqual(self.engine.method, 'least_squares')
+        with self.assertRaises(ValueError):
+            ScipyFitEngine(x_data, y_data, e_data, [-10, -10], [10, 10],
+                           [0, 0], method='lm')
+
+    def test_matches_curve_fit(self):
+        x_data, y_data, e_data = basic_data()
+        curve = ScipyFitEngine(x_data, y_data, e_data, [-10, -10],
+                               [10, 10], [0, 0])
+        self.engine = self.get_test_engine(x_data, y_data, e_data)
+        for engine in [curve, self.engine]:
+            engine.do_fit(x_data, y_data, e_data, LinearBG())
+        for j in range(2):
+            np.testing.assert_allclose(self.engine.get_fit_parameters()[j],
+                                       curve.get_fit_parameters()[j],
+                                       rtol=1e-6)
+        np.testing.assert_allclose(self.engine.get_covariance_matrix(),
+                                   curve.get_covariance_matrix(),
+                                   rtol=1e-6)
+        np.testing.assert_allclose(self.engine.get_fit_values()[2],
+                                   curve.get_fit_values()[2], rtol=1e-6)
+
+    def test_numerical_derivatives(self):
+        def line(x, m, c):
+            return m*x + c
+
+        x_data, y_data, e_data = basic_data()
+        self.engine = self.get_test_engine(x_data, y_data, e_data)
+        self.engine.do_fit(x_data, y_data, e_data, line)
+        params, errors = self.engine.get_fit_parameters()
+        self.assert_parameters(params, errors, *self.get_basic_fit_params())
+
+    def test_reuses_weights(self):
+        x_data, y_data, e_data = basic_data()
+        self.engine = self.get_test_engine(x_data, y_data, e_data)
+        self.engine.do_fit(x_data, y_data, e_data, LinearBG())
+        residuals = self.engine._residuals
+        self.engine.do_fit(x_data, y_data, e_data, LinearBG())
+        self.assertIs(self.engine._residuals, residuals)
+        self.engine.do_fit(x_data, y_data + 1, e_data, LinearBG())
+        self.assertIsNot(self.engine._residuals, residuals)
+        params, _ = self.engine.get_fit_parameters()
+        self.assertAlmostEqual(params[1],
+                               self.engine.get_fit_parameters(0)[0][1] + 1,
+                               3)
+
+    def test_empty_copy_weights(self):
+        x_data, y_data, e_data = basic_data()
+        self.engine = self.get_test_engine(x_data, y_data, e_data)
+        self.engine.do_fit(x_data, y_data, e_data, LinearBG())
+        engine = self.engine.empty_copy()
+        self.assertIsNone(engine._residuals)
+        self.assertIsNotNone(self.engine._residuals)
+        self.assertEqual(engine.method, 'least_squares')
+        engine.do_fit(x_data, y_data, e_data, LinearBG())
+        np.testing.assert_allclose(engine.get_fit_parameters()[0],
+                                   self.engine.get_fit_parameters()[0])
+
+
 if __name__ == '__main__':
     unittest.main()
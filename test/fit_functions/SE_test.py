@@ -1,6 +1,9 @@
 import unittest
 import numpy as np
-from quickBayes.functions.SE import StretchExp
+from quickBayes.functions.SE import (StretchExp, StretchExpTable,
+                                     SE_CACHE, PLANCK_CONSTANT,
+                                     fft_period)
+import copy
 
 
 class StretchExpTest(unittest.TestCase):
@@ -112,6 +115,142 @@ class StretchExpTest(unittest.TestCase):
         self.assertEqual(bounds[0], [0, -1., 0, 0])
         self.assertEqual(bounds[1], [1., 1, 100., 1.])
 
+    def test_call_uses_cache(self):
+        x = np.linspace(-0.4, 0.4, 6)
+        SE_CACHE.clear()
+        se = StretchExp()
+
+        y = se(x, 1.0, 0.0, 25.0, 0.5)
+        self.assertEqual(SE_CACHE.misses, 1)
+        self.assertEqual(len(SE_CACHE), 1)
+        # only the amplitude and peak centre change
+        y2 = se(x, 2.0, 0.1, 25.0, 0.5)
+        self.assertEqual(SE_CACHE.hits, 1)
+        self.assertEqual(len(SE_CACHE), 1)
+
+        expect = [0.192, 0.299, 1.001, 1.001, 0.299, 0.192]
+        for j in range(len(y)):
+            self.assertAlmostEqual(y[j], expect[j], 3)
+        # test_call_2 with 4 times the amplitude
+        expect = [0.332, 0.437, 0.804, 9.197, 1.058, 0.486]
+        for j in range(len(y)):
+            self.assertAlmostEqual(y2[j], expect[j], 3)
+
+    def test_batch_call(self):
+        # uses the default loop
+        x = np.linspace(-0.4, 0.4, 6)
+        se = StretchExp()
+        P = np.array([[1.0, 0.0, 25.0, 0.5], [0.5, 0.1, 25.0, 0.5]])
+        y = se.batch_call(x, P)
+
+        self.assertEqual(y.shape, (2, len(x)))
+        for j in range(len(P)):
+            np.testing.assert_allclose(y[j], se(x, *P[j]))
+
+    def test_batch_call_wrong_shape(self):
+        x = np.linspace(-0.4, 0.4, 6)
+        with self.assertRaises(ValueError):
+            StretchExp().batch_call(x, np.ones((2, 3)))
+
+
+class StretchExpTableTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.table = StretchExpTable()
+
+    def test_accuracy(self):
+        self.assertLess(self.table.error, 1.e-3)
+        self.assertLess(self.table.fft_error, 1.e-3)
+
+    def test_check_fft(self):
+        x = np.linspace(-0.4, 0.4, 400)
+        # broad peaks overlap with their periodic images
+        self.assertLess(self.table._check_fft(x, [1.], 256), 1.e-3)
+        # the FFT is truncated for long relaxation times and small beta
+        self.assertGreater(self.table._check_fft(x, [100.], 16), 0.1)
+
+    def test_small_beta(self):
+        # the FFT is truncated for small beta, so compare to quadrature
+        tau = 0.5
+        x = np.array([0., 0.001, 0.1, 0.5])
+        for beta in [0.26, 0.3, 0.42]:
+            y = self.table(x, tau, beta)
+            w = x*tau/PLANCK_CONSTANT
+            expect = np.array([StretchExpTable._quadrature(value, beta)
+                               for value in w])*tau/PLANCK_CONSTANT
+            np.testing.assert_allclose(y, expect,
+                                       atol=1.e-3*np.max(expect))
+        self.assertAlmostEqual(self.table(x, tau, 0.3)[2], 0.419, 3)
+
+    def test_transform(self):
+        # beta = 1 is a Lorentzian, phi(w) = 2/(1 + (2 pi w)^2)
+        w = np.array([0., 0.01, 0.1, 1., 10.])
+        np.testing.assert_allclose(StretchExpTable._transform(w, 1.),
+                                   2./(1. + (2.*np.pi*w)**2),
+                                   rtol=1.e-8)
+
+    def test_tolerance(self):
+        with self.assertRaises(ValueError):
+            _ = StretchExpTable(N_beta=3, N_w=100, tolerance=1.e-6)
+
+    def test_lorentzian(self):
+        # beta = 1 is a Lorentzian
+        x = np.linspace(-0.4, 0.4, 200)
+        for tau in [1., 6.58, 100.]:
+            hwhm = PLANCK_CONSTANT/(2.*np.pi*tau)
+            expect = hwhm/(np.pi*((x - 0.01)**2 + hwhm**2))
+
+            y = self.table(x - 0.01, tau, 1.)
+            np.testing.assert_allclose(y, expect,
+                                       atol=1.e-3*np.max(expect))
+
+    def test_matches_FFT(self):
+        x = np.linspace(-0.4, 0.4, 200)
+        for tau in [1., 6.582, 25.]:
+            for beta in [0.45, 0.73, 0.9]:
+                expect = StretchExp()(x, 1., 0.01, tau, beta)
+                y = StretchExp(table=self.table)(x, 1., 0.01, tau, beta)
+                np.testing.assert_allclose(y, expect,
+                                           atol=1.e-3*np.max(expect))
+
+    def test_periodic(self):
+        x = np.linspace(-0.4, 0.4, 200)
+        period = fft_period(x)
+        self.assertEqual(period, 1.6)
+        # the peak is kept and the images make a broad peak flatter
+        y = self.table(np.array([0., 0.4]), 1., 0.5, period)
+        exact = self.table(np.array([0., 0.4]), 1., 0.5)
+        self.assertAlmostEqual(y[0], exact[0], 8)
+        self.assertGreater(y[1], exact[1])
+        # outside of the period the values are constant
+        y = self.table(np.array([0.8, 1., 2.]), 1., 0.5, period)
+        self.assertAlmostEqual(y[1], y[0], 8)
+        self.assertAlmostEqual(y[2], y[0], 8)
+
+    def test_bounds(self):
+        se = StretchExp(table=self.table)
+        lower, upper = se.get_bounds()
+        self.assertEqual(lower, [0, -1., 0, 0.25])
+        self.assertEqual(upper, [1., 1, 100., 1.])
+        self.assertEqual(self.table.beta_min, 0.25)
+
+    def test_out_of_range(self):
+        x = np.linspace(-0.4, 0.4, 6)
+        self.assertFalse(self.table.in_range(0.1))
+        with self.assertRaises(ValueError):
+            _ = self.table(x, 25., 0.1)
+
+        # uses the FFT instead
+        se = StretchExp(table=self.table)
+        y = se(x, 1.0, 0.0, 25.0, 0.1)
+        expect = StretchExp()(x, 1.0, 0.0, 25.0, 0.1)
+        np.testing.assert_allclose(y, expect)
+
+    def test_deepcopy(self):
+        se = StretchExp(table=self.table)
+        self.assertIs(copy.deepcopy(se)._table, self.table)
+
 
 if __name__ == '__main__':
     unittest.main()
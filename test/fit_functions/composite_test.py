@@ -1,9 +1,11 @@
 import unittest
 import numpy as np
 from quickBayes.functions.SE import StretchExp
+from quickBayes.functions.gaussian import Gaussian
 from quickBayes.functions.lorentz import Lorentzian
 from quickBayes.functions.BG import LinearBG
 from quickBayes.functions.composite import CompositeFunction
+from quickBayes.test_helpers.fitting_data import central_derivative
 
 
 class CompositeFunctionTest(unittest.TestCase):
@@ -218,6 +220,82 @@ class CompositeFunctionTest(unittest.TestCase):
         for j, fun in enumerate(c._funcs):
             self.assertEqual(fun._prefix, f'test:f{j+1}.')
 
+    def test_jacobian(self):
+        x = np.linspace(-1, 1, 20)
+        c = CompositeFunction()
+        c.add_function(LinearBG())
+        c.add_function(Gaussian())
+        self.assertTrue(c.has_jacobian)
+
+        params = [0.1, -0.3, 1.2, 0.1, 0.4]
+        jac = c.jacobian(x, *params)
+        expect = central_derivative(c, x, params)
+        self.assertEqual(jac.shape, (5, len(x)))
+        np.testing.assert_allclose(jac, expect, rtol=1.e-6, atol=1.e-6)
+
+    def test_no_jacobian(self):
+        c = CompositeFunction()
+        c.add_function(LinearBG())
+        c.add_function(StretchExp())
+        self.assertFalse(c.has_jacobian)
+
+    def test_no_jacobian_call_override(self):
+        class Scaled(CompositeFunction):
+            def __call__(self, x, *args):
+                return 2.*super().__call__(x, *args)
+
+        c = Scaled()
+        c.add_function(LinearBG())
+        c.add_function(Gaussian())
+        # the inherited derivatives no longer match
+        self.assertFalse(c.has_jacobian)
+        with self.assertRaises(NotImplementedError):
+            c.jacobian(np.linspace(-1, 1, 5), 0.1, -0.3, 1.2, 0.1, 0.4)
+
+    def test_batch_call(self):
+        x = np.linspace(-1, 1, 20)
+        c = CompositeFunction()
+        c.add_function(LinearBG())
+        c.add_function(Gaussian())
+        P = np.array([[0.1, -0.3, 1.2, 0.1, 0.4],
+                      [0.2, 0.3, 2.2, -0.1, 0.2]])
+        y = c.batch_call(x, P)
+
+        self.assertEqual(y.shape, (2, len(x)))
+        for j in range(len(P)):
+            np.testing.assert_allclose(y[j], c(x, *P[j]))
+
+    def test_batch_call_empty(self):
+        x = np.linspace(-1, 1, 20)
+        c = CompositeFunction()
+        y = c.batch_call(x, np.zeros((3, 0)))
+        self.assertEqual(y.shape, (3, len(x)))
+        self.assertEqual(np.count_nonzero(y), 0)
+
+    def test_batch_call_wrong_shape(self):
+        x = np.linspace(-1, 1, 20)
+        c = CompositeFunction()
+        c.add_function(LinearBG())
+        with self.assertRaises(ValueError):
+            c.batch_call(x, np.ones((2, 3)))
+
+    def test_evaluate_into(self):
+        x = np.linspace(-5, 5, 20)
+        c = CompositeFunction()
+        c.add_function(Gaussian())
+        c.add_function(StretchExp())
+        params = [1., 0.1, 0.5, 2., 0.2, 10., 0.7]
+        out = np.ones(len(x))
+        result = c.evaluate_into(x, out, *params)
+
+        self.assertIs(result, out)
+        np.testing.assert_allclose(out, 1. + c(x, *params))
+
+    def test_evaluate_into_empty(self):
+        x = np.linspace(-5, 5, 20)
+        out = CompositeFunction().evaluate_into(x, np.ones(len(x)))
+        np.testing.assert_array_equal(out, np.ones(len(x)))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,10 +1,14 @@
 import unittest
 from numpy import ndarray
 import numpy as np
+from scipy import signal
+from quickBayes.functions.base import work_array
 from quickBayes.functions.gaussian import Gaussian
 from quickBayes.functions.convolution import (
         ConvolutionWithResolution as conv)
 from quickBayes.utils.crop_data import crop
+from quickBayes.functions.lorentz import Lorentzian
+from quickBayes.test_helpers.fitting_data import central_derivative
 
 
 def analytic(x: ndarray, amp: float, mu: float, sig: float,
@@ -226,6 +230,99 @@ class ConvolutionTest(unittest.TestCase):
         self.assertEqual(lower, [-1., -2., -3, -4, -5, -6])
         self.assertEqual(upper, [1., 2, 3, 3, 4, 5])
 
+    def test_jacobian(self):
+        x = np.linspace(-5., 5, 100)
+        res = Gaussian()
+        res_y = res(x, 1., 0.1, 0.3)
+
+        c = conv(x, res_y, -6, 6)
+        c.add_function(Lorentzian())
+        self.assertTrue(c.has_jacobian)
+
+        params = [1.2, 0.2, 0.6]
+        jac = c.jacobian(x, *params)
+        expect = central_derivative(c, x, params)
+        self.assertEqual(jac.shape, (3, len(x)))
+        np.testing.assert_allclose(jac, expect, rtol=1.e-6, atol=1.e-6)
+
+    def test_matches_direct_convolution(self):
+        for N_res in [50, 51]:
+            x = np.linspace(-5., 5, 100)
+            rx = np.linspace(-5., 5, N_res)
+            res = Gaussian()
+            res_y = res(rx, 1., 0.4, 0.9)
+
+            c = conv(rx, res_y, -6, 6)
+            c.add_function(Lorentzian())
+
+            model = Lorentzian()(x, 1.2, -0.3, 0.5)
+            expect = signal.convolve(model, c._ry, mode='same')
+            np.testing.assert_allclose(c(x, 1.2, -0.3, 0.5), expect,
+                                       atol=1.e-12)
+
+    def test_kernel_cache(self):
+        x = np.linspace(-5., 5, 100)
+        res = Gaussian()
+        res_y = res(x, 1., 0.1, 0.3)
+
+        c = conv(x, res_y, -6, 6)
+        c.add_function(Lorentzian())
+        self.assertIsNone(c._kernel)
+
+        _ = c(x, 1., 0.2, 0.6)
+        kernel = c._kernel
+        self.assertEqual(kernel[0], len(x))
+        # reuses the cached kernel
+        _ = c(x, 1., 0.1, 0.3)
+        self.assertIs(c._kernel, kernel)
+
+        # different length of data
+        _ = c(x[:50], 1., 0.1, 0.3)
+        self.assertEqual(c._kernel[0], 50)
+
+        # updating the resolution clears the cache
+        c.update_x_range(np.linspace(-5, 5, 200))
+        self.assertIsNone(c._kernel)
+
+    def test_batch_call(self):
+        x = np.linspace(-5., 5, 100)
+        res = Gaussian()
+        res_y = res(x, 1., 0.1, 0.3)
+
+        c = conv(x, res_y, -6, 6)
+        c.add_function(Lorentzian())
+        c.add_function(Gaussian())
+        P = np.array([[1.2, 0.2, 0.6, 1., 0.1, 0.4],
+                      [0.2, -0.2, 0.3, 2., 0.3, 1.4],
+                      [1., 0.0, 1.6, 0., 0.1, 0.4]])
+        y = c.batch_call(x, P)
+
+        self.assertEqual(y.shape, (3, len(x)))
+        for j in range(len(P)):
+            np.testing.assert_allclose(y[j], c(x, *P[j]), atol=1.e-12)
+
+    def test_evaluate_into(self):
+        x = np.linspace(-5., 5, 100)
+        res = Gaussian()
+        res_y = res(x, 1., 0.1, 0.3)
+
+        c = conv(x, res_y, -6, 6)
+        c.add_function(Lorentzian())
+        c.add_function(Gaussian())
+        params = [1.2, 0.2, 0.6, 1., 0.1, 0.4]
+        out = np.ones(len(x))
+        result = c.evaluate_into(x, out, *params)
+
+        self.assertIs(result, out)
+        np.testing.assert_allclose(out, 1. + c(x, *params))
+        # the work arrays are kept in the pool for this thread
+        with work_array(len(x)) as work:
+            pass
+        c.evaluate_into(x, out, *params)
+        with work_array(len(x)) as reused:
+            self.assertIs(reused, work)
+        np.testing.assert_allclose(out, 1. + 2.*c(x, *params))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -89,6 +89,40 @@ class DeltaTest(unittest.TestCase):
         self.assertEqual(bounds[0], [1, 2])
         self.assertEqual(bounds[1], [5, 6])
 
+    def test_jacobian(self):
+        x = np.linspace(0.0, 5.0, 11)
+        d = Delta()
+        self.assertTrue(d.has_jacobian)
+        jac = d.jacobian(x, 2.3, 1.2)
+        #  x :    0, 0.5, 1,      1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5.
+        expect = [0, 0.0, 1./0.5, 0.0, 0, 0.0, 0, 0.0, 0, 0.0, 0]
+
+        self.assertEqual(jac.shape, (2, len(x)))
+        for j in range(len(expect)):
+            self.assertAlmostEqual(jac[0][j], expect[j], 3)
+            self.assertEqual(jac[1][j], 0.)
+
+    def test_batch_call(self):
+        x = np.linspace(-5, 5, 11)
+        func = Delta()
+        P = np.array([[1., 0.1], [2.3, -4.9], [0.5, 4.9], [1.2, 5.]])
+        y = func.batch_call(x, P)
+
+        self.assertEqual(y.shape, (len(P), len(x)))
+        for j in range(len(P)):
+            np.testing.assert_allclose(y[j], func(x, *P[j]))
+
+    def test_evaluate_into(self):
+        x = np.linspace(-5, 5, 11)
+        func = Delta()
+        params = [2.3, -0.4]
+        out = np.linspace(0, 1, len(x))
+        result = func.evaluate_into(x, out, *params)
+
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(out, np.linspace(0, 1, len(x)) +
+                                      func(x, *params))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 import numpy as np
 from quickBayes.functions.exp_decay import ExpDecay
+from quickBayes.test_helpers.fitting_data import central_derivative
 
 
 class ExpDecayTest(unittest.TestCase):
@@ -68,6 +69,37 @@ class ExpDecayTest(unittest.TestCase):
         self.assertEqual(bounds[0], [1, 2])
         self.assertEqual(bounds[1], [3, 4])
 
+    def test_jacobian(self):
+        x = np.linspace(-0.4, 0.4, 6)
+        fun = ExpDecay()
+        self.assertTrue(fun.has_jacobian)
+
+        jac = fun.jacobian(x, 1.3, 0.7)
+        expect = central_derivative(fun, x, [1.3, 0.7])
+        self.assertEqual(jac.shape, (2, len(x)))
+        np.testing.assert_allclose(jac, expect, rtol=1.e-6, atol=1.e-6)
+
+    def test_batch_call(self):
+        x = np.linspace(0, 5, 20)
+        func = ExpDecay()
+        P = np.array([[1., 0.1], [2.3, 1.2], [0.5, 0.]])
+        y = func.batch_call(x, P)
+
+        self.assertEqual(y.shape, (len(P), len(x)))
+        for j in range(len(P)):
+            np.testing.assert_allclose(y[j], func(x, *P[j]))
+
+    def test_evaluate_into(self):
+        x = np.linspace(-5, 5, 20)
+        func = ExpDecay()
+        params = [2.3, 0.4]
+        out = np.linspace(0, 1, len(x))
+        result = func.evaluate_into(x, out, *params)
+
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(out, np.linspace(0, 1, len(x)) +
+                                      func(x, *params))
+
 
 if __name__ == '__main__':
     unittest.main()
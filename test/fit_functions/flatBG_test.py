@@ -1,6 +1,7 @@
 import unittest
 import numpy as np
 from quickBayes.functions.BG import FlatBG
+from quickBayes.test_helpers.fitting_data import central_derivative
 
 
 class FlatBGTest(unittest.TestCase):
@@ -75,6 +76,37 @@ class FlatBGTest(unittest.TestCase):
         self.assertEqual(lower, [0.])
         self.assertEqual(upper, [2.])
 
+    def test_jacobian(self):
+        x = np.linspace(-0.4, 0.4, 6)
+        bg = FlatBG()
+        self.assertTrue(bg.has_jacobian)
+
+        jac = bg.jacobian(x, 1.3)
+        expect = central_derivative(bg, x, [1.3])
+        self.assertEqual(jac.shape, (1, len(x)))
+        np.testing.assert_allclose(jac, expect, rtol=1.e-6, atol=1.e-6)
+
+    def test_batch_call(self):
+        x = np.linspace(-5, 5, 20)
+        func = FlatBG()
+        P = np.array([[1.], [-2.3], [0.5]])
+        y = func.batch_call(x, P)
+
+        self.assertEqual(y.shape, (len(P), len(x)))
+        for j in range(len(P)):
+            np.testing.assert_allclose(y[j], func(x, *P[j]))
+
+    def test_evaluate_into(self):
+        x = np.linspace(-5, 5, 20)
+        func = FlatBG()
+        params = [1.3]
+        out = np.linspace(0, 1, len(x))
+        result = func.evaluate_into(x, out, *params)
+
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(out, np.linspace(0, 1, len(x)) +
+                                      func(x, *params))
+
 
 if __name__ == '__main__':
     unittest.main()
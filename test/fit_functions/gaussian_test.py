@@ -1,6 +1,7 @@
 import unittest
 import numpy as np
 from quickBayes.functions.gaussian import Gaussian
+from quickBayes.test_helpers.fitting_data import central_derivative
 
 
 class GaussianTest(unittest.TestCase):
@@ -69,6 +70,49 @@ class GaussianTest(unittest.TestCase):
         self.assertEqual(bounds[0], [1., 2, 3.])
         self.assertEqual(bounds[1], [6, 7, 8])
 
+    def test_jacobian_call_override(self):
+        class Shifted(Gaussian):
+            def __call__(self, x, amplitude, x0, sigma):
+                return super().__call__(x, amplitude, x0 + 0.1, sigma)
+
+        class ShiftedWithJacobian(Shifted):
+            def jacobian(self, x, amplitude, x0, sigma):
+                return Gaussian.jacobian(self, x, amplitude, x0 + 0.1, sigma)
+
+        self.assertFalse(Shifted().has_jacobian)
+        self.assertTrue(ShiftedWithJacobian().has_jacobian)
+
+    def test_jacobian(self):
+        x = np.linspace(-0.4, 0.4, 6)
+        g = Gaussian()
+        self.assertTrue(g.has_jacobian)
+
+        jac = g.jacobian(x, 2.1, 0.1, 0.3)
+        expect = central_derivative(g, x, [2.1, 0.1, 0.3])
+        self.assertEqual(jac.shape, (3, len(x)))
+        np.testing.assert_allclose(jac, expect, rtol=1.e-6, atol=1.e-6)
+
+    def test_batch_call(self):
+        x = np.linspace(-5, 5, 20)
+        func = Gaussian()
+        P = np.array([[1., 0.1, 0.5], [2.3, -0.4, 1.2], [0.5, 0., 0.1]])
+        y = func.batch_call(x, P)
+
+        self.assertEqual(y.shape, (len(P), len(x)))
+        for j in range(len(P)):
+            np.testing.assert_allclose(y[j], func(x, *P[j]))
+
+    def test_evaluate_into(self):
+        x = np.linspace(-5, 5, 20)
+        func = Gaussian()
+        params = [2.3, -0.4, 1.2]
+        out = np.linspace(0, 1, len(x))
+        result = func.evaluate_into(x, out, *params)
+
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(out, np.linspace(0, 1, len(x)) +
+                                      func(x, *params))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 import numpy as np
 from quickBayes.functions.BG import LinearBG
+from quickBayes.test_helpers.fitting_data import central_derivative
 
 
 class LinearBGTest(unittest.TestCase):
@@ -87,6 +88,48 @@ class LinearBGTest(unittest.TestCase):
         self.assertEqual(lower, [0., 0])
         self.assertEqual(upper, [2., 2])
 
+    def test_jacobian(self):
+        x = np.linspace(-0.4, 0.4, 6)
+        lbg = LinearBG()
+        self.assertTrue(lbg.has_jacobian)
+
+        jac = lbg.jacobian(x, 1.3, -0.2)
+        expect = central_derivative(lbg, x, [1.3, -0.2])
+        self.assertEqual(jac.shape, (2, len(x)))
+        np.testing.assert_allclose(jac, expect, rtol=1.e-6, atol=1.e-6)
+
+    def test_batch_call(self):
+        x = np.linspace(-5, 5, 20)
+        func = LinearBG()
+        P = np.array([[1., 0.1], [-2.3, 1.2]])
+        y = func.batch_call(x, P)
+
+        self.assertEqual(y.shape, (len(P), len(x)))
+        for j in range(len(P)):
+            np.testing.assert_allclose(y[j], func(x, *P[j]))
+
+    def test_evaluate_into(self):
+        x = np.linspace(-5, 5, 20)
+        func = LinearBG()
+        params = [0.3, -1.2]
+        out = np.linspace(0, 1, len(x))
+        result = func.evaluate_into(x, out, *params)
+
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(out, np.linspace(0, 1, len(x)) +
+                                      func(x, *params))
+
+    def test_evaluate_into_changed_call(self):
+        # a new __call__ means the default evaluate_into is used
+        class ScaledBG(LinearBG):
+            def __call__(self, x, m, c):
+                return 2.*super().__call__(x, m, c)
+
+        x = np.linspace(-5, 5, 20)
+        func = ScaledBG()
+        out = func.evaluate_into(x, np.zeros(len(x)), 0.3, -1.2)
+        np.testing.assert_allclose(out, 2.*(0.3*x - 1.2))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -46,6 +46,24 @@ class NoBGTest(unittest.TestCase):
         params = bg.read_from_report(report, 0)
         self.assertEqual(params, [])
 
+    def test_batch_call(self):
+        x = np.linspace(-5, 5, 20)
+        y = NoBG().batch_call(x, np.zeros((3, 0)))
+
+        self.assertEqual(y.shape, (3, len(x)))
+        self.assertEqual(np.count_nonzero(y), 0)
+
+    def test_evaluate_into(self):
+        x = np.linspace(-5, 5, 20)
+        func = NoBG()
+        params = []
+        out = np.linspace(0, 1, len(x))
+        result = func.evaluate_into(x, out, *params)
+
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(out, np.linspace(0, 1, len(x)) +
+                                      func(x, *params))
+
 
 if __name__ == '__main__':
     unittest.main()
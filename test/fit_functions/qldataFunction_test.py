@@ -1,8 +1,10 @@
 import unittest
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from quickBayes.functions.lorentz import Lorentzian
 from quickBayes.functions.BG import LinearBG
 from quickBayes.functions.qldata_function import QlDataFunction
+from quickBayes.test_helpers.fitting_data import central_derivative
 
 
 class QLDataFunctionTest(unittest.TestCase):
@@ -593,6 +595,109 @@ class QLDataFunctionTest(unittest.TestCase):
         self.assertEqual(lower, [-1, -1, 0, -6, -5, -7, -3, 1])
         self.assertEqual(upper, [1, 1, np.inf, 6, 5, 7, 3, 4])
 
+    def test_jacobian(self):
+        x = np.linspace(-5, 5, 50)
+        bg = LinearBG()
+        lor = Lorentzian()
+        y = lor(x, 1., -.2, .6)
+
+        ql = QlDataFunction(bg, True, x, y, -6, 6)
+        ql.add_single_lorentzian()
+        ql.add_single_lorentzian()
+        self.assertTrue(ql.has_jacobian)
+
+        params = [.02, 1, .2, .1, 1, .6, .7, .3]
+        jac = ql.jacobian(x, *params)
+        # the peak centre is tied, so includes all of the peaks
+        expect = central_derivative(ql, x, params)
+        self.assertEqual(jac.shape, (8, len(x)))
+        np.testing.assert_allclose(jac, expect, rtol=1.e-5, atol=1.e-5)
+
+    def test_jacobian_no_delta(self):
+        x = np.linspace(-5, 5, 50)
+        bg = LinearBG()
+        lor = Lorentzian()
+        y = lor(x, 1., -.2, .6)
+
+        ql = QlDataFunction(bg, False, x, y, -6, 6)
+        ql.add_single_lorentzian()
+        ql.add_single_lorentzian()
+
+        params = [.02, 1, .2, .1, .6, .7, .3]
+        jac = ql.jacobian(x, *params)
+        expect = central_derivative(ql, x, params)
+        self.assertEqual(jac.shape, (7, len(x)))
+        np.testing.assert_allclose(jac, expect, rtol=1.e-5, atol=1.e-5)
+
+    def test_batch_call(self):
+        x = np.linspace(-5, 5, 50)
+        bg = LinearBG()
+        lor = Lorentzian()
+        y = lor(x, 1., -.2, .6)
+
+        ql = QlDataFunction(bg, True, x, y, -6, 6)
+        ql.add_single_lorentzian()
+        ql.add_single_lorentzian()
+
+        P = np.array([[.02, 1, .2, .1, 1, .6, .7, .3],
+                      [.01, 2, .3, -.1, .5, .2, .1, .9]])
+        result = ql.batch_call(x, P)
+
+        self.assertEqual(result.shape, (2, len(x)))
+        for j in range(len(P)):
+            np.testing.assert_allclose(result[j], ql(x, *P[j]), atol=1.e-12)
+
+    def test_param_map(self):
+        x = np.linspace(-5, 5, 5)
+        bg = LinearBG()
+        ql = QlDataFunction(bg, True, x, np.ones(5), -6, 6)
+        np.testing.assert_array_equal(ql._param_map, [2, 3])
+        ql.add_single_lorentzian()
+        ql.add_single_lorentzian()
+        self.assertEqual(ql.N_params, 8)
+        expect = [2, 3, 4, 3, 5, 6, 3, 7]
+        np.testing.assert_array_equal(ql._param_map, expect)
+        np.testing.assert_array_equal(ql._expand_params(np.arange(8.)*2),
+                                      2*np.array(expect))
+
+    def test_evaluate_into(self):
+        x = np.linspace(-5, 5, 50)
+        lor = Lorentzian()
+        y = lor(x, 1., 0.01, 0.5)
+        ql = QlDataFunction(LinearBG(), True, x, y, -6, 6)
+        ql.add_single_lorentzian()
+        ql.add_single_lorentzian()
+        params = [0.1, 0.2, 1., 0.01, 0.5, 0.05, 0.3, 0.2]
+        out = np.ones(len(x))
+        result = ql.evaluate_into(x, out, *params)
+
+        self.assertIs(result, out)
+        np.testing.assert_allclose(out, 1. + ql(x, *params))
+
+    def test_evaluate_into_concurrent(self):
+        x = np.linspace(-5, 5, 500)
+        lor = Lorentzian()
+        y = lor(x, 1., 0.01, 0.5)
+        ql = QlDataFunction(LinearBG(), True, x, y, -6, 6)
+        ql.add_single_lorentzian()
+        ql.add_single_lorentzian()
+        rng = np.random.default_rng(1)
+        params = rng.uniform(0.01, 1., (64, 8))
+        expect = [ql(x, *p) for p in params]
+
+        def evaluate(p):
+            results = []
+            for _ in range(20):
+                results.append(ql.evaluate_into(x, np.zeros(len(x)), *p))
+            return results
+
+        # the same function object is used by every thread
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(evaluate, params))
+        for j in range(len(params)):
+            for result in results[j]:
+                np.testing.assert_allclose(result, expect[j])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+from unittest import mock
 import numpy as np
 from quickBayes.functions.BG import LinearBG
 from quickBayes.functions.SE import StretchExp
@@ -497,6 +498,31 @@ class QSEFixedFunctionTest(unittest.TestCase):
         self.assertAlmostEqual(self.get_se(ql, 1).get_tau, 13.164, 3)
         self.assertAlmostEqual(self.get_se(ql, 2).get_tau, 3.291, 3)
 
+    def test_table(self):
+        x = np.linspace(0, 5, 6)
+        table = mock.Mock()
+        qse = QSEFixFunction(LinearBG(), False, x, x, 0, 6, table)
+        qse.add_single_SE()
+        qse.add_single_SE()
+
+        for se in qse.conv._funcs:
+            self.assertIs(se._table, table)
+
+    def test_param_map(self):
+        x = np.linspace(-5, 5, 5)
+        bg = LinearBG()
+        # BG (2) + delta (2) + 3 SE (amplitude only)
+        qse = QSEFixFunction(bg, True, x, np.ones(5), -6, 6)
+        for _ in range(3):
+            qse.add_single_SE()
+        self.assertEqual(qse.N_params, 7)
+        expect = [2, 3, 4, 3, 5, 3, 6, 3]
+        np.testing.assert_array_equal(qse._param_map, expect)
+
+        report = qse.report({}, *np.arange(7.))
+        self.assertEqual(report["N3:f2.f4.Amplitude"], [6.])
+        self.assertEqual(report["N3:f2.f4.Peak Centre"], [3.])
+
 
 if __name__ == '__main__':
     unittest.main()
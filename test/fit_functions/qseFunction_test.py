@@ -1,4 +1,5 @@
 import unittest
+from unittest import mock
 import numpy as np
 from quickBayes.functions.BG import LinearBG
 from quickBayes.functions.SE import StretchExp
@@ -448,6 +449,42 @@ class QSEFunctionTest(unittest.TestCase):
         self.assertEqual(lower, [-1, -1, 0, -6, -5, -7, -8, -3, 1, -4])
         self.assertEqual(upper, [1, 1, np.inf, 6, 5, 7, 8, 3, 4, 5])
 
+    def test_table(self):
+        x = np.linspace(0, 5, 6)
+        table = mock.Mock()
+        qse = QSEFunction(LinearBG(), False, x, x, 0, 6, table)
+        qse.add_single_SE()
+        qse.add_single_SE()
+
+        for se in qse.conv._funcs:
+            self.assertIs(se._table, table)
+
+    def test_param_map(self):
+        x = np.linspace(-5, 5, 5)
+        bg = LinearBG()
+        # BG (2) + delta (2) + 3 SE (3 each, peak centre is tied)
+        qse = QSEFunction(bg, True, x, np.ones(5), -6, 6)
+        for _ in range(3):
+            qse.add_single_SE()
+        self.assertEqual(qse.N_params, 13)
+        expect = [2, 3, 4, 3, 5, 6, 7, 3, 8, 9, 10, 3, 11, 12]
+        np.testing.assert_array_equal(qse._param_map, expect)
+
+        # BG (2) + 3 SE, the first SE has the peak centre
+        qse = QSEFunction(bg, False, x, np.ones(5), -6, 6)
+        for _ in range(3):
+            qse.add_single_SE()
+        self.assertEqual(qse.N_params, 12)
+        expect = [2, 3, 4, 5, 6, 3, 7, 8, 9, 3, 10, 11]
+        np.testing.assert_array_equal(qse._param_map, expect)
+
+        params = np.arange(12.)
+        report = qse.report({}, *params)
+        self.assertEqual(report["N3:f2.f3.Amplitude"], [9.])
+        self.assertEqual(report["N3:f2.f3.Peak Centre"], [3.])
+        self.assertEqual(report["N3:f2.f3.tau"], [10.])
+        self.assertEqual(report["N3:f2.f3.beta"], [11.])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,13 +1,16 @@
 import unittest
 from unittest import mock
-from quickBayes.log_likelihood import loglikelihood
+from quickBayes.log_likelihood import (loglikelihood, batch_loglikelihood,
+                                       peak_terms, MAX_PEAKS)
+import numpy as np
+import warnings
 
 
 class LoglikelihoodTest(unittest.TestCase):
     @mock.patch("quickBayes.log_likelihood.log10_hessian_det")
     def test_1_peak(self, mock_log_hess):
         x_size = 2231
-        mock_log_hess.return_value = 38.852
+        mock_log_hess.return_value = (38.852, True)
         chi2 = 1.314
         N_peaks = 1
         beta = 0.6
@@ -18,7 +21,7 @@ class LoglikelihoodTest(unittest.TestCase):
     @mock.patch("quickBayes.log_likelihood.log10_hessian_det")
     def test_2_peaks(self, mock_log_hess):
         x_size = 2231
-        mock_log_hess.return_value = 36.496
+        mock_log_hess.return_value = (36.496, True)
         chi2 = 0.667
         N_peaks = 2
         beta = 0.6
@@ -30,7 +33,7 @@ class LoglikelihoodTest(unittest.TestCase):
     @mock.patch("quickBayes.log_likelihood.log10_hessian_det")
     def test_3_peaks(self, mock_log_hess):
         x_size = 2231
-        mock_log_hess.return_value = 36.253
+        mock_log_hess.return_value = (36.253, True)
         chi2 = 0.666
         N_peaks = 3
         beta = 0.6
@@ -42,7 +45,7 @@ class LoglikelihoodTest(unittest.TestCase):
     @mock.patch("quickBayes.log_likelihood.log10_hessian_det")
     def test_over_optimized(self, mock_log_hess):
         x_size = 2231
-        mock_log_hess.return_value = 36.253
+        mock_log_hess.return_value = (36.253, True)
         chi2 = 0.666
         N_peaks = 3
         beta = 0.6
@@ -54,7 +57,7 @@ class LoglikelihoodTest(unittest.TestCase):
     @mock.patch("quickBayes.log_likelihood.log10_hessian_det")
     def test_over_optimized_negative(self, mock_log_hess):
         x_size = 2231
-        mock_log_hess.return_value = 36.253
+        mock_log_hess.return_value = (36.253, True)
         chi2 = 0.666
         N_peaks = 3
         beta = 0.6
@@ -63,6 +66,30 @@ class LoglikelihoodTest(unittest.TestCase):
         result = loglikelihood(x_size, chi2, covar, N_peaks, beta)
         self.assertAlmostEqual(result, -2131, 0)
 
+    def test_peak_terms(self):
+        for N in [0, 1, 3, MAX_PEAKS, MAX_PEAKS + 5]:
+            expect = (np.sum(np.log10(np.arange(1, N + 1))) +
+                      N*np.log10(4.*np.pi))
+            self.assertAlmostEqual(peak_terms(N), expect, 8)
+
+    def test_batch_loglikelihood(self):
+        chi2 = np.array([1.314, 0.667, 0.666])
+        # the second is overparameterised, the third is not valid
+        covars = np.array([[[.1, .02], [.02, .4]],
+                           [[.1, 1.1], [1.1, 30.]],
+                           [[.1, 0.1], [0.1, -1.4]]])
+
+        result, valid = batch_loglikelihood(2231, chi2, covars, 2, 0.6)
+        self.assertEqual(list(valid), [True, True, False])
+        for j in range(2):
+            expect = loglikelihood(2231, chi2[j], covars[j], 2, 0.6)
+            self.assertAlmostEqual(result[j], expect, 8)
+        # no warning is given for an invalid covariance matrix
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            expect = loglikelihood(2231, chi2[2], covars[2], 2, 0.6)
+        self.assertAlmostEqual(result[2], expect, 8)
+
 
 if __name__ == '__main__':
     unittest.main()
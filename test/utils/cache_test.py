@@ -0,0 +1,61 @@
+import unittest
+from quickBayes.utils.cache import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_get_and_set(self):
+        cache = LRUCache(2)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 1)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_removes_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # a is now the most recently used
+        _ = cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_resize(self):
+        cache = LRUCache(3)
+        for j, key in enumerate(['a', 'b', 'c']):
+            cache.set(key, j)
+        cache.maxsize = 1
+
+        self.assertEqual(cache.maxsize, 1)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get('c'), 2)
+
+    def test_zero_size(self):
+        cache = LRUCache(0)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_negative_size(self):
+        with self.assertRaises(ValueError):
+            _ = LRUCache(-1)
+
+    def test_clear(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        _ = cache.get('a')
+        cache.clear()
+
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.hits, 0)
+        self.assertEqual(cache.misses, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
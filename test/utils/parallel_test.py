@@ -1,6 +1,6 @@
 import unittest
 from quickBayes.workflow.model_selection.QSE import qse_data_main
-from quickBayes.utils.parallel import parallel
+from quickBayes.utils.parallel import parallel, parallel_iter
 import numpy as np
 import os.path
 import time
@@ -26,6 +26,10 @@ def function(j):
     return results, j
 
 
+def square(j):
+    return j*j
+
+
 class ParallelTest(unittest.TestCase):
 
     def test_parallelSpeed(self):
@@ -55,6 +59,45 @@ class ParallelTest(unittest.TestCase):
         self.assertEqual(data[0][1], 0)
         self.assertEqual(data[1][1], 1)
 
+    def test_invalid_backend(self):
+        with self.assertRaises(ValueError):
+            parallel(list(range(2)), function, backend='not a backend')
+
+    def test_multiprocessing(self):
+        data = parallel(list(range(5)), square, 2, 'multiprocessing')
+        self.assertEqual(data, [0, 1, 4, 9, 16])
+
+    def test_multiprocessing_fork(self):
+        data = parallel(list(range(5)), square, 2, 'multiprocessing',
+                        chunk_size=2, start_method='fork')
+        self.assertEqual(data, [0, 1, 4, 9, 16])
+
+    def test_chunk_size(self):
+        data = parallel(list(range(5)), square, 2, 'loky', chunk_size=2)
+        self.assertEqual(data, [0, 1, 4, 9, 16])
+
+    def test_invalid_chunk_size(self):
+        with self.assertRaises(ValueError):
+            parallel(list(range(2)), square, chunk_size=0)
+
+    def test_invalid_start_method(self):
+        with self.assertRaises(ValueError):
+            parallel(list(range(2)), square, backend='multiprocessing',
+                     start_method='not a method')
+
+    def test_parallel_iter(self):
+        for backend in ['threads', 'loky', 'multiprocessing']:
+            data = parallel_iter(list(range(5)), square, 2, backend,
+                                 chunk_size=1)
+            # the outputs can be in any order
+            self.assertEqual(sorted(data), [(j, j*j) for j in range(5)])
+
+    def test_parallel_iter_invalid(self):
+        with self.assertRaises(ValueError):
+            parallel_iter(list(range(2)), square, backend='not a backend')
+        with self.assertRaises(ValueError):
+            parallel_iter(list(range(2)), square, chunk_size=0)
+
 
 if __name__ == '__main__':
     unittest.main()
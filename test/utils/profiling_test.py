@@ -0,0 +1,82 @@
+import unittest
+from quickBayes.utils.profiling import (Profiler, CountingFunction, profile,
+                                        get_active_profiler, stage, NO_STAGE)
+from quickBayes.functions.BG import LinearBG
+import numpy as np
+import copy
+import pickle
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def test_stage(self):
+        profiler = Profiler()
+        with profiler.stage('a'):
+            profiler.add_evaluations(2)
+            with profiler.stage('b'):
+                profiler.add_iterations(3)
+        profiler.set_N(1)
+        with profiler.stage('a'):
+            pass
+
+        report = profiler.report()
+        self.assertEqual(list(report.keys()), ['all', 'N1'])
+        self.assertEqual(report['all']['a']['calls'], 1)
+        self.assertEqual(report['all']['a']['evaluations'], 2)
+        self.assertEqual(report['all']['a']['iterations'], 0)
+        self.assertEqual(report['all']['b']['iterations'], 3)
+        self.assertGreaterEqual(report['all']['a']['time'],
+                                report['all']['b']['time'])
+        self.assertEqual(report['N1']['a']['calls'], 1)
+
+        profiler.clear()
+        self.assertEqual(profiler.report(), {})
+
+    def test_no_stage(self):
+        self.assertIs(stage(None, 'a'), NO_STAGE)
+        profiler = Profiler()
+        with stage(profiler, 'a'):
+            pass
+        self.assertEqual(profiler.report()['all']['a']['calls'], 1)
+
+    def test_counting_function(self):
+        profiler = Profiler()
+        func = profiler.count_evaluations(LinearBG())
+        self.assertIsInstance(func, CountingFunction)
+        self.assertIs(profiler.count_evaluations(func), func)
+        x = np.linspace(0, 1, 5)
+        with profiler.stage('fit'):
+            np.testing.assert_allclose(func(x, 1., 2.), x + 2.)
+            _ = func.batch_call(x, np.ones((4, 2)))
+            out = np.ones(5)
+            func.evaluate_into(x, out, 1., 2.)
+            np.testing.assert_allclose(out, x + 3.)
+        self.assertEqual(func.N_params, 2)
+        self.assertEqual(profiler.report()['all']['fit']['evaluations'], 6)
+
+        # a function without evaluate_into
+        line = profiler.count_evaluations(lambda x, a: a*x)
+        out = np.ones(5)
+        line.evaluate_into(x, out, 2.)
+        np.testing.assert_allclose(out, 2.*x + 1.)
+
+        # only the function is pickled
+        self.assertIsInstance(pickle.loads(pickle.dumps(func)), LinearBG)
+
+    def test_copy(self):
+        profiler = Profiler()
+        with profiler.stage('a'):
+            pass
+        self.assertIs(copy.deepcopy(profiler), profiler)
+        new = pickle.loads(pickle.dumps(profiler))
+        self.assertEqual(new.report(), profiler.report())
+
+    def test_profile(self):
+        self.assertIsNone(get_active_profiler())
+        with profile() as profiler:
+            self.assertIs(get_active_profiler(), profiler)
+        self.assertIsNone(get_active_profiler())
+
+
+if __name__ == '__main__':
+    unittest.main()
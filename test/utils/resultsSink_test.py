@@ -0,0 +1,159 @@
+import unittest
+from quickBayes.utils.results_sink import (NpzSink, ResultsSink,
+                                           fingerprint)
+import numpy as np
+import tempfile
+import os
+
+
+def mock_row(j: int) -> tuple:
+    results = {'N1:a': [float(j)], 'N1:loglikelihood': [-float(j)]}
+    errors = {'N1:a': [0.1*j]}
+    x = np.linspace(0, 1, 5 + j)
+    fits = [np.sin(x), np.cos(x)]
+    fit_errors = [0.1*x, 0.2*x]
+    return results, errors, x, fits, fit_errors
+
+
+class ResultsSinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, 'results')
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_flush_every_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            ResultsSink(flush_every=0)
+
+    def test_base_is_not_implemented(self):
+        sink = ResultsSink(flush_every=1)
+        with self.assertRaises(NotImplementedError):
+            sink.write(0, *mock_row(0)[:2])
+
+    def test_bounded_flush(self):
+        sink = NpzSink(self.path, flush_every=2)
+        sink.write(0, *mock_row(0))
+        # the row is saved straight away
+        self.assertEqual(os.listdir(self.path), ['row_000000.npz'])
+        self.assertEqual(sink.completed, {0})
+
+        sink.write(1, *mock_row(1))
+        self.assertEqual(os.listdir(self.path), ['shard_000000.npz'])
+
+        sink.write(2, *mock_row(2))
+        sink.close()
+        self.assertEqual(sorted(os.listdir(self.path)),
+                         ['shard_000000.npz', 'shard_000001.npz'])
+
+    def test_load(self):
+        with NpzSink(self.path, flush_every=2) as sink:
+            # the order of completion does not matter
+            for j in [2, 0, 3]:
+                results, errors, _, _, _ = mock_row(j)
+                if j == 3:
+                    results['N2:a'] = [7.]
+                sink.write(j, results, errors)
+
+        results, errors, x, fits, fit_errors = sink.load()
+        self.assertEqual(sorted(results.keys()),
+                         ['N1:a', 'N1:loglikelihood', 'N2:a'])
+        np.testing.assert_equal(results['N1:a'], [0., np.nan, 2., 3.])
+        np.testing.assert_equal(results['N1:loglikelihood'],
+                                [-0., np.nan, -2., -3.])
+        np.testing.assert_equal(results['N2:a'],
+                                [np.nan, np.nan, np.nan, 7.])
+        np.testing.assert_allclose(errors['N1:a'], [0., np.nan, .2, .3])
+        self.assertEqual(x, [])
+        self.assertEqual(fits, [])
+        self.assertEqual(fit_errors, [])
+
+        results, _, _, _, _ = sink.load(num_spectra=6)
+        self.assertEqual(len(results['N1:a']), 6)
+
+    def test_curves(self):
+        with NpzSink(self.path, flush_every=2, save_curves=True) as sink:
+            for j in range(3):
+                sink.write(j, *mock_row(j))
+
+        _, _, x, fits, fit_errors = sink.load(num_spectra=4)
+        for j in range(3):
+            _, _, expect_x, expect_fits, expect_errors = mock_row(j)
+            np.testing.assert_allclose(x[j], expect_x)
+            self.assertEqual(len(fits[j]), 2)
+            for k in range(2):
+                np.testing.assert_allclose(fits[j][k], expect_fits[k])
+                np.testing.assert_allclose(fit_errors[j][k],
+                                           expect_errors[k])
+        self.assertIsNone(x[3])
+        self.assertIsNone(fits[3])
+
+    def test_resume(self):
+        sink = NpzSink(self.path, flush_every=2, save_curves=True)
+        for j in range(3):
+            sink.write(j, *mock_row(j))
+        # interrupted before the last row is in a shard
+        del sink
+
+        sink = NpzSink(self.path, flush_every=2, save_curves=True)
+        self.assertEqual(sink.completed, {0, 1, 2})
+        sink.write(3, *mock_row(3))
+        sink.close()
+        self.assertEqual(sink.completed, {0, 1, 2, 3})
+        self.assertEqual(sorted(os.listdir(self.path)),
+                         ['shard_000000.npz', 'shard_000001.npz'])
+
+        results, _, x, fits, _ = sink.load()
+        np.testing.assert_equal(results['N1:a'], [0., 1., 2., 3.])
+        np.testing.assert_allclose(x[2], mock_row(2)[2])
+        np.testing.assert_allclose(fits[2][1], mock_row(2)[3][1])
+
+    def test_resume_row_in_shard(self):
+        # interrupted after the shard is written,
+        # but before the row files are removed
+        with NpzSink(self.path, flush_every=1) as sink:
+            sink.write(0, *mock_row(0))
+        sink._save_row(sink._read_rows()[0])
+
+        sink = NpzSink(self.path)
+        self.assertEqual(sink.completed, {0})
+        self.assertEqual(os.listdir(self.path), ['shard_000000.npz'])
+        results, _, _, _, _ = sink.load()
+        np.testing.assert_equal(results['N1:a'], [0.])
+
+    def test_fingerprint(self):
+        x = np.linspace(0, 1, 5)
+        value = fingerprint(np.sum, x, {'a': 1., 'b': [x, 'c']}, None)
+        self.assertEqual(value, fingerprint(np.sum, x.copy(),
+                                            {'b': [x, 'c'], 'a': 1.},
+                                            None))
+        self.assertNotEqual(value, fingerprint(np.sum, x + 1e-9,
+                                               {'a': 1., 'b': [x, 'c']},
+                                               None))
+        self.assertNotEqual(value, fingerprint(np.sum, x,
+                                               {'a': 2., 'b': [x, 'c']},
+                                               None))
+
+        sink = NpzSink(self.path)
+        sink.check_fingerprint(value)
+        # the fingerprint is stored
+        NpzSink(self.path).check_fingerprint(value)
+        with self.assertRaises(ValueError):
+            NpzSink(self.path).check_fingerprint(fingerprint(x))
+
+    def test_partial_shard_is_ignored(self):
+        with NpzSink(self.path, flush_every=1) as sink:
+            sink.write(0, *mock_row(0))
+        # a shard that was being written when the run stopped
+        with open(os.path.join(self.path,
+                               'shard_000001.npz.tmp'), 'wb') as tmp:
+            tmp.write(b'partial')
+
+        sink = NpzSink(self.path)
+        self.assertEqual(sink.completed, {0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+from quickBayes.utils.seeding import (smooth, estimate_peak, estimate_decay,
+                                      clip_candidates)
+from quickBayes.functions.lorentz import Lorentzian
+import numpy as np
+
+
+class SeedingTest(unittest.TestCase):
+
+    def test_smooth(self):
+        values = np.array([1., 1., 4., 1., 1.])
+        np.testing.assert_allclose(smooth(values, 3),
+                                   [1., 2., 2., 2., 1.])
+        # an even width is made odd
+        self.assertEqual(len(smooth(values, 2)), len(values))
+        np.testing.assert_allclose(smooth(values, 1), values)
+
+    def test_estimate_peak(self):
+        x = np.linspace(-1, 1, 401)
+        lor = Lorentzian()
+        residuals = lor(x, 0.5, 0.2, 0.1)
+
+        height, centre, FWHM = estimate_peak(x, residuals)
+        self.assertAlmostEqual(centre, 0.2, 2)
+        self.assertAlmostEqual(FWHM, 0.1, 1)
+        # the smoothing lowers the height a little
+        self.assertAlmostEqual(height, 2*0.5/(np.pi*0.1), delta=0.2)
+
+    def test_estimate_peak_none(self):
+        x = np.linspace(-1, 1, 101)
+        self.assertIsNone(estimate_peak(x, -np.ones(len(x))))
+
+    def test_estimate_decay(self):
+        x = np.linspace(0.1, 15, 600)
+        residuals = 0.3*np.exp(-2.*x)
+
+        amplitude, rate = estimate_decay(x, residuals)
+        self.assertAlmostEqual(amplitude, 0.3, 1)
+        self.assertAlmostEqual(rate, 2., 0)
+
+    def test_estimate_decay_none(self):
+        x = np.linspace(0.1, 15, 600)
+        self.assertIsNone(estimate_decay(x, -np.exp(-x)))
+
+    def test_clip_candidates(self):
+        lower = [-1., 0., 0.]
+        upper = [1., 1., 2.]
+        candidates = clip_candidates([[2., -1.], [0.5, 3.], []],
+                                     lower, upper)
+        self.assertEqual(candidates, [[1., 0.], [0.5, 2.], []])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from quickBayes.utils.shared_memory import (SharedArray, share_arrays,
+                                            close_arrays)
+from quickBayes.utils.parallel import parallel
+import numpy as np
+import pickle
+
+
+def row_sum(args):
+    shared, j = args
+    return float(np.sum(np.asarray(shared)[j]))
+
+
+class SharedArrayTest(unittest.TestCase):
+
+    def test_values(self):
+        values = np.arange(6, dtype=float).reshape(2, 3)
+        with SharedArray(values) as shared:
+            self.assertEqual(shared.shape, (2, 3))
+            self.assertEqual(len(shared), 2)
+            np.testing.assert_array_equal(np.asarray(shared), values)
+            # it is a copy of the values
+            values[0, 0] = 10.
+            self.assertEqual(shared.array[0, 0], 0.)
+
+    def test_pickle_shares_memory(self):
+        values = np.arange(1000, dtype=float)
+        with SharedArray(values) as shared:
+            data = pickle.dumps(shared)
+            # only the name is pickled, not the values
+            self.assertLess(len(data), values.nbytes)
+            copy = pickle.loads(data)
+            shared.array[0] = 5.
+            self.assertEqual(copy.array[0], 5.)
+            copy.close()
+
+    def test_processes(self):
+        values = np.arange(6, dtype=float).reshape(3, 2)
+        with SharedArray(values) as shared:
+            items = [(shared, j) for j in range(3)]
+            data = parallel(items, row_sum, 2, 'multiprocessing')
+        self.assertEqual(data, [1., 5., 9.])
+
+    def test_share_arrays(self):
+        values = {'x': np.ones(3), 'y': [1., 2.], 'z': None}
+        shared = share_arrays(values)
+        self.assertIsInstance(shared['x'], SharedArray)
+        self.assertIsInstance(shared['y'], SharedArray)
+        self.assertIsNone(shared['z'])
+        np.testing.assert_array_equal(np.asarray(shared['y']), [1., 2.])
+        close_arrays(shared)
+
+
+if __name__ == '__main__':
+    unittest.main()
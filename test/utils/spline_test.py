@@ -1,7 +1,11 @@
 import unittest
+from unittest import mock
 from numpy import ndarray
 import numpy as np
-from quickBayes.utils.spline import spline
+from quickBayes.utils.spline import (spline, SplineOperator,
+                                     get_spline_operator, spline_many,
+                                     cached_spline, _array_key,
+                                     OPERATOR_CACHE, SPLINE_CACHE)
 
 
 def mock_data(x: ndarray) -> ndarray:
@@ -40,5 +44,91 @@ class SplineTest(unittest.TestCase):
             self.assertAlmostEqual(new_y[j], expect[j], 3)
 
 
+class SplineOperatorTest(unittest.TestCase):
+
+    def setUp(self):
+        OPERATOR_CACHE.clear()
+        SPLINE_CACHE.clear()
+
+    def test_operator(self):
+        x = np.linspace(0., 5., 300)
+        new_x = np.linspace(-1., 6., 500)
+        operator = SplineOperator(x, new_x)
+
+        for y in [mock_data(x), np.exp(-x)]:
+            np.testing.assert_allclose(operator(y), spline(x, y, new_x),
+                                       atol=1.e-13)
+        # extrapolates to zero
+        self.assertEqual(operator.matrix.shape, (500, 300))
+        self.assertEqual(operator.matrix[new_x < 0.].nnz, 0)
+        self.assertEqual(operator.matrix[new_x > 5.].nnz, 0)
+        # the weights decay, so the matrix is sparse
+        self.assertLess(operator.matrix.nnz, 0.5*500*300)
+
+    def test_operator_unsorted(self):
+        rng = np.random.default_rng(1)
+        x = rng.permutation(np.linspace(0., 5., 40))
+        y = mock_data(x)
+        new_x = np.linspace(0., 5., 90)
+        operator = SplineOperator(x, new_x)
+
+        np.testing.assert_allclose(operator(y), spline(x, y, new_x),
+                                   atol=1.e-13)
+
+    def test_matches(self):
+        x = np.linspace(0., 5., 30)
+        new_x = np.linspace(0., 5., 100)
+        operator = SplineOperator(x, new_x)
+
+        self.assertTrue(operator.matches(x, new_x))
+        self.assertTrue(operator.matches(list(x), new_x.copy()))
+        self.assertFalse(operator.matches(x, new_x[1:]))
+        self.assertFalse(operator.matches(x + 1.e-9, new_x))
+
+    def test_get_spline_operator(self):
+        x = np.linspace(0., 5., 30)
+        new_x = np.linspace(0., 5., 100)
+        operator = get_spline_operator(x, new_x)
+
+        self.assertIs(get_spline_operator(x.copy(), new_x), operator)
+        self.assertIsNot(get_spline_operator(x, new_x[:-1]), operator)
+
+    @mock.patch('quickBayes.utils.spline.OPERATOR_THRESHOLD', 3)
+    def test_spline_many(self):
+        x = np.linspace(0., 5., 30)
+        new_x = np.linspace(-1., 5., 100)
+        y = mock_data(x)
+        e = 0.1*np.ones(len(x))
+
+        for j in range(5):
+            sy, se = spline_many(x, [y, e], new_x)
+            np.testing.assert_allclose(sy, spline(x, y, new_x),
+                                       atol=1.e-13)
+            np.testing.assert_allclose(se, spline(x, e, new_x),
+                                       atol=1.e-13)
+            # the operator is only made once the threshold is reached
+            entry = OPERATOR_CACHE.get(_array_key(x, new_x))
+            self.assertEqual(isinstance(entry, SplineOperator), j >= 2)
+
+    def test_cached_spline(self):
+        x = np.linspace(0., 5., 30)
+        y = mock_data(x)
+        new_x = np.linspace(-1., 6., 100)
+
+        new_y = cached_spline(x, y, new_x)
+        np.testing.assert_equal(new_y, spline(x, y, new_x))
+        self.assertEqual(SPLINE_CACHE.misses, 1)
+
+        # changing the result does not change the cache
+        new_y[:] = 0.
+        again = cached_spline(x, y, new_x)
+        np.testing.assert_equal(again, spline(x, y, new_x))
+        self.assertEqual(SPLINE_CACHE.hits, 1)
+
+        # different data
+        cached_spline(x, 2.*y, new_x)
+        self.assertEqual(SPLINE_CACHE.misses, 2)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,11 @@
 import unittest
+from unittest import mock
+import numpy as np
+import tempfile
+import os
+import pickle
 from quickBayes.workflow.grid_search.template import GridSearchTemplate
+from quickBayes.utils.shared_memory import share_arrays, close_arrays
 from quickBayes.functions.BG import FlatBG
 from quickBayes.functions.exp_decay import ExpDecay
 from quickBayes.test_helpers.workflow_helper import (gen_grid_search_data,
@@ -113,6 +119,215 @@ class GridSearchTemplateTest(unittest.TestCase):
                 self.assertEqual(Y[i][j], expect_y[i][j])
                 self.assertAlmostEqual(grid[i][j],
                                        expect_z[i][j], 3)
+        # only the latest fit is kept in full
+        engine = self.wf.fit_engine
+        self.assertEqual(engine.retention, 'all')
+        self.assertEqual(engine.N_fits, 4)
+        with self.assertRaises(IndexError):
+            engine.get_fit_values(0)
+        self.assertEqual(len(engine.get_fit_values(3)[0]), len(x))
+
+    def test_execute_restores_retention(self):
+        x, y, e = gen_grid_search_data()
+        self.wf.preprocess_data(x, y, e)
+        self.wf.set_x_axis(0, 1, 2, 'x')
+        self.wf.set_y_axis(1, 2, 2, 'y')
+        self.func.add_function(ExpDecay())
+        self.wf.set_scipy_engine([0, 0], [-9, -9], [9, 9])
+        engine = self.wf.fit_engine
+        engine.set_retention('last', 3)
+        self.wf.execute(self.func)
+        self.assertEqual(engine.retention, 'last')
+        self.assertEqual(engine.N_keep, 3)
+
+        # also restored if the grid search fails
+        self.wf.set_x_axis(0, 1, 2, 'x')
+        with mock.patch.object(self.wf, '_search',
+                               side_effect=RuntimeError("fail")):
+            with self.assertRaises(RuntimeError):
+                self.wf.execute(self.func)
+        self.assertEqual(engine.retention, 'last')
+        self.assertEqual(engine.N_keep, 3)
+
+    def assert_parallel_matches_serial(self, backend, chunk_size=None):
+        x, y, e = gen_grid_search_data()
+        self.wf.preprocess_data(x, y, e)
+        self.wf.set_x_axis(0, 1, 3, 'x')
+        self.wf.set_y_axis(1, 2, 3, 'y')
+        self.func.add_function(ExpDecay())
+        self.wf.set_scipy_engine([0, 0], [-9, -9], [9, 9])
+        _, _ = self.wf.execute(self.func)
+        serial = np.copy(self.wf.get_grid)
+
+        self.setUp()
+        self.wf.preprocess_data(x, y, e)
+        self.wf.set_x_axis(0, 1, 3, 'x')
+        self.wf.set_y_axis(1, 2, 3, 'y')
+        self.func.add_function(ExpDecay())
+        self.wf.set_scipy_engine([0, 0], [-9, -9], [9, 9])
+        X, Y = self.wf.execute(self.func, N_jobs=2, backend=backend,
+                               chunk_size=chunk_size)
+
+        self.assertEqual(X.shape, (3, 3))
+        self.assertEqual(Y.shape, (3, 3))
+        np.testing.assert_allclose(self.wf.get_grid, serial, atol=1e-4)
+
+    def test_execute_parallel_threads(self):
+        self.assert_parallel_matches_serial('threads')
+
+    def test_execute_parallel_processes(self):
+        self.assert_parallel_matches_serial('loky')
+
+    def test_execute_parallel_multiprocessing(self):
+        self.assert_parallel_matches_serial('multiprocessing', chunk_size=1)
+
+    def test_tile_workflow(self):
+        self.setup_checkpoint_workflow()
+        _, _ = self.wf.execute(self.func)
+        data = {key: np.copy(value) for key, value in self.wf._data.items()}
+        workflow = self.wf._tile_workflow(data, data)
+        self.assertIsNone(workflow.get_grid)
+        self.assertEqual(workflow._params, [])
+        self.assertIs(workflow._data, data)
+        self.assertIs(workflow.get_raw, data)
+        self.assertEqual(workflow.fit_engine.N_fits, 0)
+        self.assertIs(workflow.fit_engine._x_data, data['x'])
+        # the original is not changed
+        self.assertIsNotNone(self.wf.get_grid)
+        self.assertEqual(self.wf.fit_engine.N_fits, 9)
+
+    def test_tile_workflow_shared_data(self):
+        self.setup_checkpoint_workflow()
+        # make the data much larger than the rest of the workflow
+        x = np.linspace(0, 1, 10000)
+        data = {'x': x, 'y': np.exp(-x) + .1, 'e': .1*np.ones(len(x))}
+        self.wf.preprocess_data(data['x'], data['y'], data['e'])
+        shared = share_arrays(self.wf._data)
+        try:
+            workflow = self.wf._tile_workflow(shared, shared)
+            size = len(pickle.dumps(workflow))
+            self.assertLess(size, x.nbytes)
+            restored = pickle.loads(pickle.dumps(workflow))
+            np.testing.assert_allclose(np.asarray(restored._data['y']),
+                                       data['y'])
+            del restored
+        finally:
+            close_arrays(shared)
+
+    def test_get_tiles(self):
+        self.wf.set_x_axis(0, 1, 5, 'x')
+        self.assertEqual(self.wf._get_tiles(2, None), [[0, 1, 2], [3, 4]])
+        self.assertEqual(self.wf._get_tiles(1, 2), [[0, 1], [2, 3], [4]])
+        with self.assertRaises(ValueError):
+            self.wf._get_tiles(1, 0)
+
+    def setup_checkpoint_workflow(self):
+        self.setUp()
+        x, y, e = gen_grid_search_data()
+        self.wf.preprocess_data(x, y, e)
+        self.wf.set_x_axis(0, 1, 3, 'x')
+        self.wf.set_y_axis(1, 2, 3, 'y')
+        self.func.add_function(ExpDecay())
+        self.wf.set_scipy_engine([0, 0], [-9, -9], [9, 9])
+
+    def test_execute_checkpoint(self):
+        self.setup_checkpoint_workflow()
+        _, _ = self.wf.execute(self.func)
+        expect = np.copy(self.wf.get_grid)
+
+        self.setup_checkpoint_workflow()
+        with tempfile.TemporaryDirectory() as path:
+            file_name = os.path.join(path, 'grid.npz')
+            _, _ = self.wf.execute(self.func, checkpoint=file_name)
+            with np.load(file_name) as checkpoint:
+                self.assertTrue(np.all(checkpoint['completed']))
+                np.testing.assert_equal(checkpoint['x_values'],
+                                        [0, 0.5, 1])
+                # the grid is saved before it is normalised
+                self.assertTrue(np.all(checkpoint['grid'] < 0))
+                self.assertEqual(len(checkpoint['params']), 2)
+        np.testing.assert_allclose(self.wf.get_grid, expect)
+        self.assertTrue(np.all(self.wf.get_completed))
+
+    def test_execute_resume(self):
+        self.setup_checkpoint_workflow()
+        _, _ = self.wf.execute(self.func)
+        expect = np.copy(self.wf.get_grid)
+
+        fit_columns = SimpleWorkflow._fit_columns
+        calls = []
+
+        def interrupted(workflow, func, columns):
+            calls.append(columns)
+            if len(calls) > 1:
+                raise KeyboardInterrupt()
+            return fit_columns(workflow, func, columns)
+
+        with tempfile.TemporaryDirectory() as path:
+            file_name = os.path.join(path, 'grid.npz')
+            self.setup_checkpoint_workflow()
+            with mock.patch.object(SimpleWorkflow, '_fit_columns',
+                                   interrupted):
+                with self.assertRaises(KeyboardInterrupt):
+                    self.wf.execute(self.func, checkpoint=file_name,
+                                    checkpoint_interval=0.)
+            with np.load(file_name) as checkpoint:
+                np.testing.assert_equal(checkpoint['completed'],
+                                        [[True, False, False]]*3)
+
+            self.setup_checkpoint_workflow()
+            with mock.patch.object(SimpleWorkflow, '_fit_columns',
+                                   autospec=True,
+                                   side_effect=fit_columns) as fit:
+                _, _ = self.wf.execute(self.func, checkpoint=file_name,
+                                       resume=True)
+            # only the remaining columns are fitted
+            self.assertEqual([call.args[2] for call in fit.call_args_list],
+                             [[1], [2]])
+            np.testing.assert_allclose(self.wf.get_grid, expect, atol=1e-6)
+
+            # resuming a complete grid does not do any fits
+            self.setup_checkpoint_workflow()
+            _, _ = self.wf.execute(self.func, checkpoint=file_name,
+                                   resume=True)
+            self.assertEqual(self.wf.fit_engine.N_fits, 0)
+            np.testing.assert_allclose(self.wf.get_grid, expect, atol=1e-6)
+
+    def test_execute_resume_parallel(self):
+        self.setup_checkpoint_workflow()
+        _, _ = self.wf.execute(self.func)
+        expect = np.copy(self.wf.get_grid)
+
+        with tempfile.TemporaryDirectory() as path:
+            file_name = os.path.join(path, 'grid.npz')
+            self.setup_checkpoint_workflow()
+            # start from part of a grid
+            self.wf._generate_grid()
+            self.wf._completed = np.zeros((3, 3), dtype=bool)
+            self.wf._update_grid([0], self.wf._fit_columns(self.func, [0]),
+                                 self.wf.fit_engine.get_fit_parameters()[0])
+            self.wf.save_checkpoint(file_name)
+
+            _, _ = self.wf.execute(self.func, N_jobs=2, chunk_size=1,
+                                   checkpoint=file_name, resume=True)
+        np.testing.assert_allclose(self.wf.get_grid, expect, atol=1e-4)
+
+    def test_resume_needs_checkpoint(self):
+        self.setup_checkpoint_workflow()
+        with self.assertRaises(ValueError):
+            self.wf.execute(self.func, resume=True)
+
+    def test_resume_different_axis(self):
+        self.setup_checkpoint_workflow()
+        with tempfile.TemporaryDirectory() as path:
+            file_name = os.path.join(path, 'grid.npz')
+            _, _ = self.wf.execute(self.func, checkpoint=file_name)
+
+            self.setup_checkpoint_workflow()
+            self.wf.set_y_axis(1, 3, 3, 'y')
+            with self.assertRaises(ValueError):
+                self.wf.execute(self.func, checkpoint=file_name,
+                                resume=True)
 
     def test_get_slices(self):
         # setup workflow + generate data
@@ -0,0 +1,265 @@
+import unittest
+from quickBayes.workflow.model_selection.batch import (
+        batch_model_selection, _align)
+from quickBayes.workflow.model_selection.muon_decay import (
+        muon_expdecay_main, muon_expdecay_batch)
+from quickBayes.workflow.model_selection.QlData import (
+        ql_data_main, ql_data_batch)
+from quickBayes.utils.results_sink import NpzSink
+import numpy as np
+import tempfile
+import os.path
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'data')
+
+
+class BatchTest(unittest.TestCase):
+
+    def test_align(self):
+        first = {'a': [1.], 'b': [2.]}
+        second = {'a': [3.], 'c': [4.]}
+        result = _align([first, second])
+
+        self.assertEqual(list(result.keys()), ['a', 'b', 'c'])
+        self.assertEqual(list(result['a']), [1., 3.])
+        self.assertEqual(result['b'][0], 2.)
+        self.assertTrue(np.isnan(result['b'][1]))
+        self.assertTrue(np.isnan(result['c'][0]))
+        self.assertEqual(result['c'][1], 4.)
+
+    def test_y_must_be_2D(self):
+        x = np.linspace(0, 1, 10)
+        with self.assertRaises(ValueError):
+            batch_model_selection(muon_expdecay_main, x, x, x,
+                                  "flat", 0.1, 0.9)
+
+    def test_muon_batch(self):
+        muon_dir = os.path.join(DATA_DIR, 'muon')
+        x1, y1, e1 = np.loadtxt(os.path.join(muon_dir,
+                                             'muon_expdecay_1.npy'))
+        x2, y2, e2 = np.loadtxt(os.path.join(muon_dir,
+                                             'muon_expdecay_2.npy'))
+        y = np.array([y1, y2])
+        e = np.array([e1, e2])
+        x = np.array([x1, x2])
+
+        (results, errors,
+         new_x, fits, f_errors) = muon_expdecay_batch(x, y, e, "flat",
+                                                      0.16, 15.)
+
+        for j, (sx, sy, se) in enumerate([(x1, y1, e1), (x2, y2, e2)]):
+            sample = {'x': sx, 'y': sy, 'e': se}
+            (expect, expect_errors,
+             expect_x, expect_fits, _) = muon_expdecay_main(sample, "flat",
+                                                            0.16, 15.,
+                                                            {}, {})
+            self.assertEqual(list(results.keys()), list(expect.keys()))
+            for key in expect.keys():
+                self.assertEqual(len(results[key]), 2)
+                self.assertAlmostEqual(results[key][j], expect[key][0], 5)
+            for key in expect_errors.keys():
+                self.assertAlmostEqual(errors[key][j],
+                                       expect_errors[key][0], 5)
+
+            self.assertEqual(len(fits[j]), len(expect_fits))
+            np.testing.assert_allclose(new_x[j], expect_x)
+            for k in range(len(expect_fits)):
+                np.testing.assert_allclose(fits[j][k], expect_fits[k])
+
+    def test_muon_batch_early_stopping(self):
+        muon_dir = os.path.join(DATA_DIR, 'muon')
+        x1, y1, e1 = np.loadtxt(os.path.join(muon_dir,
+                                             'muon_expdecay_1.npy'))
+        x2, y2, e2 = np.loadtxt(os.path.join(muon_dir,
+                                             'muon_expdecay_2.npy'))
+        y = np.array([y1, y2])
+        e = np.array([e1, e2])
+        x = np.array([x1, x2])
+
+        expect, _, _, _, _ = muon_expdecay_batch(x, y, e, "flat", 0.16, 15.)
+        (results, errors,
+         new_x, fits, f_errors) = muon_expdecay_batch(x, y, e, "flat",
+                                                      0.16, 15.,
+                                                      early_stopping={})
+        # the first spectrum stops after N2, the second after N3
+        self.assertEqual([len(fit) for fit in fits], [2, 3])
+        for N in [1, 2]:
+            np.testing.assert_allclose(results[f'N{N}:loglikelihood'],
+                                       expect[f'N{N}:loglikelihood'])
+        self.assertTrue(np.isnan(results['N3:loglikelihood'][0]))
+        self.assertAlmostEqual(results['N3:loglikelihood'][1],
+                               expect['N3:loglikelihood'][1])
+        np.testing.assert_equal(results['N4:loglikelihood'],
+                                [np.nan, np.nan])
+        self.assertTrue(np.isnan(results['N3:f2.lambda'][0]))
+
+    def test_muon_batch_speculative(self):
+        muon_dir = os.path.join(DATA_DIR, 'muon')
+        x1, y1, e1 = np.loadtxt(os.path.join(muon_dir,
+                                             'muon_expdecay_1.npy'))
+        x2, y2, e2 = np.loadtxt(os.path.join(muon_dir,
+                                             'muon_expdecay_2.npy'))
+        y = np.array([y1, y2])
+        e = np.array([e1, e2])
+        x = np.array([x1, x2])
+
+        speculative = {'N_jobs': 2, 'refine': True}
+        results, _, _, fits, _ = muon_expdecay_batch(x, y, e, "flat",
+                                                     0.16, 15., N=1,
+                                                     speculative=speculative)
+        self.assertEqual([len(fit) for fit in fits], [4, 4])
+        # the same as fitting each spectrum on its own
+        for j, (sx, sy, se) in enumerate([(x1, y1, e1), (x2, y2, e2)]):
+            sample = {'x': sx, 'y': sy, 'e': se}
+            expect, _, _, _, _ = muon_expdecay_main(sample, "flat", 0.16,
+                                                    15., {}, {},
+                                                    speculative=speculative)
+            for N in range(1, 5):
+                key = f'N{N}:loglikelihood'
+                self.assertAlmostEqual(results[key][j], expect[key][0], 5)
+
+    def test_muon_batch_shared_memory(self):
+        muon_dir = os.path.join(DATA_DIR, 'muon')
+        x1, y1, e1 = np.loadtxt(os.path.join(muon_dir,
+                                             'muon_expdecay_1.npy'))
+        x2, y2, e2 = np.loadtxt(os.path.join(muon_dir,
+                                             'muon_expdecay_2.npy'))
+        y = np.array([y1, y2])
+        e = np.array([e1, e2])
+        x = np.array([x1, x2])
+
+        expect, expect_errors, _, _, _ = muon_expdecay_batch(x, y, e, "flat",
+                                                             0.16, 15.)
+        (results, errors,
+         _, fits, _) = muon_expdecay_batch(x, y, e, "flat", 0.16, 15., N=2,
+                                           backend='multiprocessing',
+                                           chunk_size=1, share_memory=True)
+        for key in expect.keys():
+            np.testing.assert_allclose(results[key], expect[key])
+        for key in expect_errors.keys():
+            np.testing.assert_allclose(errors[key], expect_errors[key])
+        self.assertEqual(len(fits), 2)
+
+    def test_muon_batch_sink(self):
+        muon_dir = os.path.join(DATA_DIR, 'muon')
+        x1, y1, e1 = np.loadtxt(os.path.join(muon_dir,
+                                             'muon_expdecay_1.npy'))
+        x2, y2, e2 = np.loadtxt(os.path.join(muon_dir,
+                                             'muon_expdecay_2.npy'))
+        y = np.array([y1, y2, y1])
+        e = np.array([e1, e2, e1])
+        x = np.array([x1, x2, x1])
+
+        (expect, expect_errors,
+         expect_x, expect_fits, _) = muon_expdecay_batch(x, y, e, "flat",
+                                                         0.16, 15.)
+        with tempfile.TemporaryDirectory() as path:
+            sink = NpzSink(path, flush_every=2, save_curves=True)
+            (results, errors,
+             new_x, fits, _) = muon_expdecay_batch(x, y, e, "flat", 0.16,
+                                                   15., N=1, sink=sink)
+            # 2 shards and the fingerprint
+            self.assertEqual(sorted(os.listdir(path)),
+                             ['fingerprint.npz', 'shard_000000.npz',
+                              'shard_000001.npz'])
+
+        for key in expect.keys():
+            np.testing.assert_allclose(results[key], expect[key])
+        for key in expect_errors.keys():
+            np.testing.assert_allclose(errors[key], expect_errors[key])
+        for j in range(3):
+            np.testing.assert_allclose(new_x[j], expect_x[j])
+            for k in range(len(expect_fits[j])):
+                np.testing.assert_allclose(fits[j][k], expect_fits[j][k])
+
+    def test_muon_batch_resume(self):
+        muon_dir = os.path.join(DATA_DIR, 'muon')
+        x1, y1, e1 = np.loadtxt(os.path.join(muon_dir,
+                                             'muon_expdecay_1.npy'))
+        y = np.array([y1, y1])
+        e = np.array([e1, e1])
+
+        expect, _, _, _, _ = muon_expdecay_batch(x1, y, e, "flat",
+                                                 0.16, 15.)
+        with tempfile.TemporaryDirectory() as path:
+            # the first spectrum was done before the run stopped
+            with NpzSink(path) as sink:
+                sink.write(0, {'N1:loglikelihood': [1.]},
+                           {'N1:loglikelihood': [0.]})
+
+            sink = NpzSink(path)
+            results, _, _, _, _ = muon_expdecay_batch(x1, y, e, "flat",
+                                                      0.16, 15., N=1,
+                                                      sink=sink)
+        # the first spectrum is not recalculated
+        self.assertEqual(results['N1:loglikelihood'][0], 1.)
+        self.assertTrue(np.isnan(results['N2:loglikelihood'][0]))
+        for key in expect.keys():
+            self.assertAlmostEqual(results[key][1], expect[key][1])
+
+    def test_muon_batch_sink_writes_each_spectrum(self):
+        muon_dir = os.path.join(DATA_DIR, 'muon')
+        x1, y1, e1 = np.loadtxt(os.path.join(muon_dir,
+                                             'muon_expdecay_1.npy'))
+        y = np.array([y1, y1])
+        e = np.array([e1, e1])
+        with tempfile.TemporaryDirectory() as path:
+            sink = NpzSink(path, flush_every=64)
+            saved = []
+            write = sink.write
+
+            def check_write(index, *args):
+                # the earlier spectra are already on disk
+                saved.append(len(NpzSink(path).completed))
+                write(index, *args)
+
+            sink.write = check_write
+            _ = muon_expdecay_batch(x1, y, e, "flat", 0.16, 15., N=1,
+                                    sink=sink)
+        self.assertEqual(saved, [0, 1])
+
+    def test_muon_batch_sink_different_data(self):
+        muon_dir = os.path.join(DATA_DIR, 'muon')
+        x1, y1, e1 = np.loadtxt(os.path.join(muon_dir,
+                                             'muon_expdecay_1.npy'))
+        y = np.array([y1, y1])
+        e = np.array([e1, e1])
+        with tempfile.TemporaryDirectory() as path:
+            _ = muon_expdecay_batch(x1, y[:1], e[:1], "flat", 0.16, 15.,
+                                    N=1, sink=NpzSink(path))
+            # the data and settings must match to resume
+            with self.assertRaises(ValueError):
+                muon_expdecay_batch(x1, y, e, "flat", 0.16, 15., N=1,
+                                    sink=NpzSink(path))
+            with self.assertRaises(ValueError):
+                muon_expdecay_batch(x1, y[:1], e[:1], "flat", 0.16, 14.,
+                                    N=1, sink=NpzSink(path))
+            results, _, _, _, _ = muon_expdecay_batch(x1, y[:1], e[:1],
+                                                      "flat", 0.16, 15.,
+                                                      N=1,
+                                                      sink=NpzSink(path))
+        self.assertEqual(len(results['N1:loglikelihood']), 1)
+
+    def test_ql_data_batch_shared_resolution(self):
+        sx, sy, se = np.load(os.path.join(DATA_DIR, 'sample_data_red.npy'))
+        rx, ry, re = np.load(os.path.join(DATA_DIR,
+                                          'resolution_data_red.npy'))
+        resolution = {'x': rx, 'y': ry}
+
+        (results, errors,
+         _, fits, _) = ql_data_batch(sx, np.array([sy, sy]),
+                                     np.array([se, se]), resolution,
+                                     "linear", -0.4, 0.4, True)
+        sample = {'x': sx, 'y': sy, 'e': se}
+        expect, _, _, _, _ = ql_data_main(sample, resolution, "linear",
+                                          -0.4, 0.4, True, {}, {})
+        for key in expect.keys():
+            self.assertEqual(len(results[key]), 2)
+            self.assertAlmostEqual(results[key][0], expect[key][0], 5)
+            self.assertAlmostEqual(results[key][1], expect[key][0], 5)
+        self.assertEqual(len(fits), 2)
+        self.assertEqual(len(fits[0]), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
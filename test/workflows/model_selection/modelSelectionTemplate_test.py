@@ -1,9 +1,13 @@
 import unittest
-from quickBayes.workflow.model_selection.template import ModelSelectionWorkflow
+from unittest import mock
+import numpy as np
+from quickBayes.workflow.model_selection.template import (
+    ModelSelectionWorkflow, _fit_candidate, _fit_order)
 from quickBayes.functions.BG import FlatBG
 from quickBayes.functions.exp_decay import ExpDecay
 from quickBayes.functions.composite import CompositeFunction
 from quickBayes.test_helpers.workflow_helper import gen_model_selection_data
+from quickBayes.utils.profiling import profile
 
 
 class SimpleWorkflow(ModelSelectionWorkflow):
@@ -17,6 +21,15 @@ class SimpleWorkflow(ModelSelectionWorkflow):
         return func
 
 
+class SeededWorkflow(SimpleWorkflow):
+    def _residual_guesses(self, func, x_data, residuals):
+        """
+        Fixed guesses for the exp decay, the second is
+        outside of the bounds
+        """
+        return [[1., 2.], [5., 0.01]]
+
+
 class WorkflowTemplateTest(unittest.TestCase):
 
     def setUp(self):
@@ -128,6 +141,14 @@ class WorkflowTemplateTest(unittest.TestCase):
         self.wf.preprocess_data(x, y, e)
         self.wf.set_scipy_engine([], [], [])
         self.assertEqual(self.wf.fit_engine.name, 'scipy')
+        self.assertEqual(self.wf.fit_engine.method, 'curve_fit')
+
+    def test_set_scipy_engine_least_squares(self):
+        x, y, e = gen_model_selection_data()
+        self.wf.preprocess_data(x, y, e)
+        self.wf.set_scipy_engine([], [], [], method='least_squares')
+        self.assertEqual(self.wf.fit_engine.name, 'scipy')
+        self.assertEqual(self.wf.fit_engine.method, 'least_squares')
 
     def test_update_scipy_fit_engine(self):
         self.assertEqual(self.wf.fit_engine, None)
@@ -163,6 +184,301 @@ class WorkflowTemplateTest(unittest.TestCase):
         self.wf.update_fit_engine(bg, [5])
         self.assertEqual(self.wf.fit_engine._lower, [-1])
         self.assertEqual(self.wf.fit_engine._upper, [1])
+        # the fit parameters are used as a seed
+        self.assertEqual(self.wf.fit_engine._seeds, [[5]])
+
+    def test_set_gofit_engine_adaptive(self):
+        x, y, e = gen_model_selection_data()
+        self.wf.preprocess_data(x, y, e)
+        self.wf.set_gofit_engine(5, [], [], adaptive=True, N_agree=3)
+        self.assertTrue(self.wf.fit_engine.adaptive)
+        self.assertEqual(self.wf.fit_engine._N_agree, 3)
+
+    def test_set_mcmc_engine(self):
+        self.assertEqual(self.wf.fit_engine, None)
+        x, y, e = gen_model_selection_data()
+        self.wf.preprocess_data(x, y, e)
+        self.wf.set_mcmc_engine([], [], [], N_steps=100)
+        self.assertEqual(self.wf.fit_engine.name, 'mcmc')
+        self.assertEqual(self.wf.fit_engine._N_steps, 100)
+
+    def test_update_mcmc_engine(self):
+        x, y, e = gen_model_selection_data()
+        self.wf.preprocess_data(x, y, e)
+        self.wf.set_mcmc_engine([], [], [])
+
+        bg = FlatBG()
+        self.wf.update_fit_engine(bg, [0.5])
+        self.assertEqual(self.wf.fit_engine._guess, [0.5])
+        self.assertEqual(list(self.wf.fit_engine._lower), [-1])
+        self.assertEqual(list(self.wf.fit_engine._upper), [1])
+
+    def test_mcmc_reports_evidence(self):
+        x, y, e = gen_model_selection_data()
+        self.wf.preprocess_data(x, y, e)
+        self.wf.set_mcmc_engine([], [], [], N_steps=200, burn_in=200,
+                                seed=1)
+        _ = self.wf.execute(1, self.func, [0.5])
+        params, _ = self.wf.get_parameters_and_errors
+        self.assertIn('N1:loglikelihood', params.keys())
+        self.assertIn('N1:log10_evidence', params.keys())
+        self.assertEqual(len(params['N1:log10_evidence']), 1)
+
+    def test_profile_report(self):
+        self.assertIsNone(self.wf.profile_report)
+        x, y, e = gen_model_selection_data()
+        self.wf.preprocess_data(x, y, e)
+        self.wf.set_scipy_engine([0], [-9], [9])
+        self.wf.enable_profiling()
+        self.assertIsNotNone(self.wf.fit_engine.profiler)
+        _ = self.wf.execute(2, self.func)
+
+        report = self.wf.profile_report
+        self.assertEqual(list(report.keys()), ['N1', 'N2'])
+        for N in ['N1', 'N2']:
+            self.assertEqual(report[N]['update']['calls'], 1)
+            self.assertEqual(report[N]['report']['calls'], 1)
+            self.assertEqual(report[N]['optimiser']['calls'], 1)
+            self.assertGreater(report[N]['optimiser']['evaluations'], 0)
+
+    def test_profile_context(self):
+        with profile() as profiler:
+            workflow = SimpleWorkflow({}, {})
+        self.assertIsNone(SimpleWorkflow({}, {}).profile_report)
+        x, y, e = gen_model_selection_data()
+        workflow.preprocess_data(x, y, e)
+        workflow.set_scipy_engine([0], [-9], [9], 'least_squares')
+        _ = workflow.execute(1, self.func)
+        report = profiler.report()
+        self.assertEqual(workflow.profile_report, report)
+        self.assertGreater(report['N1']['optimiser']['iterations'], 0)
+
+    def test_enable_seeding_bad_candidates(self):
+        with self.assertRaises(ValueError):
+            self.wf.enable_seeding(N_candidates=0)
+
+    def test_candidates_without_seeding(self):
+        x, y, e = gen_model_selection_data()
+        self.wf.preprocess_data(x, y, e)
+        self.assertIsNone(self.wf._get_residuals(self.func, [0.5]))
+        self.assertEqual(self.wf._get_candidates(self.func, [0.5], None,
+                                                 1), [[0.5]])
+
+    def test_seeding_candidates(self):
+        wf = SeededWorkflow({}, {})
+        x, y, e = gen_model_selection_data()
+        wf.preprocess_data(x, y, e)
+        wf.enable_seeding(N_candidates=2)
+
+        residuals = wf._get_residuals(self.func, [0.5])
+        self.assertEqual(len(residuals), len(x))
+        func = wf.update_function(self.func, 1)
+        candidates = wf._get_candidates(func, [0.5], residuals, 1)
+        # ranked by chi^2, the last one (clipped to [1, 0.01]) is removed
+        self.assertEqual(candidates, [[0.5, 1., 2.], [0.5, 1., 0.1]])
+
+    def test_seeding_wrong_length(self):
+        wf = SeededWorkflow({}, {})
+        x, y, e = gen_model_selection_data()
+        wf.preprocess_data(x, y, e)
+        wf.enable_seeding()
+        wf._residual_guesses = lambda func, x, residuals: [[1.]]
+
+        residuals = wf._get_residuals(self.func, [0.5])
+        func = wf.update_function(self.func, 1)
+        with self.assertRaises(ValueError):
+            wf._get_candidates(func, [0.5], residuals, 1)
+
+    def test_execute_fit_candidates(self):
+        x, y, e = gen_model_selection_data()
+        self.wf.preprocess_data(x, y, e)
+        self.wf.set_scipy_engine([0], [-9], [9])
+        _ = self.wf.execute(1, self.func, [0.5])
+        expected, _ = self.wf.get_parameters_and_errors
+
+        wf = SeededWorkflow({}, {})
+        wf.preprocess_data(x, y, e)
+        wf.set_scipy_engine([0], [-9], [9])
+        wf.enable_seeding(fit_candidates=True, N_jobs=2)
+        func = CompositeFunction()
+        func.add_function(FlatBG())
+        with mock.patch('quickBayes.workflow.model_selection.template.'
+                        '_fit_candidate', wraps=_fit_candidate) as fit:
+            _ = wf.execute(1, func, [0.5])
+        self.assertEqual(fit.call_count, 3)
+        self.assertEqual(wf.fit_engine.N_fits, 1)
+
+        results, _ = wf.get_parameters_and_errors
+        for key in expected.keys():
+            self.assertAlmostEqual(results[key][0], expected[key][0], 3)
+
+    def test_fit_candidates_without_history(self):
+        wf = SeededWorkflow({}, {})
+        x, y, e = gen_model_selection_data()
+        wf.preprocess_data(x, y, e)
+        wf.set_scipy_engine([0], [-9], [9])
+        wf.enable_seeding(fit_candidates=True)
+        engine = wf.fit_engine
+        sizes = []
+
+        def fit(args):
+            sizes.append(args[0].N_fits)
+            return _fit_candidate(args)
+
+        func = CompositeFunction()
+        func.add_function(FlatBG())
+        with mock.patch('quickBayes.workflow.model_selection.template.'
+                        '_fit_candidate', side_effect=fit):
+            _ = wf.execute(3, func, [0.5])
+        # the copies are empty, the best fit is added to the engine
+        self.assertEqual(sizes, [0]*9)
+        self.assertIs(wf.fit_engine, engine)
+        self.assertEqual(engine.N_fits, 3)
+
+    def test_gofit_uses_candidates_as_seeds(self):
+        wf = SeededWorkflow({}, {})
+        x, y, e = gen_model_selection_data()
+        wf.preprocess_data(x, y, e)
+        wf.set_gofit_engine(5, [], [], adaptive=True)
+        wf.enable_seeding(fit_candidates=True)
+        func = wf.update_function(self.func, 1)
+        candidates = [[0.5, 1., 2.], [0.5, 1., 0.1]]
+        with mock.patch.object(wf.fit_engine, 'do_fit') as do_fit:
+            wf._fit_candidates(func, candidates)
+        do_fit.assert_called_once()
+        self.assertEqual(len(wf.fit_engine._seeds), 2)
+
+    def test_enable_early_stopping_bad_options(self):
+        with self.assertRaises(ValueError):
+            self.wf.enable_early_stopping(margin=-1.)
+        with self.assertRaises(ValueError):
+            self.wf.enable_early_stopping(N_drops=0)
+
+    def test_early_stopping(self):
+        x, y, e = gen_model_selection_data()
+        # N3 and N4 are more than 1 below the best (N2)
+        for N_drops, skipped in [(1, [4, 5]), (2, [5])]:
+            workflow = SimpleWorkflow({}, {})
+            workflow.preprocess_data(x, y, e)
+            workflow.set_scipy_engine([0], [-9], [9])
+            workflow.enable_early_stopping(N_drops=N_drops,
+                                           overparameterised=False)
+            func = CompositeFunction()
+            func.add_function(FlatBG())
+            probs = iter([-10., -5., -8., -7., -4.])
+            with mock.patch('quickBayes.workflow.model_selection.template.'
+                            'loglikelihood', side_effect=lambda *args:
+                            next(probs)):
+                _ = workflow.execute(5, func, [0.5])
+
+            self.assertEqual(workflow.skipped, skipped)
+            self.assertEqual(workflow.fit_engine.N_fits, 5 - len(skipped))
+            results, _ = workflow.get_parameters_and_errors
+            self.assertEqual(results['N3:loglikelihood'], [-8.])
+            for N in skipped:
+                self.assertTrue(np.isnan(results[f'N{N}:loglikelihood'][0]))
+
+    def test_early_stopping_shared_results(self):
+        # one results dict for two spectra (e.g. a Mantid loop),
+        # that stop after a different number of features
+        x, y, e = gen_model_selection_data()
+        results, errors = {}, {}
+        for N_drops in [1, 2]:
+            workflow = SimpleWorkflow(results, errors)
+            workflow.preprocess_data(x, y, e)
+            workflow.set_scipy_engine([0], [-9], [9])
+            workflow.enable_early_stopping(N_drops=N_drops,
+                                           overparameterised=False)
+            func = CompositeFunction()
+            func.add_function(FlatBG())
+            probs = iter([-10., -5., -8., -7., -4.])
+            with mock.patch('quickBayes.workflow.model_selection.template.'
+                            'loglikelihood', side_effect=lambda *args:
+                            next(probs)):
+                _ = workflow.execute(5, func, [0.5])
+            results, errors = workflow.get_parameters_and_errors
+
+        # the same keys as a fit to N5
+        self.assertIn('N5:f2.Amplitude', results.keys())
+        self.assertIn('N5:f2.Amplitude', errors.keys())
+        for values in list(results.values()) + list(errors.values()):
+            self.assertEqual(len(values), 2)
+        # the first spectrum skipped N4 and N5, the second only N5
+        for key in results.keys():
+            if key.startswith('N4:'):
+                self.assertTrue(np.isnan(results[key][0]))
+                self.assertFalse(np.isnan(results[key][1]))
+            elif key.startswith('N5:'):
+                self.assertTrue(np.all(np.isnan(results[key])))
+            else:
+                self.assertFalse(np.any(np.isnan(results[key])))
+        for key in errors.keys():
+            self.assertEqual(np.isnan(errors[key][0]),
+                             np.isnan(results[key][0]))
+
+    def test_early_stopping_overparameterised(self):
+        x, y, e = gen_model_selection_data()
+        self.wf.preprocess_data(x, y, e)
+        self.wf.set_scipy_engine([0], [-9], [9])
+        self.wf.enable_early_stopping()
+        with mock.patch.object(self.wf, '_is_overparameterised',
+                               return_value=True):
+            _ = self.wf.execute(3, self.func, [0.5])
+        self.assertEqual(self.wf.skipped, [2, 3])
+        self.assertEqual(self.wf.fit_engine.N_fits, 1)
+
+    def run_speculative(self, refine):
+        x, y, e = gen_model_selection_data()
+        workflow = SimpleWorkflow({}, {})
+        workflow.preprocess_data(x, y, e)
+        workflow.set_scipy_engine([0], [-9], [9])
+        workflow.enable_profiling()
+        workflow.enable_speculative_fits(N_jobs=2, refine=refine)
+        func = CompositeFunction()
+        func.add_function(FlatBG())
+        with mock.patch('quickBayes.workflow.model_selection.template.'
+                        '_fit_order', wraps=_fit_order) as fit:
+            _ = workflow.execute(3, func, [0.5])
+        self.assertEqual(fit.call_count, 3)
+        return workflow
+
+    def test_speculative_fits(self):
+        x, y, e = gen_model_selection_data()
+        self.wf.preprocess_data(x, y, e)
+        self.wf.set_scipy_engine([0], [-9], [9])
+        _ = self.wf.execute(3, self.func, [0.5])
+        expect, expect_errors = self.wf.get_parameters_and_errors
+
+        workflow = self.run_speculative(False)
+        results, errors = workflow.get_parameters_and_errors
+        # the same layout
+        self.assertEqual(sorted(results.keys()), sorted(expect.keys()))
+        self.assertEqual(sorted(errors.keys()),
+                         sorted(expect_errors.keys()))
+        self.assertEqual(workflow.fit_engine.N_fits, 3)
+        # N1 has the same starting guess
+        for key in expect.keys():
+            if key.startswith('N1:'):
+                self.assertAlmostEqual(results[key][0], expect[key][0], 3)
+
+        report = workflow.profile_report
+        for N in ['N1', 'N2', 'N3']:
+            self.assertEqual(report[N]['optimiser']['calls'], 1)
+            self.assertEqual(report[N]['report']['calls'], 1)
+
+    def test_speculative_fits_refine(self):
+        speculative = self.run_speculative(False).fit_engine
+        refined = self.run_speculative(True)
+        engine = refined.fit_engine
+        self.assertEqual(engine.N_fits, 3)
+        for j in range(3):
+            self.assertLessEqual(engine.get_chi_squared(j),
+                                 speculative.get_chi_squared(j) + 1.e-9)
+        # the refinement is from N=2
+        report = refined.profile_report
+        self.assertNotIn('refine', report['N1'])
+        self.assertEqual(report['N2']['refine']['calls'], 1)
+        self.assertEqual(report['N3']['optimiser']['calls'], 2)
 
 
 if __name__ == '__main__':
@@ -1,5 +1,6 @@
 import unittest
-from quickBayes.workflow.model_selection.muon_decay import muon_expdecay_main
+from quickBayes.workflow.model_selection.muon_decay import (
+    muon_expdecay_main, MuonExpDecay)
 import numpy as np
 import os.path
 
@@ -138,6 +139,41 @@ class MuonExpDecayTest(unittest.TestCase):
         self.assertAlmostEqual(errors['N3:f4.Amplitude'][0], 0.03, 2)
         self.assertAlmostEqual(errors['N3:f4.lambda'][0], 0.09, 2)
 
+    def test_speculative(self):
+        sx, sy, se = np.loadtxt(os.path.join(DATA_DIR, 'muon_expdecay_2.npy'))
+        sample = {'x': sx, 'y': sy, 'e': se}
+
+        expect, _, _, _, _ = muon_expdecay_main(sample, "flat", 0.16, 15,
+                                                {}, {})
+        (results, errors,
+         new_x, fits, f_errors) = muon_expdecay_main(sample, "flat",
+                                                     0.16, 15, {}, {},
+                                                     speculative={
+                                                         'N_jobs': 2,
+                                                         'refine': True})
+        self.assertEqual(sorted(results.keys()), sorted(expect.keys()))
+        self.assertEqual(len(fits), 4)
+        # the most likely is the same
+        for N in [1, 2]:
+            self.assertAlmostEqual(results[f'N{N}:loglikelihood'][0],
+                                   expect[f'N{N}:loglikelihood'][0], 1)
+
+    def test_residual_guesses(self):
+        x = np.linspace(0.1, 15, 600)
+        workflow = MuonExpDecay({}, {})
+        guesses = workflow._residual_guesses(None, x, 0.3*np.exp(-2.*x))
+        self.assertEqual(len(guesses), 3)
+        amplitude, rate = guesses[0]
+        self.assertAlmostEqual(amplitude, 0.3, 1)
+        self.assertAlmostEqual(rate, 2., 0)
+        # all of the candidates have the same starting value
+        for amplitude, rate in guesses:
+            self.assertAlmostEqual(amplitude*np.exp(-rate*x[0]),
+                                   guesses[0][0]*np.exp(-guesses[0][1]*x[0]))
+
+        self.assertEqual(workflow._residual_guesses(None, x,
+                                                    -np.ones(600)), [])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -2,6 +2,7 @@ import unittest
 from quickBayes.workflow.model_selection.QlData import ql_data_main, QLData
 from quickBayes.functions.qldata_function import QlDataFunction
 from quickBayes.functions.BG import LinearBG
+from quickBayes.functions.lorentz import Lorentzian
 import numpy as np
 import os.path
 
@@ -43,6 +44,71 @@ class QlDataTest(unittest.TestCase):
             self.assertEqual(raw['y'][k], sy[k])
             self.assertEqual(raw['e'][k], se[k])
 
+    @staticmethod
+    def ql_function(x, elastic, N_peaks):
+        res = Lorentzian()(x, 1., 0., 0.01)
+        func = QlDataFunction(LinearBG(), elastic, x, res, x[0], x[-1])
+        for _ in range(N_peaks):
+            func.add_single_lorentzian()
+        return func
+
+    def test_residual_guesses(self):
+        x = np.linspace(-1, 1, 401)
+        workflow = QLData({}, {})
+        residuals = Lorentzian()(x, 0.5, 0.2, 0.1)
+        # the peak centre is tied to the elastic peak
+        func = self.ql_function(x, True, 1)
+        guesses = workflow._residual_guesses(func, x, residuals)
+        self.assertEqual(len(guesses), 3)
+        self.assertAlmostEqual(guesses[0][0], 0.5, 1)
+        self.assertAlmostEqual(guesses[0][1], 0.1, 2)
+        self.assertEqual([guess[1] for guess in guesses],
+                         [guesses[0][1]*scale for scale in [1., .5, 2.]])
+
+        self.assertEqual(workflow._residual_guesses(func, x,
+                                                    -np.ones(401)), [])
+
+    def test_residual_guesses_no_elastic(self):
+        x = np.linspace(-1, 1, 401)
+        workflow = QLData({}, {})
+        residuals = Lorentzian()(x, 0.5, 0.2, 0.1)
+        # the first Lorentzian has a peak centre
+        guesses = workflow._residual_guesses(self.ql_function(x, False, 1),
+                                             x, residuals)
+        for guess in guesses:
+            self.assertEqual(len(guess), 3)
+            self.assertAlmostEqual(guess[1], 0.2, 2)
+        self.assertAlmostEqual(guesses[0][0], 0.5, 1)
+        self.assertAlmostEqual(guesses[0][2], 0.1, 2)
+
+        # the second one is tied to the first
+        guesses = workflow._residual_guesses(self.ql_function(x, False, 2),
+                                             x, residuals)
+        self.assertEqual([len(guess) for guess in guesses], [2, 2, 2])
+
+    def test_seeding_no_elastic(self):
+        x = np.linspace(-1, 1, 401)
+        func = self.ql_function(x, False, 0)
+        y = (func(x, 0., 0.) +
+             np.convolve(Lorentzian()(x, 0.5, 0.2, 0.1),
+                         Lorentzian()(x, 1., 0., 0.01),
+                         mode='same')*(x[1] - x[0]))
+        workflow = QLData({}, {})
+        workflow.preprocess_data(x, y, 0.01*np.ones(len(x)), -1., 1.,
+                                 {'x': x, 'y': Lorentzian()(x, 1., 0.,
+                                                            0.01)})
+        workflow.enable_seeding()
+
+        params = [0., 0.]
+        residuals = workflow._get_residuals(func, params)
+        func = workflow.update_function(func, 1)
+        candidates = workflow._get_candidates(func, params, residuals, 2)
+        # BG, amplitude, peak centre and FWHM
+        amplitude, centre, FWHM = candidates[0][2:]
+        self.assertAlmostEqual(amplitude, 0.5, 1)
+        self.assertAlmostEqual(centre, 0.2, 1)
+        self.assertGreater(FWHM, 0.05)
+
     def test_one(self):
         sx, sy, se = np.load(os.path.join(DATA_DIR, 'sample_data_red.npy'))
         rx, ry, re = np.load(os.path.join(DATA_DIR, 'resolution_data_red.npy'))